@@ -15,12 +15,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import os
+import time
 
 import flask
 from flask_json import json_response, FlaskJSON, JsonError
 
 import aspect
-from discover import file_with_datasets_substitution, unchanged_file, find_analysis_results
+import jobs
+import metrics
+from discover import preload, with_datasets_substitution, \
+    find_analysis_results, analysis_index, catalog
+from discover.datasets import Document
 
 app = flask.Flask(__name__)
 json = FlaskJSON(app)
@@ -28,32 +33,105 @@ app.config['JSON_ADD_STATUS'] = False
 app.config['JSON_USE_ENCODE_METHODS'] = True
 
 
+SCHEMAS = preload(os.path.join('.', 'schema'))
+LAYOUTS = preload(os.path.join('.', 'layout'))
+
+
+@app.before_request
+def start_timer():
+    """Count request as in flight and note when it started"""
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    flask.g.started = time.perf_counter()
+
+
+def _observe_latency(status: int):
+    rule = flask.request.url_rule
+    metrics.REQUEST_DURATION.observe(
+        time.perf_counter() - flask.g.started,
+        route=rule.rule if rule is not None else 'unmatched',
+        method=flask.request.method, status=str(status))
+    flask.g.observed = True
+
+
+@app.after_request
+def observe_response(response: flask.Response) -> flask.Response:
+    """Record latency of request by route, method and status"""
+    _observe_latency(response.status_code)
+    return response
+
+
+@app.teardown_request
+def finish_request(error=None):
+    """Record latency of failed request and count it out of flight"""
+    if 'started' not in flask.g:
+        return
+    if not flask.g.get('observed', False):
+        _observe_latency(500)
+    metrics.REQUESTS_IN_FLIGHT.dec()
+
+
+@app.route('/metrics')
+def exposed_metrics():
+    """Get operational metrics in Prometheus text format"""
+    return flask.Response(metrics.REGISTRY.render(),
+                          content_type=metrics.CONTENT_TYPE)
+
+
+def conditional_response(document: Document) -> flask.Response:
+    """Respond with the document or 304, if client has it already"""
+    if document.etag in flask.request.if_none_match:
+        response = flask.Response(status=304)
+    else:
+        response = flask.Response(document.content,
+                                  mimetype='application/json')
+    response.set_etag(document.etag)
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/schema/<string:endpoint>/<string:task_name>/')
 def schema(endpoint: str, task_name: str):
     """Get static schema description"""
     path = os.path.join('.', 'schema', endpoint, task_name + '.json')
-    try:
-        return unchanged_file(path), 200
-    except FileNotFoundError:
+    if path not in SCHEMAS:
         raise JsonError(description='Unknown task: ' + task_name, status_=404)
+    return conditional_response(SCHEMAS[path])
 
 
 @app.route('/layout/<string:endpoint>/<string:task_name>/')
 def layout(endpoint: str, task_name: str):
     """Get dynamic layout description"""
     path = os.path.join('.', 'layout', endpoint, task_name + '.json')
-    try:
-        return file_with_datasets_substitution(path), 200
-    except FileNotFoundError:
+    if path not in LAYOUTS:
         raise JsonError(description='Unknown task: ' + task_name, status_=404)
-
+    return conditional_response(with_datasets_substitution(LAYOUTS[path]))
 
 
 @app.route('/results/<string:task_name>/')
 def results(task_name: str):
-    "Get list of available results"
-    return json_response([result._asdict() for result in
-                          find_analysis_results(task_name)])
+    """Get list of available results
+
+    If any of catalog query arguments is specified (see
+    discover.catalog.parse_query), results are filtered, sorted and paginated
+    on the server side. Total number of matching results is then returned in
+    X-Total-Count header.
+    """
+    arguments = flask.request.args
+    if not catalog.is_query(arguments):
+        return json_response(data_=[result._asdict() for result in
+                                    find_analysis_results(task_name)])
+    try:
+        query = catalog.parse_query(arguments)
+    except ValueError as ex:
+        raise JsonError(description=str(ex), status_=400)
+    try:
+        index = analysis_index(task_name)
+    except KeyError:
+        raise JsonError(description='Unknown task: ' + task_name, status_=404)
+    catalog.synchronize(index)
+    total, entries = catalog.query_results(task_name, query)
+    return json_response(data_=[entry._asdict() for entry in entries],
+                         headers_={'X-Total-Count': str(total)})
 
 
 @app.route('/results/<string:task_name>/<string:analysis_id>/<string:aspect_name>/', methods=['POST'])
@@ -63,4 +141,19 @@ def analysis_aspect(task_name: str, analysis_id: str, aspect_name: str):
         aspect_builder = getattr(aspect, aspect_name)
     except AttributeError:
         raise JsonError(description="Unknown aspect: " + aspect_name, status_=404)
-    return json_response(aspect_builder(analysis_id))
+    result = aspect_builder(analysis_id)
+    if isinstance(result, flask.Response):  # aspect negotiated own format
+        response = result
+    else:
+        response = json_response(data_=result)
+    response.vary.add('Accept')
+    if not response.is_streamed:
+        metrics.ASPECT_PAYLOAD.observe(len(response.get_data()),
+                                       aspect=aspect_name)
+    return response
+
+
+@app.route('/jobs/<string:job_id>/')
+def job_status(job_id: str):
+    """Get state of background job with its result or error"""
+    return json_response(data_=jobs.status(job_id))
@@ -0,0 +1,221 @@
+"""Storage of analysis results
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from contextlib import contextmanager
+import os
+import tempfile
+import zipfile
+from typing import NamedTuple, Optional
+
+import numpy as np
+from sklearn.externals import joblib
+
+import spdata.types as ty
+
+from embedding.optimizer import State
+from embedding.reduction import Projection
+import metrics
+
+
+EMBEDDING = 'result.npy'
+METADATA = 'metadata.npz'
+LEGACY_EMBEDDING = 'result.pkl'
+PROJECTION = 'projection.npz'
+FEATURES = 'features.npy'
+CHECKPOINT = 'checkpoint.npz'
+CHECKPOINT_KEY = 'checkpoint.key'
+
+
+Metadata = NamedTuple('Metadata', [
+    ('coordinates', ty.Coordinates),
+    ('labels', Optional[np.ndarray])
+])
+
+
+@contextmanager
+def replacing(path: str):
+    """Unique temporary path, which replaces the path when complete
+
+    Readers find either no file or a complete one, even if the writer dies
+    or other one writes the same file concurrently.
+    """
+    directory, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix=stem + '.',
+                                         suffix='.tmp' + extension)
+    os.close(handle)
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def save_embedding(root: str, embedding: np.ndarray):
+    """Store embedding in memory-mappable format"""
+    with replacing(os.path.join(root, EMBEDDING)) as path:
+        np.save(path, np.ascontiguousarray(embedding))
+
+
+@metrics.timed(metrics.ARTIFACT_LOADING_DURATION, artifact='embedding')
+def load_embedding(root: str) -> np.ndarray:
+    """Load read-only embedding stored in analysis directory
+
+    Embedding is memory-mapped, if possible. Results of analyses stored
+    before the binary format was introduced are unpickled.
+    """
+    path = os.path.join(root, EMBEDDING)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    return joblib.load(os.path.join(root, LEGACY_EMBEDDING))
+
+
+def _as_array(values) -> np.ndarray:
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+
+def save_metadata(root: str, coordinates: ty.Coordinates, labels=None,
+                  fingerprint: Optional[str]=None):
+    """Store coordinates, labels and fingerprint of embedded observations
+
+    Together with the embedding it suffices to rebuild the transformed
+    dataset, so the analyzed dataset is never read again.
+    """
+    arrays = {
+        'x': _as_array(coordinates.x),
+        'y': _as_array(coordinates.y),
+        'z': _as_array(coordinates.z),
+    }
+    if labels is not None:
+        arrays['labels'] = _as_array(labels)
+    if fingerprint is not None:
+        arrays['fingerprint'] = np.array(fingerprint)
+    with replacing(os.path.join(root, METADATA)) as path:
+        np.savez(path, **arrays)
+
+
+@metrics.timed(metrics.ARTIFACT_LOADING_DURATION, artifact='metadata')
+def load_metadata(root: str) -> Optional[Metadata]:
+    """Load coordinates and labels of embedded observations, if stored"""
+    path = os.path.join(root, METADATA)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        coordinates = ty.Coordinates(arrays['x'], arrays['y'], arrays['z'])
+        labels = arrays['labels'] if 'labels' in arrays else None
+    return Metadata(coordinates=coordinates, labels=labels)
+
+
+def load_fingerprint(root: str) -> Optional[str]:
+    """Load fingerprint of the analyzed spectra, if stored"""
+    path = os.path.join(root, METADATA)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        if 'fingerprint' not in arrays:
+            return None
+        return str(arrays['fingerprint'])
+
+
+def save_projection(root: str, projection: Projection):
+    """Store principal components spectra were reduced with"""
+    np.savez(os.path.join(root, PROJECTION), **projection._asdict())
+
+
+@metrics.timed(metrics.ARTIFACT_LOADING_DURATION, artifact='projection')
+def load_projection(root: str) -> Optional[Projection]:
+    """Load principal components spectra were reduced with, if stored"""
+    path = os.path.join(root, PROJECTION)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        return Projection(**{field: arrays[field]
+                             for field in Projection._fields})
+
+
+def save_features(root: str, features: np.ndarray):
+    """Store reduced spectra the embedding was computed for"""
+    np.save(os.path.join(root, FEATURES), np.ascontiguousarray(features))
+
+
+@metrics.timed(metrics.ARTIFACT_LOADING_DURATION, artifact='features')
+def load_features(root: str) -> Optional[np.ndarray]:
+    """Load memory-mapped reduced spectra, if stored"""
+    path = os.path.join(root, FEATURES)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+
+def save_checkpoint(root: str, state: State, key: str):
+    """Atomically replace checkpoint of optimization identified by key"""
+    path = os.path.join(root, CHECKPOINT)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as checkpoint:
+        np.savez(checkpoint, key=key, **state._asdict())
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(root: str, key: str) -> Optional[State]:
+    """Load checkpoint of optimization, if stored for the same key"""
+    try:
+        with np.load(os.path.join(root, CHECKPOINT)) as arrays:
+            if str(arrays['key']) != key:
+                return None
+            return State(
+                embedding=arrays['embedding'], update=arrays['update'],
+                gains=arrays['gains'], iteration=int(arrays['iteration']),
+                best_error=float(arrays['best_error']),
+                best_iteration=int(arrays['best_iteration']))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def save_checkpoint_key(root: str, key: str):
+    """Mark the root as owned by optimization identified by key"""
+    with replacing(os.path.join(root, CHECKPOINT_KEY)) as path:
+        with open(path, 'w') as file:
+            file.write(key)
+
+
+def checkpoint_key(root: str) -> Optional[str]:
+    """Key of optimization owning or checkpointed in the root, if any"""
+    try:
+        with open(os.path.join(root, CHECKPOINT_KEY)) as file:
+            return file.read()
+    except OSError:
+        pass
+    try:
+        with np.load(os.path.join(root, CHECKPOINT)) as arrays:
+            return str(arrays['key'])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def remove_checkpoint(root: str):
+    """Remove checkpoint and key of finished optimization"""
+    for name in (CHECKPOINT, CHECKPOINT_KEY):
+        try:
+            os.remove(os.path.join(root, name))
+        except FileNotFoundError:
+            pass
+
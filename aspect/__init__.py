@@ -1,2 +1,3 @@
 from ._visualization import visualization
 from ._export import export
+from ._transform import transform
@@ -15,29 +15,26 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from functools import partial
+import json
 import os
-from typing import NamedTuple, Optional
+import shutil
+from typing import Optional
 
-import numpy as np
-from sklearn.externals import joblib
-
-from spdata.reader import load_dataset
-import spdata.types as ty
+from flask_json import JsonError, json_response
+import spdata.common as cmn
 
+import artifacts
+from artifacts import Metadata
 import common
 import data_utils
+from data_utils import load_dataset
 import discover.analyses as da
+import jobs
 
 
 find_root = partial(da.find_analysis_by_id, 'tSNE')
 
 
-Metadata = NamedTuple('Metadata', [
-    ('coordinates', ty.Coordinates),
-    ('labels', Optional[np.ndarray])
-])
-
-
 def dataset_name(root: str) -> str:
     """Find name of analyzed dataset"""
     split = os.path.split
@@ -45,20 +42,31 @@ def dataset_name(root: str) -> str:
 
 
 def get_metadata(root: str) -> Metadata:
-    """Get metadata of analyzed dataset"""
+    """Get metadata of analyzed dataset
+
+    Metadata is stored with the analysis. Analyses predating that read it
+    from the analyzed dataset once, and it is stored with them afterwards.
+    """
+    stored = artifacts.load_metadata(root)
+    if stored is not None:
+        return stored
     name = dataset_name(root)
     dataset = load_dataset(name)
+    artifacts.save_metadata(root, dataset.coordinates, dataset.labels)
     return Metadata(coordinates=dataset.coordinates, labels=dataset.labels)
 
 
 def regenerate_dataset(dataset_path: str, analysis_root: str):
-    """Regenerate file with transformed dataset"""
-    transformed_path = os.path.join(analysis_root, 'result.pkl')
-    result = joblib.load(transformed_path)
+    """Regenerate file with transformed dataset
+
+    File is replaced when complete, so an existing one is never partial.
+    """
+    result = artifacts.load_embedding(analysis_root)
     metadata = get_metadata(analysis_root)
     dataset = data_utils.as_normalized(result, metadata.coordinates,
                                        metadata.labels)
-    data_utils.dumps_txt(dataset_path, dataset)
+    with artifacts.replacing(dataset_path) as path:
+        data_utils.dumps_txt(path, dataset)
 
 
 def ensure_dataset(root: str) -> str:
@@ -69,20 +77,121 @@ def ensure_dataset(root: str) -> str:
     return dataset_path
 
 
-EMPTY_TABLE = {"columns": [], "data": []}
+def ensure_binary(root: str) -> str:
+    """Return a path to an existing memory-mappable transformed dataset"""
+    embedding_path = os.path.join(root, artifacts.EMBEDDING)
+    if not os.path.exists(embedding_path):
+        artifacts.save_embedding(root, artifacts.load_embedding(root))
+    get_metadata(root)
+    return embedding_path
+
+
+EXPORT_TASK = 'modelling.tSNE_export'
+EXPORT_MARKER = '.export.json'
+FORMATS = 'txt', 'npy'
+
+
+def _published_path(target_name: str, dataset_format: str) -> str:
+    if dataset_format == 'txt':
+        return os.path.join(cmn.DATA_ROOT, target_name, data_utils.TEXT_DATA,
+                            'data.txt')
+    return os.path.join(cmn.DATA_ROOT, target_name, data_utils.BINARY_DATA,
+                        data_utils.BINARY_SPECTRA)
+
+
+def claimant(target_name: str) -> Optional[str]:
+    """Id of export job which claimed the dataset name, if any"""
+    try:
+        with open(os.path.join(cmn.DATA_ROOT, target_name,
+                               EXPORT_MARKER)) as marker:
+            return json.load(marker)['job_id']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def taken(target_name: str, job: str) -> bool:
+    """Whether the dataset name is used by anything but the export job
+
+    Empty directory holds no dataset, so it is not considered taken.
+    """
+    try:
+        entries = os.listdir(os.path.join(cmn.DATA_ROOT, target_name))
+    except FileNotFoundError:
+        return False
+    return bool(entries) and claimant(target_name) != job
+
+
+def _claim(target_name: str, job: str):
+    """Atomically create dataset directory holding marker of the job"""
+    claim = os.path.join(cmn.DATA_ROOT, '.%s.%s.tmp' % (target_name, job))
+    os.makedirs(claim, exist_ok=True)
+    with open(os.path.join(claim, EXPORT_MARKER), 'w') as marker:
+        json.dump({'job_id': job}, marker)
+    try:
+        # replaces empty directory only
+        os.rename(claim, os.path.join(cmn.DATA_ROOT, target_name))
+    except OSError:
+        shutil.rmtree(claim, ignore_errors=True)
+        raise ValueError('Dataset %s already exists' % target_name)
+
+
+def publish(analysis_root: str, target_name: str, dataset_format: str,
+            job: str):
+    """Push transformed dataset to the data store once per export job
+
+    Dataset name is claimed with a marker holding the job id before the
+    dataset is pushed. Repeated job finds its own claim and completes
+    interrupted push or does nothing. Datasets not claimed by the job are
+    never modified.
+    """
+    if taken(target_name, job):
+        raise ValueError('Dataset %s already exists' % target_name)
+    if claimant(target_name) == job:
+        if os.path.exists(_published_path(target_name, dataset_format)):
+            return
+        target_root = os.path.join(cmn.DATA_ROOT, target_name)
+        for layout in (data_utils.TEXT_DATA, data_utils.BINARY_DATA):
+            shutil.rmtree(os.path.join(target_root, layout),
+                          ignore_errors=True)
+    else:
+        _claim(target_name, job)
+    if dataset_format == 'txt':
+        dataset_path = ensure_dataset(analysis_root)
+    else:
+        dataset_path = ensure_binary(analysis_root)
+    data_utils.push_to_repo(dataset_path, target_name)
 
 
 def export(analysis_id: str):
-    """Export transformed dataset to a common data store
+    """Export transformed dataset to a common data store in background
+
+    Responds with 202 Accepted and a table with id of export job and URL
+    of its status, /jobs/<job_id>/. The same export requested again refers
+    to the same job, which is not repeated unless it failed.
 
     Arguments:
         analysis_id (str): ID of transform to use
 
     Implicit arguments (should be provided in JSON request):
         target_name (str): name of the dataset created in common data store
+        format (str, optional): txt (default) for text dataset readable by
+            all the workers or npy for binary dataset, published instantly
     """
-    analysis_root = find_root(analysis_id)
+    find_root(analysis_id)
     target_name = common.require_post_variable('target_name')
-    dataset_path = ensure_dataset(analysis_root)
-    data_utils.push_to_repo(dataset_path, target_name)
-    return EMPTY_TABLE
+    dataset_format = common.optional_post_variable('format', 'txt')
+    if dataset_format not in FORMATS:
+        raise JsonError(description='Unknown format: %s' % dataset_format,
+                        status_=400)
+    arguments = {'analysis_id': analysis_id, 'target_name': target_name,
+                 'dataset_format': dataset_format}
+    job = jobs.job_id(EXPORT_TASK, **arguments)
+    if taken(target_name, job):
+        raise JsonError(description='Dataset %s already exists'
+                        % target_name, status_=409)
+    jobs.submit(EXPORT_TASK, **arguments)
+    status_url = jobs.STATUS_URL % job
+    return json_response(status_=202, data_={
+        'columns': ['job_id', 'status'],
+        'data': [[job, status_url]],
+    }, headers_={'Location': status_url})
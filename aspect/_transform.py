@@ -0,0 +1,81 @@
+"""Out-of-sample transform aspect of t-SNE analysis
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from functools import partial
+import os
+
+import flask
+from flask_json import JsonError
+import numpy as np
+
+import common
+from data_utils import load_dataset
+import discover.analyses as da
+from discover.datasets import cached_datasets
+from plotting import as_scatter_plot, Plot, PLOT_BASE64, PLOT_BINARY, \
+    PLOT_JSON
+import references
+
+
+find_root = partial(da.find_analysis_by_id, 'tSNE')
+
+
+def _dataset_name() -> str:
+    """Name of a dataset in the data store, taken from the request"""
+    name = common.require_post_variable('dataset_name')
+    if not isinstance(name, str) or name in ('', os.curdir, os.pardir) \
+            or os.path.basename(name) != name \
+            or (os.altsep is not None and os.altsep in name):
+        raise JsonError(description='Invalid dataset name: %s' % name,
+                        status_=400)
+    if name not in {dataset['value'] for dataset in cached_datasets()}:
+        raise JsonError(description='Unknown dataset: %s' % name,
+                        status_=404)
+    return name
+
+
+def transform(analysis_id: str):
+    """Scatter plot of embedding with spectra of another dataset placed in
+
+    New spectra are placed at the weighted mean of positions of their
+    nearest reference spectra. Use modelling.tSNE_transform task to store
+    the result or to refine it with optimization. Encoding of the response
+    is negotiated as in visualization aspect.
+
+    Implicit arguments (should be provided in JSON request):
+        dataset_name (str): name of dataset with spectra to place
+    """
+    encoding = common.negotiate([PLOT_JSON, PLOT_BASE64, PLOT_BINARY])
+    analysis_root = find_root(analysis_id)
+    name = _dataset_name()
+    try:
+        reference = references.load_reference(analysis_root)
+        placed = references.place(reference, load_dataset(name).spectra)
+    except ValueError as ex:
+        raise JsonError(description=str(ex), status_=400)
+    compact = encoding != PLOT_JSON
+    traces = []
+    for trace_name, points in (('reference', reference.embedding),
+                               (name, placed)):
+        trace, = as_scatter_plot(np.asarray(points), compact).data
+        trace.name = trace_name
+        traces.append(trace)
+    plot = Plot(traces)
+    if encoding == PLOT_BASE64:
+        return flask.Response(plot.to_json(), mimetype=PLOT_BASE64)
+    if encoding == PLOT_BINARY:
+        return flask.Response(plot.to_binary(), mimetype=PLOT_BINARY)
+    return plot
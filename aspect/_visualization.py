@@ -16,20 +16,81 @@ limitations under the License.
 """
 
 from functools import partial
-import os
+from numbers import Number
+from typing import Optional, Tuple
 
-from sklearn.externals import joblib
+import flask
+from flask_json import JsonError
 
+import artifacts
+import common
+import decimation
 import discover.analyses as da
-from plotting import as_scatter_plot
+from plotting import as_scatter_plot, PLOT_BASE64, PLOT_BINARY, PLOT_JSON
 
 
 find_root = partial(da.find_analysis_by_id, 'tSNE')
 
 
+AXES = 'x', 'y', 'z'
+_UNBOUNDED = -float('inf'), float('inf')
+
+
+def _bounds(viewport: dict, axis: str) -> Tuple[float, float]:
+    bounds = viewport.get(axis, _UNBOUNDED)
+    if len(bounds) != 2 or not all(isinstance(v, Number) for v in bounds):
+        raise JsonError(description='Viewport bounds of %s should be '
+                                    '[min, max]' % axis, status_=400)
+    return tuple(bounds)
+
+
+def level_of_detail(dimensions: int) -> Tuple[Optional[int], Optional[list]]:
+    """Point budget and viewport requested by the client"""
+    budget = common.optional_post_variable('point_budget')
+    if budget is not None and (not isinstance(budget, int) or budget < 1):
+        raise JsonError(description='point_budget should be a positive '
+                                    'integer', status_=400)
+    viewport = common.optional_post_variable('viewport')
+    if viewport is not None:
+        if not isinstance(viewport, dict):
+            raise JsonError(description='viewport should be an object',
+                            status_=400)
+        viewport = [_bounds(viewport, axis) for axis in AXES[:dimensions]]
+    return budget, viewport
+
+
 def visualization(analysis_id: str):
+    """Scatter plot of embedding
+
+    Format of the response depends on Accept header. Plain JSON plot is
+    returned by default. PLOT_BASE64 carries coordinates as base64-encoded
+    float32 typed arrays in JSON. PLOT_BINARY carries them as raw buffers
+    following JSON header (see plotting.to_binary).
+
+    Implicit arguments (may be provided in JSON request):
+        point_budget (int): maximal number of plotted points
+        viewport (dict): plotted area, {"x": [min, max], "y": [min, max]}
+            with optional "z"; missing axes are unbounded
+
+    If any of them is present, a uniform sample of points in the viewport is
+    plotted, and layout.meta holds number of points shown and estimated
+    number of points in the viewport.
+    """
+    encoding = common.negotiate([PLOT_JSON, PLOT_BASE64, PLOT_BINARY])
     analysis_root = find_root(analysis_id)
-    result_path = os.path.join(analysis_root, 'result.pkl')
-    result = joblib.load(result_path)
-    plot = as_scatter_plot(result)
+    result = artifacts.load_embedding(analysis_root)
+    budget, viewport = level_of_detail(result.shape[1])
+    meta = None
+    if budget is not None or viewport is not None:
+        index = decimation.ensure_index(analysis_root, result)
+        selected, total = index.query(result, budget, viewport)
+        result = result[selected]
+        meta = {"points_shown": len(selected), "points_total": total}
+    plot = as_scatter_plot(result, compact=encoding != PLOT_JSON)
+    if meta is not None:
+        plot.layout["meta"] = meta
+    if encoding == PLOT_BASE64:
+        return flask.Response(plot.to_json(), mimetype=PLOT_BASE64)
+    if encoding == PLOT_BINARY:
+        return flask.Response(plot.to_binary(), mimetype=PLOT_BINARY)
     return plot
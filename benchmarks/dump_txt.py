@@ -0,0 +1,101 @@
+"""Throughput of text dataset export
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Usage:
+    python -m benchmarks.dump_txt [--rows N] [--mz D] [--precision P]
+"""
+import argparse
+from itertools import cycle
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import spdata.types as ty
+
+import data_utils
+
+
+def per_element_dump_txt(file, data: ty.Dataset):
+    """Reference implementation formatting each value separately"""
+    coordinates = data.coordinates
+    labels = data.labels if data.labels is not None else cycle([0])
+    metadata = zip(coordinates.x, coordinates.y, coordinates.z, labels)
+    file.write("\n")
+    file.write("%s\n" % " ".join(map(str, data.mz)))
+    for spectrum, metadata in zip(data.spectra, metadata):
+        file.write("%s\n" % " ".join(map(str, metadata)))
+        file.write("%s\n" % " ".join(map(str, spectrum)))
+
+
+def synthetic_dataset(rows: int, mz: int, seed: int=0) -> ty.Dataset:
+    """Dataset of random spectra placed on a square grid"""
+    random = np.random.RandomState(seed)
+    spectra = random.gamma(2., 100., size=(rows, mz))
+    side = int(np.ceil(np.sqrt(rows)))
+    positions = np.arange(rows)
+    coordinates = ty.Coordinates(positions % side, positions // side,
+                                 np.zeros(rows, dtype=int))
+    return ty.Dataset(spectra, coordinates, np.arange(mz), None)
+
+
+def measure(writer, dataset: ty.Dataset, **kwargs) -> dict:
+    """Time single dump of the dataset to a temporary file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.txt')
+        started = time.perf_counter()
+        with open(path, 'w') as file:
+            writer(file, dataset, **kwargs)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(path)
+    return {
+        'seconds': elapsed,
+        'megabytes_per_second': size / elapsed / 2 ** 20,
+        'rows_per_second': dataset.spectra.shape[0] / elapsed,
+    }
+
+
+def run(rows: int=2000, mz: int=1000, precision: int=None) -> dict:
+    """Compare per-element and block formatting"""
+    dataset = synthetic_dataset(rows, mz)
+    reference = measure(per_element_dump_txt, dataset)
+    vectorized = measure(data_utils.dump_txt, dataset, precision=precision)
+    return {
+        'rows': rows,
+        'mz': mz,
+        'precision': precision,
+        'per_element': reference,
+        'vectorized': vectorized,
+        'speedup': reference['seconds'] / vectorized['seconds'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--mz', type=int, default=1000)
+    parser.add_argument('--precision', type=int, default=None)
+    arguments = parser.parse_args()
+    result = run(arguments.rows, arguments.mz, arguments.precision)
+    for name in ('per_element', 'vectorized'):
+        print('{0:>12}: {seconds:8.3f} s {megabytes_per_second:8.2f} MB/s '
+              '{rows_per_second:10.1f} rows/s'.format(name, **result[name]))
+    print('     speedup: {0:8.2f}x'.format(result['speedup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Speed and quality of t-SNE engines
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Usage:
+    python -m benchmarks.engines [--rows N] [--features D] [--components C]
+        [--methods barnes_hut fft] [--n-iter I]
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from embedding import create_engine
+
+
+def clustered_data(rows: int, features: int, clusters: int=10,
+                   seed: int=0) -> np.ndarray:
+    """Gaussian blobs with random centers"""
+    random = np.random.RandomState(seed)
+    centers = random.randn(clusters, features) * 10
+    labels = random.randint(clusters, size=rows)
+    return centers[labels] + random.randn(rows, features)
+
+
+def neighbourhood_preservation(data: np.ndarray, embedding: np.ndarray,
+                               k: int=10) -> float:
+    """Mean fraction of k nearest neighbours preserved in the embedding"""
+    def neighbours(points):
+        knn = NearestNeighbors(n_neighbors=k).fit(points)
+        return knn.kneighbors(None, return_distance=False)
+    original, embedded = neighbours(data), neighbours(embedding)
+    return float(np.mean([np.intersect1d(first, second).size / k
+                          for first, second in zip(original, embedded)]))
+
+
+def measure(method: str, data: np.ndarray, **kwargs) -> dict:
+    """Time single embedding and rate its quality"""
+    engine = create_engine(method, random_state=0, **kwargs)
+    started = time.perf_counter()
+    embedding = engine.fit_transform(data)
+    elapsed = time.perf_counter() - started
+    return {
+        'seconds': elapsed,
+        'kl_divergence': float(engine.kl_divergence_),
+        'neighbourhood_preservation': neighbourhood_preservation(data,
+                                                                 embedding),
+    }
+
+
+def run(rows: int=5000, features: int=50, n_components: int=2,
+        methods=('barnes_hut', 'fft'), n_iter: int=1000) -> dict:
+    """Embed the same synthetic data with each method"""
+    data = clustered_data(rows, features)
+    return {
+        'rows': rows,
+        'features': features,
+        'n_components': n_components,
+        'methods': {
+            method: measure(method, data, n_components=n_components,
+                            n_iter=n_iter)
+            for method in methods
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--features', type=int, default=50)
+    parser.add_argument('--components', type=int, default=2)
+    parser.add_argument('--methods', nargs='+', default=['barnes_hut', 'fft'])
+    parser.add_argument('--n-iter', type=int, default=1000)
+    arguments = parser.parse_args()
+    result = run(arguments.rows, arguments.features, arguments.components,
+                 arguments.methods, arguments.n_iter)
+    for name, scores in sorted(result['methods'].items()):
+        print('{0:>12}: {seconds:8.3f} s KL {kl_divergence:8.4f} '
+              'kNN preserved {neighbourhood_preservation:6.3f}'.format(
+                  name, **scores))
+
+
+if __name__ == '__main__':
+    main()
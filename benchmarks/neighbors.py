@@ -0,0 +1,77 @@
+"""Speed and recall of nearest neighbours search for input similarities
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Usage:
+    python -m benchmarks.neighbors [--rows N] [--mz D] [--perplexity P]
+        [--trees T [T ...]]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from embedding import affinities
+
+
+def low_rank_spectra(rows: int, mz: int, rank: int=8,
+                     seed: int=0) -> np.ndarray:
+    """Noisy spectra mixed nonlinearly from few latent factors"""
+    random = np.random.RandomState(seed)
+    latent = random.randn(rows, rank)
+    return 100 * np.tanh(latent.dot(random.randn(rank, mz))) \
+        + random.randn(rows, mz)
+
+
+def run(rows: int=20000, mz: int=500, perplexity: float=30.,
+        trees=(1, 5, 10, 20)) -> dict:
+    """Time exact search and approximate search with each number of trees"""
+    data = low_rank_spectra(rows, mz)
+    started = time.perf_counter()
+    affinities.affinity_stage(data, perplexity)
+    exact = time.perf_counter() - started
+    approximate = {}
+    for n_trees in trees:
+        _, report = affinities.affinity_stage(
+            data, perplexity, neighbors=affinities.APPROXIMATE,
+            n_trees=n_trees, random_state=0)
+        approximate[n_trees] = report._asdict()
+    return {
+        'rows': rows,
+        'mz': mz,
+        'perplexity': perplexity,
+        'exact_seconds': exact,
+        'approximate': approximate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--mz', type=int, default=500)
+    parser.add_argument('--perplexity', type=float, default=30.)
+    parser.add_argument('--trees', type=int, nargs='+',
+                        default=[1, 5, 10, 20])
+    arguments = parser.parse_args()
+    result = run(arguments.rows, arguments.mz, arguments.perplexity,
+                 arguments.trees)
+    print('       exact: {0:8.3f} s'.format(result['exact_seconds']))
+    for n_trees, report in sorted(result['approximate'].items()):
+        print('{0:>6} trees: {seconds:8.3f} s recall {recall:6.3f}'.format(
+            n_trees, **report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Scaling of t-SNE gradient computation with number of threads
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Measures time per iteration of the FFT-accelerated gradient descent for
+a fixed number of iterations. Thread counts above the CPUs available to
+the process are capped, and the effective count is reported. Barnes-Hut
+descent of scikit-learn, which runs in a single thread, is the baseline.
+
+Usage:
+    python -m benchmarks.scaling [--rows N] [--components C]
+        [--n-jobs 1 2 4 8 16] [--n-iter I]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.engines import clustered_data
+from embedding import affinities, engines, optimizer, parallel
+
+
+def measure(P, n_components: int, n_jobs: int, n_iter: int) -> dict:
+    """Time gradient descent in given number of threads"""
+    Y = np.random.RandomState(0).randn(P.shape[0], n_components) * 1e-4
+    started = time.perf_counter()
+    optimizer.gradient_descent(P, Y, n_iter, n_iter_without_progress=n_iter,
+                               min_grad_norm=0., n_jobs=n_jobs)
+    elapsed = time.perf_counter() - started
+    return {
+        'threads': parallel.effective_n_jobs(n_jobs),
+        'seconds': elapsed,
+        'seconds_per_iteration': elapsed / n_iter,
+    }
+
+
+def measure_barnes_hut(P, n_components: int, n_iter: int) -> dict:
+    """Time Barnes-Hut gradient descent of scikit-learn"""
+    engine = engines.SklearnTSNE(
+        n_components=n_components, n_iter=n_iter,
+        n_iter_without_progress=n_iter, min_grad_norm=0., random_state=0)
+    data = np.zeros((P.shape[0], 1))
+    started = time.perf_counter()
+    engine.fit_transform(data, affinities=P)
+    elapsed = time.perf_counter() - started
+    return {
+        'seconds': elapsed,
+        'seconds_per_iteration': elapsed / n_iter,
+    }
+
+
+def run(rows: int=50000, n_components: int=2, n_jobs=(1, 2, 4, 8, 16),
+        n_iter: int=100) -> dict:
+    """Optimize the same embedding with each number of threads"""
+    data = clustered_data(rows, 50)
+    P = affinities.affinities(data, 30.)
+    results = {jobs: measure(P, n_components, jobs, n_iter)
+               for jobs in n_jobs}
+    baseline = results[min(n_jobs)]['seconds']
+    for result in results.values():
+        result['speedup'] = baseline / result['seconds']
+    return {
+        'rows': rows,
+        'n_components': n_components,
+        'available_cpus': parallel.available_cpus(),
+        'barnes_hut': measure_barnes_hut(P, n_components, n_iter),
+        'n_jobs': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--components', type=int, default=2)
+    parser.add_argument('--n-jobs', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--n-iter', type=int, default=100)
+    arguments = parser.parse_args()
+    result = run(arguments.rows, arguments.components, arguments.n_jobs,
+                 arguments.n_iter)
+    print('available CPUs: %i' % result['available_cpus'])
+    print('Barnes-Hut (1 thread): {seconds:8.3f} s '
+          '{seconds_per_iteration:7.4f} s/iteration'.format(
+              **result['barnes_hut']))
+    for jobs, scores in sorted(result['n_jobs'].items()):
+        print('{0:>4} jobs ({threads:>2} threads): {seconds:8.3f} s '
+              '{seconds_per_iteration:7.4f} s/iteration '
+              'speedup {speedup:5.2f}'.format(jobs, **scores))
+
+
+if __name__ == '__main__':
+    main()
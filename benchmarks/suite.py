@@ -0,0 +1,315 @@
+"""Benchmark suite of the worker's hot paths
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Every benchmark runs against a synthetic data store built in a temporary
+directory, which replaces DATA_ROOT and the working directories of the
+worker for the duration of the run:
+- tSNE task end-to-end, timed per stage, with cold and warm caches,
+- text export of a dataset with data_utils.dump_txt,
+- scatter plot of an embedding serialized with Plot.to_json,
+- find_analysis_by_id with cold and warm index, for each store size,
+- /layout and /results endpoints through Flask test client.
+
+Results are written as JSON along with the commit they were measured at.
+Given results of a previous run, timings slower by more than the threshold
+are reported as regressions.
+
+Usage:
+    python -m benchmarks.suite [--rows N] [--mz D] [--n-iter I]
+        [--analyses 10 1000 10000] [--repeats R] [--output results.json]
+        [--compare previous.json] [--threshold 1.2]
+"""
+import argparse
+from contextlib import contextmanager, ExitStack, redirect_stdout
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+from unittest.mock import patch
+
+import numpy as np
+
+import spdata.common as cmn
+
+from benchmarks.dump_txt import synthetic_dataset
+import data_utils
+import discover.analyses as da
+import discover.datasets as ds
+from discover import catalog
+from embedding import cache
+from plotting import as_scatter_plot
+from spectre_analyses import helpers, tasks
+
+
+ANALYSIS_TYPE = 'tSNE'
+TSNE_DATASET = 'benchmark'
+DATASETS_WITH_ANALYSES = 10
+LOOKUPS = 100
+
+
+def timings(function: Callable[[], object], repeats: int) -> Dict[str, float]:
+    """Best, mean and worst wall time of repeated calls"""
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - started)
+    return {
+        'best': min(seconds),
+        'mean': float(np.mean(seconds)),
+        'worst': max(seconds),
+    }
+
+
+def _list_datasets(data_root: str) -> List[Dict[str, str]]:
+    return [{'name': name, 'value': name}
+            for name in sorted(os.listdir(data_root))
+            if os.path.isdir(os.path.join(data_root, name))]
+
+
+@contextmanager
+def data_store(root: str):
+    """Point the worker at a data store under the root directory"""
+    data_root = os.path.join(root, 'data')
+    os.makedirs(data_root, exist_ok=True)
+    paths = {
+        'all': root,
+        'done': data_root,
+        'processing': os.path.join(root, 'temp'),
+        'failed': os.path.join(root, 'failed'),
+    }
+    with ExitStack() as stack:
+        for module in (cmn, da, ds):
+            stack.enter_context(patch.object(module, 'DATA_ROOT', data_root))
+        stack.enter_context(patch.object(
+            ds, 'get_datasets', lambda: _list_datasets(data_root)))
+        stack.enter_context(patch.dict(helpers.STATUS_PATHS, paths))
+        stack.enter_context(patch.object(
+            catalog, 'CATALOG_PATH', os.path.join(root, 'catalog.sqlite')))
+        stack.enter_context(patch.object(
+            data_utils, 'DATASET_CACHE', os.path.join(root, 'datasets')))
+        stack.enter_context(patch.object(
+            cache.AFFINITIES, 'root', os.path.join(root, 'affinities')))
+        ds.DATASETS.invalidate()
+        da.invalidate_indices()
+        yield data_root
+        ds.DATASETS.invalidate()
+        da.invalidate_indices()
+
+
+def write_text_dataset(data_root: str, name: str, rows: int, mz: int):
+    """Store synthetic dataset in text layout of the data store"""
+    text_root = os.path.join(data_root, name, data_utils.TEXT_DATA)
+    os.makedirs(text_root, exist_ok=True)
+    with open(os.path.join(text_root, 'data.txt'), 'w') as file:
+        data_utils.dump_txt(file, synthetic_dataset(rows, mz))
+
+
+def stage_durations(states: List[Tuple[float, str]],
+                    finished: float) -> Dict[str, float]:
+    """Time spent in each reported state, until the task finished"""
+    durations = {}  # type: Dict[str, float]
+    ends = [started for started, _ in states[1:]] + [finished]
+    for (started, state), end in zip(states, ends):
+        durations[state] = durations.get(state, 0.) + end - started
+    return durations
+
+
+def run_tsne(analysis_name: str, n_iter: int, method: str) -> dict:
+    """Run tSNE task in process, recording when it entered each stage"""
+    states = []  # type: List[Tuple[float, str]]
+
+    def record(state, meta=None):
+        states.append((time.perf_counter(), state))
+
+    with patch.object(tasks.app.log, 'redirect_stdouts_to_logger'), \
+            patch.object(tasks.tSNE, 'update_state', side_effect=record), \
+            open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        started = time.perf_counter()
+        tasks.tSNE(analysis_name, TSNE_DATASET, method=method,
+                   n_iter=n_iter, random_state=0)
+        finished = time.perf_counter()
+    return {
+        'seconds': finished - started,
+        'stages': stage_durations(states, finished),
+    }
+
+
+def tsne(rows: int, mz: int, n_iter: int, method: str='fft') -> dict:
+    """Time tSNE task with cold caches and again with warm caches"""
+    with tempfile.TemporaryDirectory() as root, data_store(root) as data:
+        write_text_dataset(data, TSNE_DATASET, rows, mz)
+        return {
+            'method': method,
+            'cold': run_tsne('cold', n_iter, method),
+            'warm': run_tsne('warm', n_iter, method),
+        }
+
+
+def dump_txt(rows: int, mz: int, repeats: int) -> dict:
+    """Time text export of a dataset"""
+    dataset = synthetic_dataset(rows, mz)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'data.txt')
+
+        def dump():
+            with open(path, 'w') as file:
+                data_utils.dump_txt(file, dataset)
+
+        result = timings(dump, repeats)
+        result['megabytes'] = os.path.getsize(path) / 2 ** 20
+    return result
+
+
+def scatter_plot(rows: int, repeats: int) -> dict:
+    """Time plot of embedding serialized to JSON, plain and compact"""
+    embedding = np.random.RandomState(0).randn(rows, 2)
+    return {
+        encoding: timings(
+            lambda: as_scatter_plot(embedding, compact=compact).to_json(),
+            repeats)
+        for encoding, compact in (('json', False), ('compact', True))
+    }
+
+
+def write_analyses(data_root: str, count: int) -> List[str]:
+    """Create empty analyses spread over a few datasets"""
+    paths = []
+    for index in range(count):
+        dataset = 'dataset-%i' % (index % DATASETS_WITH_ANALYSES)
+        path = os.path.join(data_root, dataset, ANALYSIS_TYPE,
+                            'analysis-%i' % index)
+        os.makedirs(path)
+        paths.append(path)
+    return paths
+
+
+def discovery(count: int, repeats: int) -> dict:
+    """Time analysis lookup and HTTP endpoints for given number of them"""
+    import api  # preloads documents, so it is imported when needed only
+    client = api.app.test_client()
+    with tempfile.TemporaryDirectory() as root, data_store(root) as data:
+        ids = [da.analysis_id(path) for path in write_analyses(data, count)]
+        lookups = ids[::max(1, len(ids) // LOOKUPS)]
+
+        def cold_lookup():
+            da.invalidate_indices()
+            da.find_analysis_by_id(ANALYSIS_TYPE, ids[-1])
+
+        def warm_lookups():
+            for some_id in lookups:
+                da.find_analysis_by_id(ANALYSIS_TYPE, some_id)
+
+        def get(url: str):
+            response = client.get(url)
+            assert response.status_code == 200, url
+
+        cold = timings(cold_lookup, repeats)
+        warm = timings(warm_lookups, repeats)
+        warm = {name: value / len(lookups) for name, value in warm.items()}
+        return {
+            'find_analysis_by_id': {'cold': cold, 'warm': warm},
+            'layout': timings(
+                lambda: get('/layout/inputs/%s/' % ANALYSIS_TYPE), repeats),
+            'results': timings(
+                lambda: get('/results/%s/' % ANALYSIS_TYPE), repeats),
+        }
+
+
+def commit() -> str:
+    """Commit of the measured tree, if known"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows: int=2000, mz: int=1000, n_iter: int=300,
+        analyses=(10, 1000, 10000), repeats: int=5) -> dict:
+    """Run all the benchmarks"""
+    return {
+        'commit': commit(),
+        'created': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': {'rows': rows, 'mz': mz, 'n_iter': n_iter,
+                       'repeats': repeats},
+        'benchmarks': {
+            'tsne': tsne(rows, mz, n_iter),
+            'dump_txt': dump_txt(rows, mz, repeats),
+            'scatter_plot': scatter_plot(rows, repeats),
+            'discovery': {str(count): discovery(count, repeats)
+                          for count in analyses},
+        },
+    }
+
+
+def _flatten(results: dict, prefix: str='') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, float):
+            flat[name] = value
+    return flat
+
+
+def regressions(previous: dict, current: dict,
+                threshold: float=1.2) -> Dict[str, float]:
+    """Timings slower than in previous results more than threshold times"""
+    before = _flatten(previous['benchmarks'])
+    after = _flatten(current['benchmarks'])
+    return {name: after[name] / before[name] for name in sorted(after)
+            if before.get(name) and after[name] > threshold * before[name]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--mz', type=int, default=1000)
+    parser.add_argument('--n-iter', type=int, default=300)
+    parser.add_argument('--analyses', type=int, nargs='+',
+                        default=[10, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', default=None)
+    parser.add_argument('--threshold', type=float, default=1.2)
+    arguments = parser.parse_args()
+    result = run(arguments.rows, arguments.mz, arguments.n_iter,
+                 arguments.analyses, arguments.repeats)
+    with open(arguments.output, 'w') as file:
+        json.dump(result, file, indent=2, sort_keys=True)
+    for name, value in sorted(_flatten(result['benchmarks']).items()):
+        print('{0:<60} {1:12.6f}'.format(name, value))
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            previous = json.load(file)
+        slower = regressions(previous, result, arguments.threshold)
+        for name, ratio in slower.items():
+            print('REGRESSION {0:<49} {1:9.2f}x'.format(name, ratio))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
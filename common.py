@@ -15,6 +15,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from functools import wraps
+from typing import List
 
 import flask
 from flask_json import JsonError
@@ -49,6 +50,39 @@ def require_post_variable(path: str):
     return variables
 
 
+def optional_post_variable(path: str, default=None):
+    """Extract variable from Flask JSON request content, if present
+
+    Args:
+        path - (str) dot-separated path to value in JSON query content
+        default - value returned if path does not exist
+
+    Returns:
+        value under the path or default
+    """
+    variables = flask.request.get_json(silent=True) or {}
+    try:
+        for way in path.split('.'):
+            variables = variables[way]
+    except (KeyError, TypeError):
+        return default
+    return variables
+
+
+def negotiate(mimetypes: List[str]) -> str:
+    """Select the best of mimetypes accepted by the client
+
+    Args:
+        mimetypes - (list) mimetypes supported by the server, the first one
+            is selected if client does not care
+
+    Returns:
+        selected mimetype
+    """
+    return flask.request.accept_mimetypes.best_match(
+        mimetypes, default=mimetypes[0])
+
+
 def with_open(mode='r', buffering=None, encoding=None, errors=None, newline=None, closefd=True):
     """Decorator for easier wrapping of stream functions to work on files
 
@@ -14,13 +14,17 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import hashlib
 from itertools import cycle
 import os
 import shutil
+import tempfile
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 
 import spdata.common as cmn
+import spdata.reader as rd
 import spdata.types as ty
 
 from common import with_open
@@ -35,28 +39,303 @@ def as_normalized(observations: np.ndarray, coordinates: ty.Coordinates,
     return normalized
 
 
-def dump_txt(file, data: ty.Dataset):
-    """Dump data into stream in text format"""
+DUMP_CHUNK_ROWS = 1024
+
+
+def _format_rows(block: np.ndarray, precision: Optional[int]) -> List[str]:
+    """Format rows of a 2D block as lines of space-separated values"""
+    if precision is not None:
+        value_format, values = '%.{0}g'.format(precision), block.tolist()
+    elif block.dtype == np.float64 or np.issubdtype(block.dtype, np.integer):
+        # repr of builtin numbers is the same as str of numpy scalars
+        value_format, values = '%r', block.tolist()
+    else:
+        value_format, values = '%s', block.astype(str).tolist()
+    row_format = ' '.join([value_format] * block.shape[1])
+    return [row_format % tuple(row) for row in values]
+
+
+def dump_txt(file, data: ty.Dataset, precision: Optional[int]=None,
+             chunk_rows: int=DUMP_CHUNK_ROWS):
+    """Dump data into stream in text format
+
+    Spectra are formatted and written in blocks of chunk_rows. By default
+    values are written in their shortest exact representation; precision
+    limits them to given number of significant digits.
+    """
+    spectra = np.asarray(data.spectra)
     coordinates = data.coordinates
     labels = data.labels if data.labels is not None else cycle([0])
     metadata = zip(coordinates.x, coordinates.y, coordinates.z, labels)
     file.write("\n")
     file.write("%s\n" % " ".join(map(str, data.mz)))
-    for spectrum, metadata in zip(data.spectra, metadata):
-        file.write("%s\n" % " ".join(map(str, metadata)))
-        file.write("%s\n" % " ".join(map(str, spectrum)))
+    for start in range(0, spectra.shape[0], chunk_rows):
+        rows = _format_rows(spectra[start:start + chunk_rows], precision)
+        lines = []
+        for row, row_metadata in zip(rows, metadata):
+            lines.append(" ".join(map(str, row_metadata)))
+            lines.append(row)
+        lines.append("")
+        file.write("\n".join(lines))
 
 
 dumps_txt = with_open('w')(dump_txt)
 
 
-def push_to_repo(path: str, name: str):
-    """Push text dataset to data store"""
+BINARY_DATA = 'binary_data'
+BINARY_SPECTRA = 'spectra.npy'
+BINARY_METADATA = 'metadata.npz'
+TEXT_DATA = 'text_data'
+FLOAT32_DATA = 'float32_data'
+DATASET_CACHE = os.environ.get('TSNE_DATASET_CACHE', os.path.join(
+    cmn._FILESYSTEM_ROOT, 'cache', 'datasets'))
+
+
+def load_binary(directory: str) -> ty.Dataset:
+    """Load dataset stored in binary layout with memory-mapped spectra"""
+    spectra = np.load(os.path.join(directory, BINARY_SPECTRA), mmap_mode='r')
+    with np.load(os.path.join(directory, BINARY_METADATA)) as metadata:
+        coordinates = ty.Coordinates(metadata['x'], metadata['y'],
+                                     metadata['z'])
+        labels = metadata['labels'] if 'labels' in metadata else None
+        if 'mz' in metadata:
+            return ty.Dataset(spectra, coordinates, metadata['mz'], labels)
+    return as_normalized(spectra, coordinates, labels)
+
+
+def _text_rows(file) -> Iterator[Tuple[str, str]]:
+    """Pairs of metadata and spectrum lines of text dataset after mz line"""
+    lines = (line for line in file if line.strip())
+    return zip(lines, lines)
+
+
+def _as_values(values: List[str]) -> np.ndarray:
+    for dtype in (np.int64, np.float64):
+        try:
+            return np.array(values, dtype=dtype)
+        except ValueError:
+            pass
+    return np.array(values)
+
+
+def _temporary_file(directory: str, name: str) -> str:
+    """Path of new empty file in the directory, unique across threads"""
+    stem, extension = os.path.splitext(name)
+    handle, path = tempfile.mkstemp(dir=directory, prefix=stem + '.',
+                                    suffix='.tmp' + extension)
+    os.close(handle)
+    return path
+
+
+def convert_text(text_path: str, directory: str, dtype=np.float32,
+                 chunk_rows: int=DUMP_CHUNK_ROWS):
+    """Convert text dataset into binary layout, streaming it row by row
+
+    Spectra are written into memory-mapped .npy of given type, so the
+    dataset is never held in memory as a whole. Files are written under
+    unique temporary names and replaced, as concurrent requests may convert
+    the same dataset.
+    """
+    with open(text_path) as file:
+        file.readline()
+        n_features = len(file.readline().split())
+        n_rows = sum(1 for _ in _text_rows(file))
+    spectra_path = os.path.join(directory, BINARY_SPECTRA)
+    temporary_paths = [_temporary_file(directory, BINARY_SPECTRA),
+                       _temporary_file(directory, BINARY_METADATA)]
+    temporary_spectra, temporary_metadata = temporary_paths
+    try:
+        spectra = np.lib.format.open_memmap(temporary_spectra, mode='w+',
+                                            dtype=dtype,
+                                            shape=(n_rows, n_features))
+        metadata = []
+        with open(text_path) as file:
+            file.readline()
+            mz = np.array(file.readline().split(), dtype=float)
+            block = np.empty((chunk_rows, n_features), dtype=dtype)
+            for row, (row_metadata, spectrum) in enumerate(_text_rows(file)):
+                metadata.append(row_metadata.split())
+                block[row % chunk_rows] = np.array(spectrum.split(),
+                                                   dtype=dtype)
+                if row % chunk_rows == chunk_rows - 1 or row == n_rows - 1:
+                    start = row - row % chunk_rows
+                    spectra[start:row + 1] = block[:row + 1 - start]
+        spectra.flush()
+        del spectra
+        columns = list(zip(*metadata)) or [[], [], []]
+        arrays = {axis: _as_values(list(values))
+                  for axis, values in zip('xyz', columns)}
+        if len(columns) > 3:
+            arrays['labels'] = _as_values(list(columns[3]))
+        np.savez(temporary_metadata, mz=mz, **arrays)
+        os.replace(temporary_metadata,
+                   os.path.join(directory, BINARY_METADATA))
+        os.replace(temporary_spectra, spectra_path)
+    finally:
+        for path in temporary_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def ensure_float32(name: str) -> str:
+    """Return directory of float32 copy of text dataset, converting it once
+
+    The copy is regenerated if the text dataset was modified after it.
+    """
+    text_path = os.path.join(cmn.DATA_ROOT, name, TEXT_DATA, 'data.txt')
+    directory = os.path.join(cmn.DATA_ROOT, name, FLOAT32_DATA)
+    spectra_path = os.path.join(directory, BINARY_SPECTRA)
+    if not os.path.exists(spectra_path) \
+            or os.path.getmtime(spectra_path) < os.path.getmtime(text_path):
+        os.makedirs(directory, exist_ok=True)
+        convert_text(text_path, directory)
+    return directory
+
+
+def parsed_text(text_path: str) -> str:
+    """Return directory of text dataset parsed into binary layout
+
+    Parsed datasets are cached in DATASET_CACHE under the path, size and
+    modification time of the text file, so any process reading the same
+    dataset parses it once. Entries are published by atomic rename of their
+    directory, and older versions of the dataset are removed.
+    """
+    stat = os.stat(text_path)
+    entry_root = os.path.join(DATASET_CACHE, hashlib.sha1(
+        os.path.abspath(text_path).encode()).hexdigest())
+    version = '%i-%i' % (stat.st_size, stat.st_mtime_ns)
+    directory = os.path.join(entry_root, version)
+    if os.path.isdir(directory):
+        return directory
+    os.makedirs(entry_root, exist_ok=True)
+    temporary = tempfile.mkdtemp(dir=entry_root, prefix=version + '.',
+                                 suffix='.tmp')
+    try:
+        convert_text(text_path, temporary, dtype=np.float64)
+        os.rename(temporary, directory)
+    except OSError:
+        if not os.path.isdir(directory):  # not published by other process
+            raise
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+    for stale in os.listdir(entry_root):
+        if stale != version and not stale.endswith('.tmp'):
+            shutil.rmtree(os.path.join(entry_root, stale), ignore_errors=True)
+    return directory
+
+
+def load_dataset(name: str, low_memory: bool=False) -> ty.Dataset:
+    """Load dataset from data store, preferring binary layout
+
+    Text datasets are parsed once into the shared cache of parsed datasets
+    and memory-mapped from there. In low memory mode they are converted
+    into float32 binary layout stored next to them instead.
+    """
+    binary_root = os.path.join(cmn.DATA_ROOT, name, BINARY_DATA)
+    if os.path.exists(os.path.join(binary_root, BINARY_SPECTRA)):
+        return load_binary(binary_root)
+    if low_memory:
+        return load_binary(ensure_float32(name))
+    text_path = os.path.join(cmn.DATA_ROOT, name, TEXT_DATA, 'data.txt')
+    if os.path.exists(text_path):
+        try:
+            return load_binary(parsed_text(text_path))
+        except (OSError, ValueError):
+            # cache not writable or text not following the simple layout
+            pass
+    return rd.load_dataset(name)
+
+
+_FICLONE = 0x40049409  # Linux ioctl sharing extents of files (reflink)
+_COPY_BUFFER = 16 * 2 ** 20
+
+
+def _reflink(src: str, dst: str):
+    import fcntl
+    with open(src, 'rb') as source, open(dst, 'wb') as destination:
+        fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+
+
+def _streamed_copy(src: str, dst: str):
+    with open(src, 'rb') as source, open(dst, 'wb') as destination:
+        shutil.copyfileobj(source, destination, _COPY_BUFFER)
+
+
+def publish_file(src: str, dst: str, move: bool=False):
+    """Place content of src under dst, sharing the storage if possible
+
+    If move is set, src is renamed. Otherwise hardlink is created, so both
+    paths refer to the same data and neither of them should be modified in
+    place. On filesystems without hardlinks, file is reflinked, and only as
+    a last resort it is copied. dst appears atomically in every case.
+    """
+    if move:
+        try:
+            os.replace(src, dst)
+            return
+        except OSError:  # different filesystems
+            pass
+    else:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    temporary = dst + '.tmp'
+    try:
+        try:
+            _reflink(src, temporary)
+        except (ImportError, OSError):
+            _streamed_copy(src, temporary)
+        os.replace(temporary, dst)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    if move:
+        os.remove(src)
+
+
+def _push_binary_bundle(path: str, dst_dir: str):
+    with np.load(path) as bundle:
+        if 'spectra' not in bundle:
+            raise ValueError('Missing spectra in %s' % path)
+        metadata = {key: bundle[key] for key in bundle.files
+                    if key != 'spectra'}
+        spectra_path = os.path.join(dst_dir, BINARY_SPECTRA)
+        np.save(spectra_path + '.tmp.npy', bundle['spectra'])
+    os.replace(spectra_path + '.tmp.npy', spectra_path)
+    np.savez(os.path.join(dst_dir, BINARY_METADATA), **metadata)
+
+
+def push_to_repo(path: str, name: str, move: bool=False):
+    """Push dataset to data store
+
+    Supported formats:
+        .txt - text dataset
+        .npy - spectra matrix, accompanied by metadata.npz with arrays x, y,
+            z and optionally labels and mz, placed in the same directory
+        .npz - bundle with spectra array and arrays listed above
+
+    Text datasets and .npy spectra are published without copying, if the
+    data store resides on the same filesystem (see publish_file).
+    """
     extension = os.path.splitext(path)[1].lower()
-    if extension != '.txt':
-        raise NotImplementedError('Only .txt are supported now. Was: %s' %
-                                  extension)
-    dst_dir = os.path.join(cmn.DATA_ROOT, name, 'text_data')
-    os.makedirs(dst_dir)
-    dst_path = os.path.join(dst_dir, 'data.txt')
-    shutil.copy(path, dst_path)
+    if extension == '.txt':
+        dst_dir = os.path.join(cmn.DATA_ROOT, name, TEXT_DATA)
+        os.makedirs(dst_dir)
+        publish_file(path, os.path.join(dst_dir, 'data.txt'), move)
+    elif extension == '.npy':
+        metadata_path = os.path.join(os.path.dirname(path), BINARY_METADATA)
+        if not os.path.exists(metadata_path):
+            raise FileNotFoundError(metadata_path)
+        dst_dir = os.path.join(cmn.DATA_ROOT, name, BINARY_DATA)
+        os.makedirs(dst_dir)
+        publish_file(metadata_path, os.path.join(dst_dir, BINARY_METADATA))
+        publish_file(path, os.path.join(dst_dir, BINARY_SPECTRA), move)
+    elif extension == '.npz':
+        dst_dir = os.path.join(cmn.DATA_ROOT, name, BINARY_DATA)
+        os.makedirs(dst_dir)
+        _push_binary_bundle(path, dst_dir)
+    else:
+        raise NotImplementedError('Only .txt, .npy and .npz are supported '
+                                  'now. Was: %s' % extension)
@@ -0,0 +1,175 @@
+"""Level of detail of large embeddings
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Each point gets a random priority. Any set of points with the highest
+priority is a uniform sample, so it preserves density of the embedding at
+every zoom level. Points are grouped in a regular grid and sorted by
+priority within each cell, which allows to find the highest priority points
+in a viewport without scanning the whole embedding.
+"""
+import json
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+
+LOD_INDEX = 'lod.npy'
+LOD_GRID = 'lod.json'
+GRID_SIZE = {2: 256, 3: 32}
+_SEED = 0
+
+Viewport = Sequence[Tuple[float, float]]
+
+
+class GridIndex:
+    """Points of embedding grouped by grid cells, sorted by priority"""
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, grid_size: int,
+                 order: np.ndarray, keys: np.ndarray):
+        self.lower = lower
+        self.upper = upper
+        self.grid_size = grid_size
+        self.order = order
+        self.keys = keys
+
+    @property
+    def size(self) -> int:
+        return self.order.size
+
+    @property
+    def dimensions(self) -> int:
+        return self.lower.size
+
+    def _cell_coordinates(self, points: np.ndarray) -> np.ndarray:
+        span = np.where(self.upper > self.lower, self.upper - self.lower, 1.)
+        scaled = (points - self.lower) / span * self.grid_size
+        return np.clip(scaled.astype(np.int64), 0, self.grid_size - 1)
+
+    def _cells(self, viewport: Optional[Viewport]) -> np.ndarray:
+        if viewport is None:
+            return np.arange(self.grid_size ** self.dimensions)
+        bounds = np.clip(np.array(viewport, dtype=float).T, self.lower,
+                         self.upper)
+        first, last = self._cell_coordinates(bounds)
+        ranges = [np.arange(start, stop + 1) for start, stop in zip(first, last)]
+        mesh = np.meshgrid(*ranges, indexing='ij')
+        return np.ravel_multi_index([axis.ravel() for axis in mesh],
+                                    (self.grid_size,) * self.dimensions)
+
+    def _candidates(self, cells: np.ndarray, threshold: int) -> np.ndarray:
+        starts = np.searchsorted(self.keys, cells * self.size)
+        stops = np.searchsorted(self.keys, cells * self.size + threshold)
+        lengths = stops - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(lengths.sum())
+
+    def query(self, embedding: np.ndarray, budget: Optional[int]=None,
+              viewport: Optional[Viewport]=None) -> Tuple[np.ndarray, int]:
+        """Find up to budget points with highest priority in the viewport
+
+        Arguments:
+            embedding: points the index was built for
+            budget: maximal number of returned points, unlimited if None
+            viewport: (min, max) bounds for each dimension, whole embedding
+                if None
+
+        Returns:
+            indices of selected points and estimated number of points in
+            the viewport
+        """
+        cells = self._cells(viewport)
+        bounds = None if viewport is None else np.array(viewport, dtype=float)
+        total = int((np.searchsorted(self.keys, (cells + 1) * self.size)
+                     - np.searchsorted(self.keys, cells * self.size)).sum())
+        if budget is None or budget >= total:
+            threshold = self.size
+        else:
+            threshold = max(budget * self.size // max(total, 1), 1)
+        while True:
+            positions = self._candidates(cells, threshold)
+            if bounds is not None and positions.size:
+                points = embedding[self.order[positions]]
+                inside = np.all((points >= bounds[:, 0])
+                                & (points <= bounds[:, 1]), axis=1)
+                positions = positions[inside]
+            if budget is None or positions.size >= budget \
+                    or threshold >= self.size:
+                break
+            threshold = min(2 * threshold, self.size)
+        if budget is not None and positions.size > budget:
+            ranks = self.keys[positions] % self.size
+            positions = positions[np.argpartition(ranks, budget - 1)[:budget]]
+        return np.sort(self.order[positions]), total
+
+
+def build_index(embedding: np.ndarray, seed: int=_SEED) -> GridIndex:
+    """Assign priorities to points and group them in grid cells"""
+    dimensions = embedding.shape[1]
+    grid_size = GRID_SIZE[dimensions]
+    lower = np.asarray(embedding.min(axis=0), dtype=float)
+    upper = np.asarray(embedding.max(axis=0), dtype=float)
+    index = GridIndex(lower, upper, grid_size, np.empty(0, dtype=np.int64),
+                      np.empty(0, dtype=np.int64))
+    size = embedding.shape[0]
+    ranks = np.random.RandomState(seed).permutation(size)
+    cells = np.ravel_multi_index(index._cell_coordinates(embedding).T,
+                                 (grid_size,) * dimensions)
+    keys = cells.astype(np.int64) * size + ranks
+    index.order = np.argsort(keys, kind='mergesort')
+    index.keys = keys[index.order]
+    return index
+
+
+def save_index(root: str, index: GridIndex):
+    """Store index in analysis directory"""
+    grid = {"lower": index.lower.tolist(), "upper": index.upper.tolist(),
+            "grid_size": index.grid_size}
+    with open(os.path.join(root, LOD_GRID), 'w') as grid_file:
+        json.dump(grid, grid_file)
+    path = os.path.join(root, LOD_INDEX)
+    temporary_path = path + '.tmp.npy'
+    np.save(temporary_path, np.vstack([index.keys, index.order]))
+    os.replace(temporary_path, path)
+
+
+@metrics.timed(metrics.ARTIFACT_LOADING_DURATION, artifact='lod_index')
+def load_index(root: str) -> Optional[GridIndex]:
+    """Load memory-mapped index stored in analysis directory, if present"""
+    path = os.path.join(root, LOD_INDEX)
+    if not os.path.exists(path):
+        return None
+    with open(os.path.join(root, LOD_GRID)) as grid_file:
+        grid = json.load(grid_file)
+    keys, order = np.load(path, mmap_mode='r')
+    return GridIndex(np.array(grid['lower']), np.array(grid['upper']),
+                     grid['grid_size'], order, keys)
+
+
+def ensure_index(root: str, embedding: np.ndarray) -> GridIndex:
+    """Load index of embedding, building and storing it if necessary"""
+    index = load_index(root)
+    if index is not None and index.size == embedding.shape[0]:
+        return index
+    index = build_index(embedding)
+    try:
+        save_index(root, index)
+    except OSError:  # read-only data store still can be served
+        pass
+    return index
@@ -14,5 +14,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from .datasets import file_with_datasets_substitution, unchanged_file
-from .analyses import find_analysis_results, find_analysis_by_id
+from .datasets import file_with_datasets_substitution, unchanged_file, \
+    preload, with_datasets_substitution
+from .analyses import find_analysis_results, find_analysis_by_id, analysis_index
+from . import catalog
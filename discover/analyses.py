@@ -18,17 +18,23 @@ from itertools import chain
 from functools import partial
 import hashlib
 import os
-from typing import List, NamedTuple
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-from spdata.discover import as_readable, get_datasets
+from spdata.discover import as_readable
 from spdata.common import DATA_ROOT
 
 import common
+import metrics
+from discover.datasets import cached_datasets, modification_time
 
 
 only_existing = partial(filter, os.path.exists)
 only_folders = partial(filter, os.path.isdir)
 Path = str
+ANALYSIS_TYPES = ('tSNE',)
+# coarsest modification time resolution of common filesystems (FAT)
+MTIME_RESOLUTION_NS = 2 * 10 ** 9
 
 
 def folders_in(path: str) -> List[Path]:
@@ -63,25 +69,111 @@ AnalysisResult = NamedTuple('AnalysisResult', [
 
 def find_all_analyses_paths(analysis_type: str) -> List[Path]:
     "Find paths of all available analyses"
-    datasets = [dataset['value'] for dataset in get_datasets()]
+    datasets = [dataset['value'] for dataset in cached_datasets()]
     analysis_root = partial(analysis_directory, analysis_type)
     search_paths = only_existing(analysis_root(dataset) for dataset in datasets)
     analyses = chain.from_iterable(folders_in(path) for path in search_paths)
     return list(analyses)
 
 
+Signature = Tuple[Optional[int], ...]
+
+
+class AnalysisIndex:
+    """Mapping of analyses ids to their paths
+
+    The index is built once and rebuilt only when any of the directories
+    which may contain the analyses changes its modification time. Adding or
+    removing an analysis (or a dataset) changes the modification time of
+    the parent directory, so no directory listing is necessary to detect it.
+    """
+    def __init__(self, analysis_type: str):
+        self.analysis_type = analysis_type
+        self.version = 0
+        self._paths = {}  # type: Dict[str, Path]
+        self._watched = []  # type: List[Path]
+        self._signature = None  # type: Optional[Signature]
+        self._built = 0
+
+    def _watched_directories(self) -> List[Path]:
+        datasets = [dataset['value'] for dataset in cached_datasets()]
+        dataset_roots = [os.path.join(DATA_ROOT, name) for name in datasets]
+        analysis_roots = [analysis_directory(self.analysis_type, name)
+                          for name in datasets]
+        return [DATA_ROOT] + dataset_roots + analysis_roots
+
+    def _current_signature(self) -> Signature:
+        return tuple(modification_time(path) for path in self._watched)
+
+    @metrics.timed(metrics.DISCOVERY_DURATION, operation='rebuild_index')
+    def rebuild(self):
+        "Rescan the data store"
+        self._watched = self._watched_directories()
+        self._signature = self._current_signature()
+        self._built = int(time.time() * 10 ** 9)
+        paths = find_all_analyses_paths(self.analysis_type)
+        self._paths = {analysis_id(path): path for path in paths}
+        self.version += 1
+
+    def refresh(self):
+        "Rebuild the index if the data store has changed since last build"
+        if self._signature is None \
+                or self._signature != self._current_signature():
+            self.rebuild()
+
+    def _may_have_missed(self) -> bool:
+        """Whether the store changed within mtime resolution of last build"""
+        modified = [mtime for mtime in self._signature if mtime is not None]
+        return not modified \
+            or self._built - max(modified) < MTIME_RESOLUTION_NS
+
+    def items(self) -> List[Tuple[str, Path]]:
+        "Ids and paths of all known analyses"
+        self.refresh()
+        return list(self._paths.items())
+
+    def __getitem__(self, some_id: str) -> Path:
+        self.refresh()
+        if some_id not in self._paths and self._may_have_missed():
+            # modification time has limited resolution, so brand new
+            # analysis could have been missed
+            self.rebuild()
+        return self._paths[some_id]
+
+
+_INDICES = {}  # type: Dict[str, AnalysisIndex]
+
+
+def analysis_index(analysis_type: str) -> AnalysisIndex:
+    "Get shared index of analyses of given type, KeyError if it is unknown"
+    if analysis_type not in ANALYSIS_TYPES:
+        raise KeyError(analysis_type)
+    if analysis_type not in _INDICES:
+        _INDICES[analysis_type] = AnalysisIndex(analysis_type)
+    return _INDICES[analysis_type]
+
+
+def invalidate_indices():
+    "Drop all the indices, so they are rebuilt on the next access"
+    _INDICES.clear()
+
+
+@metrics.timed(metrics.DISCOVERY_DURATION,
+               operation='find_analysis_results')
 def find_analysis_results(analysis_type: str) -> List[AnalysisResult]:
     "Find available results of analyses of given type"
-    analyses = find_all_analyses_paths(analysis_type)
+    if analysis_type not in ANALYSIS_TYPES:
+        return []
     return [
-        AnalysisResult(name=user_friendly_name(path), id=analysis_id(path))
-        for path in analyses
+        AnalysisResult(name=user_friendly_name(path), id=some_id)
+        for some_id, path in analysis_index(analysis_type).items()
     ]
 
 
+@metrics.timed(metrics.DISCOVERY_DURATION, operation='find_analysis_by_id')
 def find_analysis_by_id(analysis_type: str, some_id: str) -> Path:
     "Find location of analysis by its id"
-    for analysis in find_all_analyses_paths(analysis_type):
-        if analysis_id(analysis) == some_id:
-            return analysis
-    raise common.unknown_analysis_id(analysis_type, some_id)
+    try:
+        return analysis_index(analysis_type)[some_id]
+    except KeyError:
+        raise common.unknown_analysis_id(analysis_type, some_id)
@@ -0,0 +1,290 @@
+"""Persistent catalog of analyses results
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from spdata.common import _FILESYSTEM_ROOT as FILESYSTEM_ROOT
+
+from discover.analyses import AnalysisIndex, analysis_id, Path, \
+    user_friendly_name
+
+
+CATALOG_PATH = os.environ.get(
+    'TSNE_CATALOG_PATH', os.path.join(FILESYSTEM_ROOT, 'catalog.sqlite'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    analysis_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created REAL NOT NULL,
+    rows INTEGER,
+    runtime REAL,
+    size INTEGER NOT NULL,
+    artifacts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_by_type ON analyses (analysis_type, name);
+CREATE TABLE IF NOT EXISTS parameters (
+    analysis_id TEXT NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value,
+    PRIMARY KEY (analysis_id, key)
+);
+CREATE INDEX IF NOT EXISTS parameters_by_value ON parameters (key, value);
+"""
+
+
+@contextmanager
+def connect(path: str=None):
+    """Open the catalog, creating it if necessary"""
+    connection = sqlite3.connect(path or CATALOG_PATH, timeout=30)
+    try:
+        connection.execute('PRAGMA foreign_keys = ON')
+        connection.executescript(_SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+CatalogEntry = NamedTuple('CatalogEntry', [
+    ('name', str),
+    ('id', str),
+    ('dataset', str),
+    ('created', float),
+    ('rows', Optional[int]),
+    ('runtime', Optional[float]),
+    ('size', int),
+    ('artifacts', Dict[str, int]),
+    ('parameters', Dict[str, Any]),
+])
+
+
+def artifacts_sizes(analysis_path: Path) -> Dict[str, int]:
+    """Sizes of files stored in the analysis directory"""
+    sizes = {}
+    for directory, _, files in os.walk(analysis_path):
+        for name in files:
+            path = os.path.join(directory, name)
+            sizes[os.path.relpath(path, analysis_path)] = os.path.getsize(path)
+    return sizes
+
+
+def dataset_of(analysis_path: Path) -> str:
+    """Name of the dataset the analysis was performed on"""
+    split = os.path.split
+    return split(split(split(analysis_path)[0])[0])[1]
+
+
+def stored_parameters(analysis_path: Path) -> Dict[str, Any]:
+    """Parameters preserved along with the analysis"""
+    try:
+        with open(os.path.join(analysis_path, 'options.json')) as options:
+            return json.load(options)
+    except (OSError, ValueError):
+        return {}
+
+
+def _insert(connection, analysis_type: str, analysis_path: Path,
+            parameters: Dict[str, Any], rows: Optional[int]=None,
+            runtime: Optional[float]=None):
+    artifacts = artifacts_sizes(analysis_path)
+    some_id = analysis_id(analysis_path)
+    connection.execute(
+        'INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (some_id, analysis_type, user_friendly_name(analysis_path),
+         dataset_of(analysis_path), analysis_path,
+         os.path.getmtime(analysis_path), rows, runtime,
+         sum(artifacts.values()), json.dumps(artifacts, sort_keys=True)))
+    connection.execute('DELETE FROM parameters WHERE analysis_id = ?',
+                       (some_id,))
+    connection.executemany(
+        'INSERT INTO parameters VALUES (?, ?, ?)',
+        [(some_id, key, _as_column(value))
+         for key, value in parameters.items()])
+
+
+def _as_column(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def register(analysis_type: str, analysis_path: Path,
+             parameters: Dict[str, Any], rows: Optional[int]=None,
+             runtime: Optional[float]=None, catalog_path: str=None):
+    """Record completed analysis in the catalog"""
+    with connect(catalog_path) as connection:
+        _insert(connection, analysis_type, analysis_path, parameters, rows,
+                runtime)
+
+
+_SYNCHRONIZED = {}  # type: Dict[Tuple[str, str], int]
+
+
+def synchronize(index: AnalysisIndex, catalog_path: str=None):
+    """Reconcile catalog with analyses present in the data store
+
+    Analyses not known to the catalog (e.g. created before it existed) are
+    added with the parameters preserved in their directory. Entries of
+    analyses that are gone are removed. Nothing happens unless the index
+    has changed since last synchronization.
+    """
+    items = dict(index.items())
+    key = index.analysis_type, catalog_path or CATALOG_PATH
+    if _SYNCHRONIZED.get(key) == index.version:
+        return
+    with connect(catalog_path) as connection:
+        known = {row[0] for row in connection.execute(
+            'SELECT id FROM analyses WHERE analysis_type = ?',
+            (index.analysis_type,))}
+        connection.executemany('DELETE FROM analyses WHERE id = ?',
+                               [(gone,) for gone in known - set(items)])
+        for some_id in set(items) - known:
+            path = items[some_id]
+            _insert(connection, index.analysis_type, path,
+                    stored_parameters(path))
+    _SYNCHRONIZED[key] = index.version
+
+
+SORTABLE = {
+    'name': 'a.name',
+    'dataset': 'a.dataset',
+    'created': 'a.created',
+    'rows': 'a.rows',
+    'runtime': 'a.runtime',
+    'size': 'a.size',
+}
+PARAMETER_PREFIX = 'param.'
+MAX_PAGE_SIZE = 1000
+
+Query = NamedTuple('Query', [
+    ('dataset', Optional[str]),
+    ('parameters', Dict[str, Any]),
+    ('sort', str),
+    ('descending', bool),
+    ('page', int),
+    ('per_page', Optional[int]),
+])
+
+QUERY_ARGUMENTS = {'dataset', 'sort', 'order', 'page', 'per_page'}
+
+
+def _parse_value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _positive(arguments: Mapping[str, str], name: str, default=None):
+    if name not in arguments:
+        return default
+    try:
+        value = int(arguments[name])
+    except ValueError:
+        raise ValueError('%s must be an integer' % name)
+    if value < 1:
+        raise ValueError('%s must be positive' % name)
+    return value
+
+
+def is_query(arguments: Mapping[str, str]) -> bool:
+    """Check if request arguments ask for catalog query"""
+    return any(name in QUERY_ARGUMENTS or name.startswith(PARAMETER_PREFIX)
+               for name in arguments)
+
+
+def parse_query(arguments: Mapping[str, str]) -> Query:
+    """Build catalog query from request arguments
+
+    Supported arguments: dataset, sort (name, dataset, created, rows,
+    runtime, size or param.<name>), order (asc or desc), page (1-based),
+    per_page and param.<name>=<value> filters.
+    """
+    sort = arguments.get('sort', 'name')
+    if sort not in SORTABLE and not sort.startswith(PARAMETER_PREFIX):
+        raise ValueError('Cannot sort by %s' % sort)
+    order = arguments.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    per_page = _positive(arguments, 'per_page')
+    if per_page is not None and per_page > MAX_PAGE_SIZE:
+        raise ValueError('per_page cannot exceed %i' % MAX_PAGE_SIZE)
+    parameters = {
+        name[len(PARAMETER_PREFIX):]: _parse_value(value)
+        for name, value in arguments.items()
+        if name.startswith(PARAMETER_PREFIX)
+    }
+    return Query(dataset=arguments.get('dataset'), parameters=parameters,
+                 sort=sort, descending=order == 'desc',
+                 page=_positive(arguments, 'page', 1), per_page=per_page)
+
+
+def _entry(connection, row) -> CatalogEntry:
+    some_id, name, dataset, created, rows, runtime, size, artifacts = row
+    parameters = {
+        key: value for key, value in connection.execute(
+            'SELECT key, value FROM parameters WHERE analysis_id = ?',
+            (some_id,))
+    }
+    return CatalogEntry(name=name, id=some_id, dataset=dataset,
+                        created=created, rows=rows, runtime=runtime,
+                        size=size, artifacts=json.loads(artifacts),
+                        parameters=parameters)
+
+
+def query_results(analysis_type: str, query: Query,
+                  catalog_path: str=None) -> Tuple[int, List[CatalogEntry]]:
+    """Find total number of matching analyses and requested page of them"""
+    conditions = ['a.analysis_type = ?']
+    arguments = [analysis_type]  # type: List[Any]
+    if query.dataset is not None:
+        conditions.append('a.dataset = ?')
+        arguments.append(query.dataset)
+    for key, value in sorted(query.parameters.items()):
+        conditions.append('EXISTS (SELECT 1 FROM parameters p WHERE '
+                          'p.analysis_id = a.id AND p.key = ? AND p.value = ?)')
+        arguments.extend([key, _as_column(value)])
+    where = ' AND '.join(conditions)
+    if query.sort.startswith(PARAMETER_PREFIX):
+        order_by = ('(SELECT value FROM parameters p WHERE '
+                    'p.analysis_id = a.id AND p.key = ?)')
+        order_arguments = [query.sort[len(PARAMETER_PREFIX):]]
+    else:
+        order_by, order_arguments = SORTABLE[query.sort], []
+    direction = 'DESC' if query.descending else 'ASC'
+    limit, offset = -1, 0
+    if query.per_page is not None:
+        limit, offset = query.per_page, (query.page - 1) * query.per_page
+    with connect(catalog_path) as connection:
+        total, = connection.execute(
+            'SELECT COUNT(*) FROM analyses a WHERE ' + where,
+            arguments).fetchone()
+        rows = connection.execute(
+            'SELECT a.id, a.name, a.dataset, a.created, a.rows, a.runtime, '
+            'a.size, a.artifacts FROM analyses a WHERE ' + where +
+            ' ORDER BY ' + order_by + ' ' + direction + ', a.name ' +
+            direction + ' LIMIT ? OFFSET ?',
+            arguments + order_arguments + [limit, offset]).fetchall()
+        return total, [_entry(connection, row) for row in rows]
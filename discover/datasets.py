@@ -14,13 +14,76 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from functools import partial
+from functools import lru_cache, partial
+import hashlib
 import json
 import os
-from typing import Callable, Dict, Optional
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
 
+from spdata.common import DATA_ROOT
 from spdata.discover import get_datasets
 
+import metrics
+
+
+def modification_time(path: str) -> Optional[int]:
+    """Get modification time of the path or None, if it does not exist"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+DATASETS_TTL = float(os.environ.get('TSNE_DATASETS_TTL', 30))
+
+
+class DatasetsCache:
+    """Listing of datasets available in the data store
+
+    Listing is refreshed when the data store directory changes or when it
+    is older than ttl seconds (which covers changes inside datasets).
+    """
+    def __init__(self, ttl: float=DATASETS_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._datasets = None  # type: Optional[List[Dict[str, str]]]
+        self._loaded = 0.
+        self._modified = None  # type: Optional[int]
+
+    def get(self) -> List[Dict[str, str]]:
+        """Get datasets in {"name": ..., "value": ...} format"""
+        now = self._clock()
+        modified = modification_time(DATA_ROOT)
+        if self._datasets is None or now - self._loaded > self.ttl \
+                or modified != self._modified:
+            self.misses += 1
+            self._datasets = get_datasets()
+            self._loaded, self._modified = now, modified
+        else:
+            self.hits += 1
+        return list(self._datasets)
+
+    def invalidate(self):
+        """Force refresh on next access"""
+        self._datasets = None
+
+
+DATASETS = DatasetsCache()
+metrics.REGISTRY.register(metrics.FunctionCounter(
+    'tsne_datasets_cache_hits_total',
+    'Listings of datasets served from cache.', lambda: DATASETS.hits))
+metrics.REGISTRY.register(metrics.FunctionCounter(
+    'tsne_datasets_cache_misses_total',
+    'Listings of datasets read from the data store.', lambda: DATASETS.misses))
+
+
+def cached_datasets() -> List[Dict[str, str]]:
+    """Get datasets available in the data store, cached"""
+    return DATASETS.get()
+
 
 def substitute_tags(tag_map: Dict[str, str], text: str) -> str:
     """Substitute tags from the text for corresponding values in the map"""
@@ -34,7 +97,7 @@ Substitutor = Optional[Callable[[str], str]]
 
 def datasets_substitutor() -> Substitutor:
     """Factory of datasets substitutor"""
-    datasets = get_datasets()
+    datasets = cached_datasets()
     parsed = json.dumps(datasets)
     return partial(substitute_tags, {'$DATASETS': parsed})
 
@@ -57,3 +120,39 @@ def file_from_disk(substitutor_factory: SubstitutorFactory, path: str) -> str:
 
 file_with_datasets_substitution = partial(file_from_disk, datasets_substitutor)
 unchanged_file = partial(file_from_disk, None)
+
+
+Document = NamedTuple('Document', [
+    ('content', str),
+    ('etag', str)
+])
+
+
+def as_document(content: str) -> Document:
+    """Wrap content with its strong entity tag"""
+    return Document(content, hashlib.sha1(content.encode()).hexdigest())
+
+
+def preload(root: str) -> Dict[str, Document]:
+    """Read all JSON files in the directory tree"""
+    documents = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith('.json'):
+                path = os.path.join(directory, name)
+                documents[path] = as_document(unchanged_file(path))
+    return documents
+
+
+@lru_cache(maxsize=64)
+def _substituted(template: str, datasets: str) -> Document:
+    return as_document(substitute_tags({'$DATASETS': datasets}, template))
+
+
+def with_datasets_substitution(template: Document) -> Document:
+    """Substitute datasets into the template
+
+    Substitution is performed only once for each listing of datasets.
+    """
+    datasets = json.dumps(cached_datasets())
+    return _substituted(template.content, datasets)
@@ -0,0 +1,153 @@
+"""Input similarities of t-SNE
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+
+from embedding import neighbors as ann, parallel
+
+
+_PERPLEXITY_STEPS = 100
+_PERPLEXITY_TOLERANCE = 1e-5
+_ROWS_PER_CHUNK = 4096
+_EPSILON = np.finfo(np.double).eps
+
+
+def n_neighbors(n_samples: int, perplexity: float) -> int:
+    """Number of neighbours considered for given perplexity"""
+    return min(n_samples - 1, int(3. * perplexity + 1))
+
+
+def nearest_neighbors(data: np.ndarray, k: int, metric: str='euclidean',
+                      n_jobs: Optional[int]=None) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Find distances to k nearest neighbours of each observation
+
+    Distances are squared for euclidean metric, as in the original t-SNE.
+    """
+    algorithm = 'auto' if metric == 'euclidean' else 'brute'
+    knn = NearestNeighbors(n_neighbors=k, metric=metric, algorithm=algorithm,
+                           n_jobs=parallel.effective_n_jobs(n_jobs))
+    knn.fit(data)
+    distances, neighbors = knn.kneighbors(None, n_neighbors=k)
+    if metric == 'euclidean':
+        distances **= 2
+    return distances, neighbors
+
+
+def _conditional_chunk(distances: np.ndarray, perplexity: float) -> np.ndarray:
+    target = np.log(perplexity)
+    beta = np.ones((distances.shape[0], 1))
+    lower = np.full_like(beta, -np.inf)
+    upper = np.full_like(beta, np.inf)
+    # shift by the nearest neighbour distance for numerical stability
+    shifted = distances - distances[:, :1]
+    for _ in range(_PERPLEXITY_STEPS):
+        weights = np.exp(-shifted * beta)
+        total = np.maximum(weights.sum(axis=1, keepdims=True), _EPSILON)
+        probabilities = weights / total
+        entropy = np.log(total) + beta * (shifted * probabilities).sum(
+            axis=1, keepdims=True)
+        difference = entropy - target
+        if np.all(np.abs(difference) <= _PERPLEXITY_TOLERANCE):
+            break
+        too_flat = difference > 0
+        lower = np.where(too_flat, beta, lower)
+        upper = np.where(too_flat, upper, beta)
+        increased = np.where(np.isinf(upper), beta * 2, (beta + upper) / 2)
+        decreased = np.where(np.isinf(lower), beta / 2, (beta + lower) / 2)
+        beta = np.where(too_flat, increased, decreased)
+    return probabilities
+
+
+def conditional_probabilities(distances: np.ndarray, perplexity: float) \
+        -> np.ndarray:
+    """Calibrate Gaussian kernels to the perplexity, row by row"""
+    return np.vstack([
+        _conditional_chunk(distances[start:start + _ROWS_PER_CHUNK],
+                           perplexity)
+        for start in range(0, distances.shape[0], _ROWS_PER_CHUNK)
+    ])
+
+
+def joint_probabilities(distances: np.ndarray, neighbors: np.ndarray,
+                        perplexity: float) -> sp.csr_matrix:
+    """Symmetric sparse input similarities P, summing up to one"""
+    n_samples, k = neighbors.shape
+    conditional = conditional_probabilities(distances, perplexity)
+    indptr = np.arange(0, n_samples * k + 1, k)
+    P = sp.csr_matrix((conditional.ravel(), neighbors.ravel(), indptr),
+                      shape=(n_samples, n_samples))
+    P = P + P.T
+    P /= max(P.sum(), _EPSILON)
+    P.sort_indices()
+    return P
+
+
+def affinities(data: np.ndarray, perplexity: float,
+               metric: str='euclidean',
+               n_jobs: Optional[int]=None) -> sp.csr_matrix:
+    """Compute input similarities P of observations"""
+    k = n_neighbors(data.shape[0], perplexity)
+    distances, neighbors = nearest_neighbors(data, k, metric, n_jobs)
+    return joint_probabilities(distances, neighbors, perplexity)
+
+
+EXACT = 'exact'
+APPROXIMATE = 'approximate'
+
+AffinityReport = NamedTuple('AffinityReport', [
+    ('neighbors', str),
+    ('n_trees', int),
+    ('recall', float),
+    ('seconds', float),
+])
+
+
+def affinity_stage(data: np.ndarray, perplexity: float,
+                   metric: str='euclidean', neighbors: str=EXACT,
+                   n_trees: int=ann.DEFAULT_TREES, random_state=None,
+                   n_jobs: Optional[int]=None, low_memory: bool=False) \
+        -> Tuple[sp.csr_matrix, AffinityReport]:
+    """Compute input similarities with exact or approximate neighbours
+
+    Approximate search falls back to the exact one for metrics it does not
+    support. Recall of approximate neighbours is measured on a sample.
+    In low memory mode exact neighbours are searched in chunks of data.
+    """
+    started = time.time()
+    k = n_neighbors(data.shape[0], perplexity)
+    if neighbors == APPROXIMATE and metric in ann.SUPPORTED_METRICS:
+        distances, indices = ann.approximate_nearest_neighbors(
+            data, k, metric, n_trees, random_state)
+        recall = ann.sampled_recall(data, indices, metric,
+                                    random_state=random_state)
+    elif neighbors in (EXACT, APPROXIMATE):
+        if low_memory and metric in ann.SUPPORTED_METRICS:
+            distances, indices = ann.chunked_nearest_neighbors(data, k,
+                                                               metric)
+        else:
+            distances, indices = nearest_neighbors(data, k, metric, n_jobs)
+        neighbors, n_trees, recall = EXACT, 0, 1.
+    else:
+        raise ValueError('Unknown neighbours search %s' % neighbors)
+    P = joint_probabilities(distances, indices, perplexity)
+    return P, AffinityReport(neighbors=neighbors, n_trees=n_trees,
+                             recall=recall, seconds=time.time() - started)
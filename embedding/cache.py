@@ -0,0 +1,152 @@
+"""Content-addressed cache of input similarities
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Entries are keyed by fingerprint of the spectra and all the parameters
+the similarities depend on, so they are shared between analyses differing
+in optimization parameters only. Least recently used entries are evicted
+when the cache exceeds its disk budget. Entries are written atomically, so
+the cache can be shared by concurrent workers.
+"""
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from spdata.common import _FILESYSTEM_ROOT as FILESYSTEM_ROOT
+
+from embedding.affinities import AffinityReport
+
+
+CACHE_ROOT = os.environ.get('TSNE_AFFINITY_CACHE', os.path.join(
+    FILESYSTEM_ROOT, 'cache', 'affinities'))
+CACHE_BUDGET = int(os.environ.get('TSNE_AFFINITY_CACHE_BYTES', 10 * 2 ** 30))
+_MATRIX = '.npz'
+_REPORT = '.json'
+_TEMPORARY = '.tmp'
+_FINGERPRINT_ROWS = 4096
+
+
+def fingerprint(data: np.ndarray) -> str:
+    """Digest of shape and content of an array in single precision
+
+    Dataset loaded in float64 and its float32 copy of low memory mode
+    have the same fingerprint, so they share cached similarities and
+    checkpoints.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps(list(data.shape)).encode())
+    for start in range(0, data.shape[0], _FINGERPRINT_ROWS):
+        block = np.ascontiguousarray(data[start:start + _FINGERPRINT_ROWS],
+                                     dtype=np.float32)
+        digest.update(block.data)
+    return digest.hexdigest()
+
+
+def affinity_key(data_fingerprint: str, **parameters) -> str:
+    """Cache key of similarities of data computed with given parameters"""
+    description = json.dumps({'data': data_fingerprint,
+                              'parameters': parameters}, sort_keys=True)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+class AffinityCache:
+    """Sparse input similarities stored on disk under a size budget"""
+    def __init__(self, root: str=CACHE_ROOT, budget: int=CACHE_BUDGET):
+        self.root = root
+        self.budget = budget
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> Optional[Tuple[sp.csr_matrix, AffinityReport]]:
+        """Load cached similarities and their report, marking them as used"""
+        path = self._path(key)
+        try:
+            with open(path + _REPORT) as report_file:
+                report = AffinityReport(**json.load(report_file))
+            P = sp.load_npz(path + _MATRIX).tocsr()
+            os.utime(path + _MATRIX)
+        except (OSError, ValueError, TypeError):
+            # missing, evicted in the meantime or incomplete entry
+            return None
+        return P, report
+
+    def put(self, key: str, P: sp.csr_matrix, report: AffinityReport):
+        """Store similarities and evict least recently used entries"""
+        path = self._path(key)
+        temporary_path = '%s.%i%s' % (path, os.getpid(), _TEMPORARY)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary_path + _REPORT, 'w') as report_file:
+            json.dump(report._asdict(), report_file)
+        os.replace(temporary_path + _REPORT, path + _REPORT)
+        sp.save_npz(temporary_path + _MATRIX, P)
+        os.replace(temporary_path + _MATRIX, path + _MATRIX)
+        self.evict()
+
+    def _entries(self) -> Dict[str, os.stat_result]:
+        entries = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(_MATRIX) and _TEMPORARY not in name:
+                    path = os.path.join(directory, name)[:-len(_MATRIX)]
+                    try:
+                        entries[path] = os.stat(path + _MATRIX)
+                    except OSError:
+                        pass
+        return entries
+
+    def size(self) -> int:
+        """Total size of cached matrices in bytes"""
+        return sum(stat.st_size for stat in self._entries().values())
+
+    def evict(self):
+        """Remove least recently used entries exceeding the budget"""
+        entries = self._entries()
+        total = sum(stat.st_size for stat in entries.values())
+        for path in sorted(entries, key=lambda entry: entries[entry].st_mtime):
+            if total <= self.budget:
+                break
+            for extension in (_MATRIX, _REPORT):
+                try:
+                    os.remove(path + extension)
+                except OSError:
+                    pass
+            total -= entries[path].st_size
+
+
+AFFINITIES = AffinityCache()
+
+
+def cached(cache: AffinityCache, key: str,
+           compute: Callable[[], Tuple[sp.csr_matrix, AffinityReport]]) \
+        -> Tuple[sp.csr_matrix, AffinityReport, bool]:
+    """Reuse cached similarities or compute and cache them
+
+    Returns:
+        similarities, their report and whether they were found in the cache
+    """
+    found = cache.get(key)
+    if found is not None:
+        return found + (True,)
+    P, report = compute()
+    try:
+        cache.put(key, P, report)
+    except OSError:  # analysis does not fail if the cache is not writable
+        pass
+    return P, report, False
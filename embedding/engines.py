@@ -0,0 +1,257 @@
+"""t-SNE implementations selected with the method parameter
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from contextlib import redirect_stdout
+from functools import partial
+import io
+import re
+import sys
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator
+from sklearn.decomposition import PCA
+from sklearn.manifold.t_sne import TSNE, _kl_divergence_bh
+from sklearn.utils import check_array, check_random_state
+
+from embedding import fft, optimizer
+from embedding.affinities import affinities as input_similarities
+
+
+_INITIAL_STD = 1e-4
+_PROGRESS_VERBOSITY = 2
+_ITERATION_LOG = re.compile(r'\[t-SNE\] Iteration (\d+): error = (\S+), '
+                           r'gradient norm = ([^\s,]+)')
+
+
+def _report(verbose: int, callback: Optional[optimizer.Callback],
+            progress: optimizer.Progress, embedding: np.ndarray):
+    if verbose:
+        print("[t-SNE] Iteration %d: error = %.7f, gradient norm = %.7f"
+              % progress)
+    if callback is not None:
+        callback(progress, embedding)
+
+
+class InterpolationTSNE(BaseEstimator):
+    """t-SNE with FFT-accelerated interpolation of repulsive forces
+
+    Accepts the parameters of sklearn.manifold.TSNE, so it can be used
+    interchangeably. Input similarities are computed for 3 * perplexity
+    nearest neighbours. Heavy-tailed Cauchy kernel is used in the embedding
+    space regardless of number of components. PCA initialization is
+    rescaled to the standard deviation of random initialization. Forces
+    are computed in n_jobs threads, as in scikit-learn.
+    """
+    def __init__(self, n_components=2, perplexity=30.0,
+                 early_exaggeration=12.0, learning_rate=200.0, n_iter=1000,
+                 n_iter_without_progress=300, min_grad_norm=1e-7,
+                 metric="euclidean", init="random", verbose=0,
+                 random_state=None, method='fft', angle=0.5, n_jobs=None):
+        self.n_components = n_components
+        self.perplexity = perplexity
+        self.early_exaggeration = early_exaggeration
+        self.learning_rate = learning_rate
+        self.n_iter = n_iter
+        self.n_iter_without_progress = n_iter_without_progress
+        self.min_grad_norm = min_grad_norm
+        self.metric = metric
+        self.init = init
+        self.verbose = verbose
+        self.random_state = random_state
+        self.method = method
+        self.angle = angle
+        self.n_jobs = n_jobs
+
+    def _initial_embedding(self, X: np.ndarray) -> np.ndarray:
+        random_state = check_random_state(self.random_state)
+        if self.init == 'pca':
+            pca = PCA(n_components=self.n_components, svd_solver='randomized',
+                      random_state=random_state)
+            embedding = pca.fit_transform(X)
+            return embedding / embedding[:, 0].std() * _INITIAL_STD
+        if self.init == 'random':
+            return _INITIAL_STD * random_state.randn(
+                X.shape[0], self.n_components)
+        raise ValueError("'init' must be 'pca' or 'random'")
+
+    def fit_transform(self, X, y=None, affinities=None,
+                      callback: Optional[optimizer.Callback]=None,
+                      checkpoint: Optional[optimizer.Checkpoint]=None,
+                      state: Optional[optimizer.State]=None) -> np.ndarray:
+        """Fit X into an embedded space and return that transformed output
+
+        Input similarities of X can be given as sparse affinities matrix.
+        Callback receives progress and embedding every 50 iterations, as
+        does checkpoint with the state of optimization. Interrupted
+        optimization is continued from the state, if given.
+        """
+        if self.n_components != fft.INTERPOLATED_DIMENSIONS:
+            raise ValueError("'n_components' should be 2 with method='fft'")
+        X = check_array(X, dtype=[np.float32, np.float64])
+        P = affinities
+        if P is None:
+            P = input_similarities(X, self.perplexity, self.metric,
+                                   self.n_jobs)
+        embedding = None if state is not None else self._initial_embedding(X)
+        embedding, error, n_iter = optimizer.gradient_descent(
+            P, embedding, n_iter=self.n_iter,
+            learning_rate=self.learning_rate,
+            early_exaggeration=self.early_exaggeration,
+            n_iter_without_progress=self.n_iter_without_progress,
+            min_grad_norm=self.min_grad_norm,
+            callback=partial(_report, self.verbose, callback),
+            checkpoint=checkpoint, state=state, n_jobs=self.n_jobs)
+        self.embedding_ = embedding
+        self.kl_divergence_ = error
+        self.n_iter_ = n_iter
+        return embedding
+
+    def fit(self, X, y=None):
+        """Fit X into an embedded space"""
+        self.fit_transform(X)
+        return self
+
+
+class _ProgressLog(io.TextIOBase):
+    """Stream passing text through, parsing iteration logs of scikit-learn"""
+    def __init__(self, stream, callback: optimizer.Callback):
+        self._stream = stream
+        self._callback = callback
+        self._line = ''
+
+    def write(self, text: str) -> int:
+        self._stream.write(text)
+        *lines, self._line = (self._line + text).split('\n')
+        for line in lines:
+            match = _ITERATION_LOG.search(line)
+            if match is not None:
+                iteration, error, grad_norm = match.groups()
+                self._callback(optimizer.Progress(
+                    int(iteration), float(error), float(grad_norm)), None)
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+
+class SklearnTSNE(TSNE):
+    """t-SNE of scikit-learn, optionally with precomputed input similarities
+
+    Precomputed affinities are used with the Barnes-Hut method only, as
+    the exact method requires dense input similarities. Barnes-Hut gradient
+    of scikit-learn is then optimized in the schedule of scikit-learn by
+    the optimizer module, so it can be checkpointed and resumed. Otherwise
+    progress is known only from the verbose output, so it is parsed from
+    the standard output, which makes the callback unsafe to use in
+    concurrent threads.
+    """
+    def _initial_embedding(self, X: np.ndarray) -> np.ndarray:
+        random_state = check_random_state(self.random_state)
+        if self.init == 'pca':
+            pca = PCA(n_components=self.n_components, svd_solver='randomized',
+                      random_state=random_state)
+            return pca.fit_transform(X).astype(np.float32, copy=False)
+        if self.init == 'random':
+            return _INITIAL_STD * random_state.randn(
+                X.shape[0], self.n_components).astype(np.float32)
+        raise ValueError("'init' must be 'pca' or 'random'")
+
+    def fit_transform(self, X, y=None, affinities=None,
+                      callback: Optional[optimizer.Callback]=None,
+                      checkpoint: Optional[optimizer.Checkpoint]=None,
+                      state: Optional[optimizer.State]=None) -> np.ndarray:
+        """Fit X into an embedded space and return that transformed output
+
+        Input similarities of X can be given as sparse affinities matrix.
+        With them, Barnes-Hut optimization reports progress and embedding
+        to callback and state to checkpoint every 50 iterations, and it is
+        continued from the state, if given. Otherwise callback receives
+        progress every 50 iterations, without embedding, while checkpoint
+        and state are ignored, as the loop of scikit-learn cannot be
+        checkpointed.
+        """
+        if affinities is not None and self.method == 'barnes_hut':
+            return self._descend(X, affinities, callback, checkpoint, state)
+        if callback is None:
+            return super().fit_transform(X)
+        verbose = self.verbose
+        self.verbose = max(verbose, _PROGRESS_VERBOSITY)
+        try:
+            with redirect_stdout(_ProgressLog(sys.stdout, callback)):
+                return super().fit_transform(X)
+        finally:
+            self.verbose = verbose
+
+    def _descend(self, X, P: sp.csr_matrix,
+                 callback: Optional[optimizer.Callback],
+                 checkpoint: Optional[optimizer.Checkpoint],
+                 state: Optional[optimizer.State]) -> np.ndarray:
+        X = check_array(X, dtype=[np.float32, np.float64])
+        degrees_of_freedom = max(self.n_components - 1.0, 1)
+        exaggerated = {1.: P}
+
+        def objective(Y: np.ndarray, exaggeration: float,
+                      compute_error: bool) -> Tuple[np.ndarray, float]:
+            if exaggeration not in exaggerated:
+                exaggerated[exaggeration] = P * exaggeration
+            error, grad = _kl_divergence_bh(
+                Y.ravel(), exaggerated[exaggeration], degrees_of_freedom,
+                Y.shape[0], Y.shape[1], angle=self.angle)
+            return grad.reshape(Y.shape), error
+
+        embedding = None
+        if state is None:
+            embedding = self._initial_embedding(X).astype(np.float64)
+        embedding, error, n_iter = optimizer.descend(
+            objective, embedding, n_iter=self.n_iter,
+            learning_rate=self.learning_rate,
+            early_exaggeration=self.early_exaggeration,
+            n_iter_without_progress=self.n_iter_without_progress,
+            min_grad_norm=self.min_grad_norm,
+            callback=partial(_report, self.verbose, callback),
+            checkpoint=checkpoint, state=state)
+        self.embedding_ = embedding
+        self.kl_divergence_ = error
+        self.n_iter_ = n_iter
+        return embedding
+
+
+ENGINES = {
+    'barnes_hut': SklearnTSNE,
+    'exact': SklearnTSNE,
+    'fft': InterpolationTSNE,
+}  # type: Dict[str, type]
+
+
+def create_engine(method: str='fft', n_jobs: Optional[int]=None,
+                  **kwargs):
+    """Build t-SNE estimator implementing the method
+
+    Number of threads is set for estimators supporting it only, as
+    Barnes-Hut gradient of scikit-learn 0.19 runs in a single thread.
+    The fft method is the default, since it computes the gradient in
+    the threads.
+    """
+    try:
+        engine = ENGINES[method]
+    except KeyError:
+        raise ValueError('Unknown t-SNE method %s' % method)
+    engine = engine(method=method, **kwargs)
+    if 'n_jobs' in engine.get_params():
+        engine.set_params(n_jobs=n_jobs)
+    return engine
@@ -0,0 +1,260 @@
+"""Interpolation-based repulsive forces of t-SNE
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Implements the approach of FIt-SNE (Linderman et al., "Fast interpolation-
+based t-SNE for improved visualization of single-cell RNA-seq data", 2019).
+The embedding is covered with a regular grid of boxes, each containing
+equispaced interpolation nodes. Charges of the points are spread onto the
+nodes with Lagrange polynomials, interactions between the nodes are a
+convolution computed with FFT, and potentials are interpolated back onto
+the points. This takes O(N) operations instead of O(N log N) of Barnes-Hut.
+Interpolation is used in two dimensions only, as the grid accurate for
+embeddings spanning tens of units takes minutes per gradient in three. Sums
+over few points or in three dimensions are computed exactly instead.
+
+All the sums use the kernel K^2, where K(y, y') = 1 / (1 + |y - y'|^2), and
+charges 1, y and |y|^2, since K = K^2 (1 + |y|^2 - 2 y.y' + |y'|^2).
+"""
+from concurrent.futures import Executor
+from functools import lru_cache
+from itertools import product
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+N_INTERPOLATION_POINTS = 3
+INTERVALS_PER_UNIT = 1.
+BOXES_RANGE = (50, 200)
+INTERPOLATED_DIMENSIONS = 2
+EXACT_N_SAMPLES = 1000
+MAX_NODES_PER_POINT = 20
+# box widths are rounded up to powers of 2 ** (1 / levels), so the kernel
+# of the grid is the same over many iterations
+WIDTH_LEVELS_PER_OCTAVE = 8
+_BLOCK_SIZE = 512
+
+
+def _fast_size(n: int) -> int:
+    """Smallest 5-smooth integer not lower than n, for which FFT is fast"""
+    while True:
+        remainder = n
+        for factor in (2, 3, 5):
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return n
+        n += 1
+
+
+def _lagrange_weights(relative: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    weights = np.ones((relative.size, nodes.size))
+    for a, node in enumerate(nodes):
+        for other in np.delete(nodes, a):
+            weights[:, a] *= (relative - other) / (node - other)
+    return weights
+
+
+def _squared_kernel(n_nodes: int, spacing: float, dimensions: int) \
+        -> np.ndarray:
+    size = 2 * n_nodes
+    offsets = np.arange(size, dtype=float)
+    offsets[n_nodes:] -= size
+    offsets *= spacing
+    squared_distance = np.zeros((size,) * dimensions)
+    for axis in range(dimensions):
+        shape = [1] * dimensions
+        shape[axis] = size
+        squared_distance = squared_distance + offsets.reshape(shape) ** 2
+    kernel = 1. / (1. + squared_distance) ** 2
+    # wrap-around offset never corresponds to a pair of nodes
+    for axis in range(dimensions):
+        index = [slice(None)] * dimensions
+        index[axis] = n_nodes
+        kernel[tuple(index)] = 0
+    return kernel
+
+
+@lru_cache(maxsize=4)
+def _kernel_hat(n_nodes: int, spacing: float, dimensions: int) -> np.ndarray:
+    kernel_hat = np.fft.rfftn(_squared_kernel(n_nodes, spacing, dimensions))
+    kernel_hat.flags.writeable = False
+    return kernel_hat
+
+
+def _box_width(span: float, n_boxes: int) -> float:
+    level = np.ceil(np.log2(span / n_boxes) * WIDTH_LEVELS_PER_OCTAVE)
+    return float(2. ** (level / WIDTH_LEVELS_PER_OCTAVE))
+
+
+class Interpolation:
+    """Spreading of point values onto grid nodes and back
+
+    There are as many boxes as needed for the box width of
+    1 / INTERVALS_PER_UNIT within BOXES_RANGE. Its lower bound is reduced
+    for few points, up to MAX_NODES_PER_POINT grid nodes per point.
+    """
+    def __init__(self, Y: np.ndarray):
+        n_samples, dimensions = Y.shape
+        lower = Y.min(axis=0)
+        span = max(float((Y.max(axis=0) - lower).max()), 1e-6) * (1 + 1e-9)
+        p = N_INTERPOLATION_POINTS
+        min_boxes, max_boxes = BOXES_RANGE
+        min_boxes = min(min_boxes, int(np.ceil(
+            (MAX_NODES_PER_POINT * n_samples) ** (1. / dimensions) / p)))
+        n_boxes = _fast_size(int(np.clip(np.ceil(span * INTERVALS_PER_UNIT),
+                                         min_boxes, max_boxes)))
+        box_width = _box_width(span, n_boxes)
+        self.dimensions = dimensions
+        self.n_nodes = n_boxes * p
+        self.spacing = box_width / p
+        scaled = (Y - lower) / box_width
+        boxes = np.clip(np.floor(scaled).astype(np.int64), 0, n_boxes - 1)
+        nodes = (np.arange(p) + .5) / p
+        weights = [_lagrange_weights(scaled[:, axis] - boxes[:, axis], nodes)
+                   for axis in range(dimensions)]
+        flat_nodes, flat_weights = [], []
+        for combination in product(range(p), repeat=dimensions):
+            node = np.zeros(n_samples, dtype=np.int64)
+            weight = np.ones(n_samples)
+            for axis, a in enumerate(combination):
+                node = node * self.n_nodes + boxes[:, axis] * p + a
+                weight = weight * weights[axis][:, a]
+            flat_nodes.append(node)
+            flat_weights.append(weight)
+        self.nodes = np.stack(flat_nodes, axis=1)
+        self.weights = np.stack(flat_weights, axis=1)
+
+    def spread(self, charges: np.ndarray) -> np.ndarray:
+        """Accumulate charges of points on the grid nodes"""
+        grid = np.bincount(self.nodes.ravel(),
+                           weights=(self.weights * charges[:, None]).ravel(),
+                           minlength=self.n_nodes ** self.dimensions)
+        return grid.reshape((self.n_nodes,) * self.dimensions)
+
+    def gather(self, grid: np.ndarray) -> np.ndarray:
+        """Interpolate grid values at the points"""
+        return (grid.ravel()[self.nodes] * self.weights).sum(axis=1)
+
+
+def _convolve(kernel_hat: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    shape = kernel_hat.shape[:-1] + ((kernel_hat.shape[-1] - 1) * 2,)
+    axes = tuple(range(grid.ndim))
+    padded_hat = np.fft.rfftn(grid, s=shape, axes=axes)
+    potentials = np.fft.irfftn(padded_hat * kernel_hat, s=shape, axes=axes)
+    return potentials[tuple(slice(0, n) for n in grid.shape)]
+
+
+def charges_of(Y: np.ndarray) -> np.ndarray:
+    """Charges of points: 1, coordinates and squared norm"""
+    return np.column_stack([np.ones(Y.shape[0]), Y, (Y ** 2).sum(axis=1)])
+
+
+def interpolated(Y: np.ndarray) -> bool:
+    """Whether sums over the points are interpolated on a grid"""
+    return Y.shape[1] == INTERPOLATED_DIMENSIONS \
+        and Y.shape[0] > EXACT_N_SAMPLES
+
+
+def exact_kernel_sums(targets: np.ndarray, sources: np.ndarray,
+                      charges: np.ndarray,
+                      executor: Optional[Executor]=None) -> np.ndarray:
+    """sum_j K(t_i, s_j)^2 * charge_j for each charge column
+
+    Targets are processed in blocks, concurrently if executor is given.
+    """
+    source_norms = (sources ** 2).sum(axis=1)
+
+    def block_sums(start: int) -> np.ndarray:
+        block = targets[start:start + _BLOCK_SIZE]
+        squared_distance = (block ** 2).sum(axis=1)[:, None] \
+            + source_norms[None, :] - 2 * block.dot(sources.T)
+        np.maximum(squared_distance, 0., out=squared_distance)
+        kernel = 1. / (1. + squared_distance)
+        kernel *= kernel
+        return kernel.dot(charges)
+
+    starts = range(0, targets.shape[0], _BLOCK_SIZE)
+    blocks = map(block_sums, starts) if executor is None \
+        else executor.map(block_sums, starts)
+    return np.vstack(list(blocks) or [np.empty((0, charges.shape[1]))])
+
+
+def kernel_sums(Y: np.ndarray, charges: np.ndarray,
+                executor: Optional[Executor]=None) -> np.ndarray:
+    """Approximate sum_j K(y_i, y_j)^2 * charge_j for each charge column
+
+    The sums are exact, unless interpolated. Charge columns are processed
+    concurrently, if executor is given.
+    """
+    if not interpolated(Y):
+        return exact_kernel_sums(Y, Y, charges, executor)
+    interpolation = Interpolation(Y)
+    kernel_hat = _kernel_hat(interpolation.n_nodes, interpolation.spacing,
+                             interpolation.dimensions)
+
+    def potential(charge: np.ndarray) -> np.ndarray:
+        return interpolation.gather(_convolve(kernel_hat,
+                                              interpolation.spread(charge)))
+
+    columns = charges.T
+    if executor is None:
+        return np.column_stack([potential(charge) for charge in columns])
+    return np.column_stack(list(executor.map(potential, columns)))
+
+
+def repulsive_forces(Y: np.ndarray, executor: Optional[Executor]=None) \
+        -> Tuple[np.ndarray, float]:
+    """Unnormalized repulsive forces and normalization term Z
+
+    Returns:
+        sum_j K(y_i, y_j)^2 (y_i - y_j) for each i, and
+        Z = sum_{i != j} K(y_i, y_j)
+    """
+    dimensions = Y.shape[1]
+    potentials = kernel_sums(Y, charges_of(Y), executor)
+    squared_norm = (Y ** 2).sum(axis=1)
+    forces = Y * potentials[:, :1] - potentials[:, 1:1 + dimensions]
+    kernel_total = (1 + squared_norm) * potentials[:, 0] \
+        - 2 * (Y * potentials[:, 1:1 + dimensions]).sum(axis=1) \
+        + potentials[:, -1]
+    normalization = float(kernel_total.sum()) - Y.shape[0]
+    return forces, normalization
+
+
+def repulsive_forces_between(sources: np.ndarray, targets: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Unnormalized repulsive forces exerted by sources on targets
+
+    Returns:
+        sum_j K(t_i, s_j)^2 (t_i - s_j) and Z_i = sum_j K(t_i, s_j) for each
+        target t_i, where s_j are the sources
+    """
+    dimensions = targets.shape[1]
+    Y = np.vstack([sources, targets])
+    if interpolated(Y):
+        charges = charges_of(Y)
+        charges[sources.shape[0]:] = 0.
+        potentials = kernel_sums(Y, charges)[sources.shape[0]:]
+    else:
+        potentials = exact_kernel_sums(targets, sources, charges_of(sources))
+    squared_norm = (targets ** 2).sum(axis=1)
+    forces = targets * potentials[:, :1] \
+        - potentials[:, 1:1 + dimensions]
+    normalization = (1 + squared_norm) * potentials[:, 0] \
+        - 2 * (targets * potentials[:, 1:1 + dimensions]).sum(axis=1) \
+        + potentials[:, -1]
+    return forces, normalization
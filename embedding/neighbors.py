@@ -0,0 +1,227 @@
+"""Approximate nearest neighbours search with random projection forest
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Each tree splits observations recursively into halves along the direction
+between two random observations, until leaves are small. Neighbours are
+searched exhaustively within the leaves, and the closest ones found in any
+tree are kept. More trees give higher recall at proportionally higher cost.
+
+Cosine and correlation distances are monotonic in euclidean distance of
+normalized (and centered) observations, so the search runs in that space.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.utils import check_random_state
+
+
+SUPPORTED_METRICS = ('euclidean', 'cosine', 'correlation')
+DEFAULT_TREES = 10
+RECALL_SAMPLE = 1000
+CHUNK_ROWS = 4096
+_CHUNK_ELEMENTS = 2 ** 24
+
+
+def _search_space(data: np.ndarray, metric: str) -> np.ndarray:
+    """Observations transformed for euclidean search, float32 kept"""
+    points = np.asarray(data, dtype=np.result_type(data.dtype, np.float32))
+    if metric == 'correlation':
+        points = points - points.mean(axis=1, keepdims=True)
+    if metric in ('cosine', 'correlation'):
+        norms = np.linalg.norm(points, axis=1, keepdims=True)
+        points = points / np.where(norms > 0, norms, 1.)
+    return points
+
+
+def _metric_distances(squared: np.ndarray, metric: str) -> np.ndarray:
+    """Distances in the metric from squared euclidean in search space
+
+    Euclidean distances stay squared, as in the original t-SNE.
+    """
+    if metric in ('cosine', 'correlation'):
+        return squared / 2.
+    return squared
+
+
+def _leaves(points: np.ndarray, leaf_size: int,
+            random_state: np.random.RandomState):
+    pending = [np.arange(points.shape[0])]
+    while pending:
+        members = pending.pop()
+        if members.size <= leaf_size:
+            yield members
+            continue
+        first, second = points[random_state.choice(members, 2, replace=False)]
+        # halves are balanced, so every leaf holds over leaf_size / 2 members
+        order = np.argsort(points[members].dot(first - second))
+        half = members.size // 2
+        pending.append(members[order[:half]])
+        pending.append(members[order[half:]])
+
+
+def _squared_norms(points: np.ndarray) -> np.ndarray:
+    return np.einsum('ij,ij->i', points, points)
+
+
+def _squared_distances(first: np.ndarray, second: np.ndarray,
+                       second_norms: Optional[np.ndarray]=None) \
+        -> np.ndarray:
+    if second_norms is None:
+        second_norms = _squared_norms(second)
+    squared = _squared_norms(first)[:, None] + second_norms[None, :] \
+        - 2 * first.dot(second.T)
+    return np.maximum(squared, 0.)
+
+
+def _smallest(values: np.ndarray, k: int) -> np.ndarray:
+    """Positions of k smallest values in each row, in arbitrary order"""
+    if k >= values.shape[1]:
+        return np.repeat(np.arange(values.shape[1])[None, :], values.shape[0],
+                         axis=0)
+    return np.argpartition(values, k - 1, axis=1)[:, :k]
+
+
+def _closest(distances: np.ndarray, indices: np.ndarray, k: int) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    rows = np.arange(distances.shape[0])[:, None]
+    # the same neighbour found in several trees is considered once
+    by_index = np.argsort(indices, axis=1)
+    indices, distances = indices[rows, by_index], distances[rows, by_index]
+    duplicate = np.zeros(indices.shape, dtype=bool)
+    duplicate[:, 1:] = indices[:, 1:] == indices[:, :-1]
+    distances[duplicate] = np.inf
+    selected = _smallest(distances, k)
+    return distances[rows, selected], indices[rows, selected]
+
+
+def _tree_neighbors(points: np.ndarray, k: int, leaf_size: int,
+                    random_state: np.random.RandomState) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    n_samples = points.shape[0]
+    distances = np.full((n_samples, k), np.inf)
+    indices = np.full((n_samples, k), -1, dtype=np.int64)
+    for members in _leaves(points, leaf_size, random_state):
+        leaf = points[members]
+        squared = _squared_distances(leaf, leaf)
+        np.fill_diagonal(squared, np.inf)
+        found = min(k, members.size)
+        selected = _smallest(squared, found)
+        rows = np.arange(members.size)[:, None]
+        distances[members, :found] = squared[rows, selected]
+        indices[members, :found] = members[selected]
+    return distances, indices
+
+
+def approximate_nearest_neighbors(data: np.ndarray, k: int,
+                                  metric: str='euclidean',
+                                  n_trees: int=DEFAULT_TREES,
+                                  random_state=None) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Find distances to approximate k nearest neighbours of observations
+
+    Returns distances and indices of neighbours sorted by distance, in the
+    same format as affinities.nearest_neighbors.
+    """
+    if metric not in SUPPORTED_METRICS:
+        raise ValueError('Approximate search does not support %s metric'
+                         % metric)
+    random_state = check_random_state(random_state)
+    points = _search_space(data, metric)
+    leaf_size = 2 * (k + 1)
+    distances = np.full((points.shape[0], k), np.inf)
+    indices = np.full((points.shape[0], k), -1, dtype=np.int64)
+    for _ in range(n_trees):
+        found_distances, found_indices = _tree_neighbors(
+            points, k, leaf_size, random_state)
+        distances, indices = _closest(
+            np.hstack([distances, found_distances]),
+            np.hstack([indices, found_indices]), k)
+    rows = np.arange(points.shape[0])[:, None]
+    order = np.argsort(distances, axis=1, kind='mergesort')
+    return _metric_distances(distances[rows, order], metric), \
+        indices[rows, order]
+
+
+def chunked_nearest_neighbors(data: np.ndarray, k: int,
+                              metric: str='euclidean',
+                              chunk_rows: int=CHUNK_ROWS) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Find distances to exact k nearest neighbours in bounded memory
+
+    Distances are computed in float32 between blocks of chunk_rows rows,
+    so memory-mapped data is never loaded whole. Returns distances and
+    indices sorted by distance, as approximate_nearest_neighbors.
+    """
+    if metric not in SUPPORTED_METRICS:
+        raise ValueError('Chunked search does not support %s metric' % metric)
+    n_samples = data.shape[0]
+    distances = np.empty((n_samples, k))
+    indices = np.empty((n_samples, k), dtype=np.int64)
+    for start in range(0, n_samples, chunk_rows):
+        rows = _search_space(
+            np.asarray(data[start:start + chunk_rows], dtype=np.float32),
+            metric)
+        found = np.full((rows.shape[0], k), np.inf, dtype=np.float32)
+        found_indices = np.full((rows.shape[0], k), -1, dtype=np.int64)
+        for other in range(0, n_samples, chunk_rows):
+            columns = _search_space(np.asarray(
+                data[other:other + chunk_rows], dtype=np.float32), metric)
+            squared = _squared_distances(rows, columns)
+            own = np.arange(max(start, other),
+                            min(start + rows.shape[0],
+                                other + columns.shape[0]))
+            squared[own - start, own - other] = np.inf
+            block = np.arange(rows.shape[0])[:, None]
+            nearest = _smallest(squared, k)
+            merged_distances = np.hstack([found, squared[block, nearest]])
+            merged_indices = np.hstack([found_indices, nearest + other])
+            selected = _smallest(merged_distances, k)
+            found = merged_distances[block, selected]
+            found_indices = merged_indices[block, selected]
+        order = np.argsort(found, axis=1, kind='mergesort')
+        block = np.arange(rows.shape[0])[:, None]
+        distances[start:start + rows.shape[0]] = found[block, order]
+        indices[start:start + rows.shape[0]] = found_indices[block, order]
+    return _metric_distances(distances, metric), indices
+
+
+def exact_neighbors_of(data: np.ndarray, rows: np.ndarray, k: int,
+                       metric: str='euclidean') -> np.ndarray:
+    """Indices of exact k nearest neighbours of selected observations"""
+    points = _search_space(data, metric)
+    norms = _squared_norms(points)
+    chunk = max(1, _CHUNK_ELEMENTS // points.shape[0])
+    neighbors = []
+    for start in range(0, rows.size, chunk):
+        selected = rows[start:start + chunk]
+        squared = _squared_distances(points[selected], points, norms)
+        squared[np.arange(selected.size), selected] = np.inf
+        neighbors.append(_smallest(squared, k))
+    return np.vstack(neighbors)
+
+
+def sampled_recall(data: np.ndarray, indices: np.ndarray,
+                   metric: str='euclidean', sample_size: int=RECALL_SAMPLE,
+                   random_state=None) -> float:
+    """Fraction of true nearest neighbours found, estimated on a sample"""
+    random_state = check_random_state(random_state)
+    n_samples, k = indices.shape
+    rows = random_state.choice(n_samples, min(sample_size, n_samples),
+                               replace=False)
+    exact = exact_neighbors_of(data, rows, k, metric)
+    found = sum(np.intersect1d(approximate, true).size
+                for approximate, true in zip(indices[rows], exact))
+    return found / float(rows.size * k)
@@ -0,0 +1,216 @@
+"""Gradient descent minimizing Kullback-Leibler divergence of t-SNE
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Follows the schedule of scikit-learn: early exaggeration with momentum 0.5
+for the first 250 iterations, then momentum 0.8, with adaptive gains.
+"""
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from embedding import fft, parallel
+
+
+EXPLORATION_N_ITER = 250
+N_ITER_CHECK = 50
+MIN_GAIN = .01
+_EPSILON = np.finfo(np.double).eps
+
+Repulsion = Callable[[np.ndarray], Tuple[np.ndarray, float]]
+Attraction = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+# gradient and divergence, if requested, at embedding with exaggeration
+Objective = Callable[[np.ndarray, float, bool],
+                     Tuple[np.ndarray, Optional[float]]]
+
+Progress = NamedTuple('Progress', [
+    ('iteration', int),
+    ('error', float),
+    ('grad_norm', float),
+])
+
+Callback = Callable[[Progress, Optional[np.ndarray]], None]
+
+State = NamedTuple('State', [
+    ('embedding', np.ndarray),
+    ('update', np.ndarray),
+    ('gains', np.ndarray),
+    ('iteration', int),
+    ('best_error', float),
+    ('best_iteration', int),
+])
+
+Checkpoint = Callable[[State], None]
+
+
+def attractive_forces(P: sp.csr_matrix, Y: np.ndarray,
+                      rows: slice=slice(None)) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Sum of p_ij K(y_i, y_j) (y_i - y_j) and K(y_i, y_j) at nonzeros of P
+
+    P may hold only the given rows of similarities.
+    """
+    row_lengths = np.diff(P.indptr)
+    squared_distance = np.zeros(P.indices.size)
+    for coordinate in np.ascontiguousarray(Y.T):
+        difference = np.repeat(coordinate[rows], row_lengths)
+        difference -= coordinate[P.indices]
+        difference *= difference
+        squared_distance += difference
+    kernel = 1. / (1. + squared_distance)
+    weights = sp.csr_matrix((P.data * kernel, P.indices, P.indptr),
+                            shape=P.shape)
+    forces = np.asarray(weights.sum(axis=1)) * Y[rows] - weights.dot(Y)
+    return forces, kernel
+
+
+def parallel_attraction(P: sp.csr_matrix, executor: Executor,
+                        n_blocks: int) -> Attraction:
+    """Attractive forces computed concurrently for blocks of rows of P"""
+    blocks = [(P[rows], rows) for rows
+              in parallel.row_blocks(P.shape[0], n_blocks)]
+
+    def attraction(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        forces, kernels = zip(*executor.map(
+            lambda block: attractive_forces(block[0], Y, block[1]), blocks))
+        return np.vstack(forces), np.concatenate(kernels)
+
+    return attraction
+
+
+def kl_divergence(P: sp.csr_matrix, kernel: np.ndarray,
+                  normalization: float) -> float:
+    """KL(P || Q) from kernel values at nonzeros of P"""
+    p = P.data
+    return float(np.dot(p, np.log(np.maximum(p, _EPSILON)
+                                  / np.maximum(kernel, _EPSILON)))
+                 + np.log(max(normalization, _EPSILON)))
+
+
+def gradient(P: sp.csr_matrix, Y: np.ndarray, exaggeration: float=1.,
+             repulsion: Repulsion=fft.repulsive_forces,
+             compute_error: bool=True,
+             attraction: Optional[Attraction]=None) \
+        -> Tuple[np.ndarray, Optional[float]]:
+    """Gradient of KL divergence and the divergence itself, if requested"""
+    if attraction is None:
+        attraction = partial(attractive_forces, P)
+    attractive, kernel = attraction(Y)
+    repulsive, normalization = repulsion(Y)
+    grad = 4. * (exaggeration * attractive
+                 - repulsive / max(normalization, _EPSILON))
+    if not compute_error:
+        return grad, None
+    return grad, kl_divergence(P, kernel, normalization)
+
+
+def gradient_descent(P: sp.csr_matrix, Y: np.ndarray, n_iter: int,
+                     learning_rate: float=200., early_exaggeration: float=12.,
+                     n_iter_without_progress: int=300,
+                     min_grad_norm: float=1e-7,
+                     repulsion: Optional[Repulsion]=None,
+                     callback: Optional[Callback]=None,
+                     checkpoint: Optional[Checkpoint]=None,
+                     state: Optional[State]=None,
+                     n_jobs: Optional[int]=None) \
+        -> Tuple[np.ndarray, float, int]:
+    """Optimize embedding Y in place
+
+    If state of interrupted optimization is given, it is continued from the
+    state instead, and Y is ignored. Checkpoint receives the state on every
+    check of progress, except the last iteration. Forces are computed in
+    n_jobs threads, as in parallel.effective_n_jobs; repulsion defaults to
+    fft.repulsive_forces.
+
+    Returns:
+        embedding, final KL divergence and number of performed iterations
+    """
+    n_jobs = parallel.effective_n_jobs(n_jobs)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        executor = executor if n_jobs > 1 else None
+        if repulsion is None:
+            repulsion = partial(fft.repulsive_forces, executor=executor)
+        attraction = None
+        if executor is not None:
+            attraction = parallel_attraction(P, executor, n_jobs)
+
+        def objective(Y: np.ndarray, exaggeration: float,
+                      compute_error: bool):
+            return gradient(P, Y, exaggeration, repulsion, compute_error,
+                            attraction)
+
+        return descend(objective, Y, n_iter, learning_rate,
+                       early_exaggeration, n_iter_without_progress,
+                       min_grad_norm, callback, checkpoint, state)
+
+
+def descend(objective: Objective, Y: np.ndarray, n_iter: int,
+            learning_rate: float=200., early_exaggeration: float=12.,
+            n_iter_without_progress: int=300, min_grad_norm: float=1e-7,
+            callback: Optional[Callback]=None,
+            checkpoint: Optional[Checkpoint]=None,
+            state: Optional[State]=None) -> Tuple[np.ndarray, float, int]:
+    """Optimize embedding Y in place with gradient of the objective
+
+    Schedule, progress, checkpoints and state are as in gradient_descent,
+    so any gradient of t-SNE can be checkpointed and resumed.
+    """
+    if state is None:
+        update = np.zeros_like(Y)
+        gains = np.ones_like(Y)
+        start, best_error, best_iteration = 0, np.inf, 0
+    else:
+        Y, update, gains = [np.array(array, dtype=float) for array
+                            in (state.embedding, state.update, state.gains)]
+        start = state.iteration
+        best_error, best_iteration = state.best_error, state.best_iteration
+    error = np.inf
+    iteration = start - 1
+    for iteration in range(start, n_iter):
+        exploring = iteration < EXPLORATION_N_ITER
+        if iteration == EXPLORATION_N_ITER:  # new descent in scikit-learn
+            update[:] = 0.
+            gains[:] = 1.
+            best_error, best_iteration = np.inf, iteration
+        exaggeration = early_exaggeration if exploring else 1.
+        momentum = .5 if exploring else .8
+        checking = not (iteration + 1) % N_ITER_CHECK \
+            or iteration + 1 == n_iter
+        grad, error = objective(Y, exaggeration, checking)
+        increasing = update * grad < 0.
+        gains[increasing] += .2
+        gains[~increasing] *= .8
+        np.clip(gains, MIN_GAIN, np.inf, out=gains)
+        grad *= gains
+        update = momentum * update - learning_rate * grad
+        Y += update
+        if not checking:
+            continue
+        grad_norm = float(np.linalg.norm(grad))
+        if callback is not None:
+            callback(Progress(iteration + 1, error, grad_norm), Y)
+        if error < best_error:
+            best_error, best_iteration = error, iteration
+        elif iteration - best_iteration > n_iter_without_progress:
+            break
+        if grad_norm <= min_grad_norm:
+            break
+        if checkpoint is not None and iteration + 1 < n_iter:
+            checkpoint(State(Y, update, gains, iteration + 1, best_error,
+                             best_iteration))
+    return Y, error, iteration + 1
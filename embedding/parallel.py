@@ -0,0 +1,86 @@
+"""Threads available for computations of a worker
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Number of CPUs is limited by the affinity mask of the process and by the
+CFS quota of its control group (cgroup v2 cpu.max or cgroup v1
+cpu.cfs_quota_us), as set by container runtimes. Computations run in
+threads, as numpy and scipy release the GIL in the heavy loops, and
+Celery workers are daemonic processes, which cannot fork.
+"""
+import math
+import os
+from typing import List, Optional
+
+_CGROUP_V2 = '/sys/fs/cgroup/cpu.max'
+_CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+_CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota() -> Optional[float]:
+    """Number of CPUs the control group may use, None if unlimited"""
+    limit = _read(_CGROUP_V2)
+    if limit is not None:
+        quota, _, period = limit.partition(' ')
+        if quota == 'max' or not period:
+            return None
+        return int(quota) / int(period)
+    quota, period = _read(_CGROUP_V1_QUOTA), _read(_CGROUP_V1_PERIOD)
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def available_cpus() -> int:
+    """Number of CPUs the process may use"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(int(math.floor(quota)), 1))
+    return cpus
+
+
+def effective_n_jobs(n_jobs: Optional[int]=None) -> int:
+    """Number of threads to use, as in scikit-learn, within CPU limits
+
+    None means 1 and negative values count back from all the available
+    CPUs, so -1 uses all of them.
+    """
+    available = available_cpus()
+    if n_jobs is None:
+        return 1
+    if n_jobs == 0:
+        raise ValueError('n_jobs == 0 has no meaning')
+    if n_jobs < 0:
+        return max(available + 1 + n_jobs, 1)
+    return min(n_jobs, available)
+
+
+def row_blocks(n_rows: int, n_blocks: int) -> List[slice]:
+    """Split rows into at most n_blocks contiguous blocks of similar size"""
+    bounds = [n_rows * block // n_blocks for block in range(n_blocks + 1)]
+    return [slice(start, stop) for start, stop in zip(bounds, bounds[1:])
+            if stop > start]
@@ -0,0 +1,116 @@
+"""Dimensionality reduction of spectra before t-SNE
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Principal components are found with randomized SVD (Halko et al., "Finding
+structure with randomness", 2011). Spectra are read in blocks of rows and
+centered on the fly, so memory-mapped datasets are never loaded as a whole
+and no centered copy of the data is made. Computations run in float32.
+"""
+from typing import NamedTuple, Tuple
+
+import numpy as np
+from sklearn.utils import check_random_state
+
+
+OVERSAMPLES = 10
+POWER_ITERATIONS = 4
+CHUNK_ROWS = 4096
+_DTYPE = np.float32
+
+Projection = NamedTuple('Projection', [
+    ('mean', np.ndarray),
+    ('components', np.ndarray),
+    ('explained_variance', np.ndarray),
+    ('explained_variance_ratio', np.ndarray),
+])
+
+
+def _blocks(data: np.ndarray, chunk_rows: int):
+    for start in range(0, data.shape[0], chunk_rows):
+        yield start, np.asarray(data[start:start + chunk_rows], dtype=_DTYPE)
+
+
+def _moments(data: np.ndarray, chunk_rows: int) -> Tuple[np.ndarray, float]:
+    """Mean spectrum and total variance of spectra"""
+    total = np.zeros(data.shape[1], dtype=np.float64)
+    for _, block in _blocks(data, chunk_rows):
+        total += block.sum(axis=0, dtype=np.float64)
+    mean = total / data.shape[0]
+    squares = 0.
+    for _, block in _blocks(data, chunk_rows):
+        squares += float(((block - mean.astype(_DTYPE)) ** 2).sum(
+            dtype=np.float64))
+    return mean.astype(_DTYPE), squares / max(data.shape[0] - 1, 1)
+
+
+def _centered_product(data: np.ndarray, mean: np.ndarray, matrix: np.ndarray,
+                      chunk_rows: int) -> np.ndarray:
+    """(X - mean) M"""
+    result = np.empty((data.shape[0], matrix.shape[1]), dtype=_DTYPE)
+    shift = mean.dot(matrix)
+    for start, block in _blocks(data, chunk_rows):
+        result[start:start + block.shape[0]] = block.dot(matrix) - shift
+    return result
+
+
+def _centered_transposed_product(data: np.ndarray, mean: np.ndarray,
+                                 matrix: np.ndarray,
+                                 chunk_rows: int) -> np.ndarray:
+    """(X - mean)^T M"""
+    result = np.zeros((data.shape[1], matrix.shape[1]), dtype=_DTYPE)
+    for start, block in _blocks(data, chunk_rows):
+        result += block.T.dot(matrix[start:start + block.shape[0]])
+    return result - np.outer(mean, matrix.sum(axis=0))
+
+
+def randomized_pca(data: np.ndarray, n_components: int, random_state=None,
+                   chunk_rows: int=CHUNK_ROWS) \
+        -> Tuple[Projection, np.ndarray]:
+    """Find principal components of spectra and project spectra onto them
+
+    Returns:
+        projection and float32 spectra in the space of principal components
+    """
+    n_samples, n_features = data.shape
+    n_components = min(n_components, n_samples, n_features)
+    random_state = check_random_state(random_state)
+    mean, total_variance = _moments(data, chunk_rows)
+    n_random = min(n_components + OVERSAMPLES, n_samples, n_features)
+    sketch = random_state.normal(size=(n_features, n_random)).astype(_DTYPE)
+    basis, _ = np.linalg.qr(
+        _centered_product(data, mean, sketch, chunk_rows))
+    for _ in range(POWER_ITERATIONS):
+        transposed, _ = np.linalg.qr(
+            _centered_transposed_product(data, mean, basis, chunk_rows))
+        basis, _ = np.linalg.qr(
+            _centered_product(data, mean, transposed, chunk_rows))
+    reduced = _centered_transposed_product(data, mean, basis, chunk_rows).T
+    _, singular, right = np.linalg.svd(reduced, full_matrices=False)
+    explained_variance = singular[:n_components] ** 2 / max(n_samples - 1, 1)
+    total_variance = max(total_variance, np.finfo(_DTYPE).eps)
+    projection = Projection(
+        mean=mean,
+        components=right[:n_components],
+        explained_variance=explained_variance,
+        explained_variance_ratio=explained_variance / total_variance)
+    return projection, transform(projection, data, chunk_rows)
+
+
+def transform(projection: Projection, data: np.ndarray,
+              chunk_rows: int=CHUNK_ROWS) -> np.ndarray:
+    """Project spectra onto stored principal components"""
+    return _centered_product(data, projection.mean, projection.components.T,
+                             chunk_rows)
@@ -0,0 +1,119 @@
+"""Placement of new observations into an existing embedding
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+New observations are placed at the mean position of their nearest reference
+observations, weighted with Gaussian similarities calibrated to perplexity,
+as in openTSNE (Policar et al., "openTSNE: a modular Python library for
+t-SNE dimensionality reduction and embedding", 2019). The placement can be
+refined by optimizing KL divergence of each new observation independently,
+with the reference embedding fixed.
+"""
+from typing import Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.neighbors import NearestNeighbors
+
+from embedding import affinities, fft, optimizer
+
+
+DEFAULT_PERPLEXITY = 5.
+DEFAULT_LEARNING_RATE = 1.
+_EPSILON = np.finfo(np.double).eps
+
+
+def reference_affinities(reference: np.ndarray, data: np.ndarray,
+                         perplexity: float=DEFAULT_PERPLEXITY,
+                         metric: str='euclidean') -> sp.csr_matrix:
+    """Similarities of new observations to reference ones, rows sum to one"""
+    k = min(reference.shape[0], int(3. * perplexity + 1))
+    algorithm = 'auto' if metric == 'euclidean' else 'brute'
+    knn = NearestNeighbors(n_neighbors=k, metric=metric, algorithm=algorithm)
+    knn.fit(reference)
+    distances, neighbors = knn.kneighbors(data)
+    if metric == 'euclidean':
+        distances **= 2
+    conditional = affinities.conditional_probabilities(distances, perplexity)
+    indptr = np.arange(0, data.shape[0] * k + 1, k)
+    return sp.csr_matrix((conditional.ravel(), neighbors.ravel(), indptr),
+                         shape=(data.shape[0], reference.shape[0]))
+
+
+def interpolate(P: sp.csr_matrix, reference_embedding: np.ndarray) \
+        -> np.ndarray:
+    """Weighted mean of positions of similar reference observations"""
+    return np.asarray(P.dot(np.asarray(reference_embedding, dtype=float)))
+
+
+def _gradient(P: sp.csr_matrix, embedding: np.ndarray,
+              reference_embedding: np.ndarray) -> np.ndarray:
+    rows = np.repeat(np.arange(P.shape[0]), np.diff(P.indptr))
+    difference = embedding[rows] - reference_embedding[P.indices]
+    kernel = 1. / (1. + (difference ** 2).sum(axis=1))
+    weights = sp.csr_matrix((P.data * kernel, P.indices, P.indptr),
+                            shape=P.shape)
+    attractive = np.asarray(weights.sum(axis=1)) * embedding \
+        - weights.dot(reference_embedding)
+    repulsive, normalization = fft.repulsive_forces_between(
+        reference_embedding, embedding)
+    return 4. * (attractive
+                 - repulsive / np.maximum(normalization, _EPSILON)[:, None])
+
+
+def optimize(P: sp.csr_matrix, embedding: np.ndarray,
+             reference_embedding: np.ndarray, n_iter: int,
+             learning_rate: float=DEFAULT_LEARNING_RATE,
+             momentum: float=.5) -> np.ndarray:
+    """Refine positions of new observations with the reference fixed"""
+    reference_embedding = np.asarray(reference_embedding, dtype=float)
+    update = np.zeros_like(embedding)
+    gains = np.ones_like(embedding)
+    for _ in range(n_iter):
+        grad = _gradient(P, embedding, reference_embedding)
+        increasing = update * grad < 0.
+        gains[increasing] += .2
+        gains[~increasing] *= .8
+        np.clip(gains, optimizer.MIN_GAIN, np.inf, out=gains)
+        update = momentum * update - learning_rate * gains * grad
+        embedding += update
+    return embedding
+
+
+def place(reference: np.ndarray, reference_embedding: np.ndarray,
+          data: np.ndarray, metric: str='euclidean',
+          perplexity: float=DEFAULT_PERPLEXITY, n_iter: int=0,
+          learning_rate: float=DEFAULT_LEARNING_RATE) \
+        -> Tuple[np.ndarray, sp.csr_matrix]:
+    """Embed new observations into an existing embedding
+
+    Arguments:
+        reference: observations the embedding was computed for
+        reference_embedding: their embedding
+        data: new observations, in the same space as reference
+        metric: metric the embedding was computed with
+        perplexity: perplexity of similarities to reference observations
+        n_iter: number of optimization iterations, interpolation only if 0
+        learning_rate: learning rate of the optimization
+
+    Returns:
+        embedding of new observations and their similarities to reference
+    """
+    P = reference_affinities(reference, data, perplexity, metric)
+    embedding = interpolate(P, reference_embedding)
+    if n_iter:
+        embedding = optimize(P, embedding, reference_embedding, n_iter,
+                             learning_rate)
+    return embedding, P
@@ -0,0 +1,70 @@
+"""Asynchronous jobs run by Celery workers on behalf of the API
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Job ids are derived from the task and its arguments, so repeated requests
+for the same work refer to the same job, which is submitted again only if
+it failed or is not known to the result backend.
+"""
+import json
+from typing import Any, Dict
+import uuid
+
+
+QUEUE = 'tSNE'
+STATUS_URL = '/jobs/%s/'
+# PENDING is reported for jobs queued and unknown alike
+_RESUBMITTED = ('PENDING', 'FAILURE', 'REVOKED')
+
+
+def _celery():
+    """Celery application, imported when needed, as its tasks use the API"""
+    from spectre_analyses.celery import app
+    return app
+
+
+def job_id(task_name: str, **kwargs) -> str:
+    """Deterministic id of a job running the task with arguments"""
+    description = json.dumps([task_name, kwargs], sort_keys=True)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, 'tsne-worker:' + description))
+
+
+def submit(task_name: str, **kwargs) -> str:
+    """Submit a job, unless the same one is running or done already
+
+    Jobs waiting in the queue are reported as PENDING, so they may be
+    submitted twice. Tasks should be idempotent for that reason.
+
+    Returns:
+        id of the job
+    """
+    some_id = job_id(task_name, **kwargs)
+    app = _celery()
+    if app.AsyncResult(some_id).state in _RESUBMITTED:
+        app.send_task(task_name, kwargs=kwargs, task_id=some_id, queue=QUEUE)
+    return some_id
+
+
+def status(some_id: str) -> Dict[str, Any]:
+    """State of the job with its result, error or progress"""
+    result = _celery().AsyncResult(some_id)
+    state = {'id': some_id, 'state': result.state}
+    if result.state == 'SUCCESS':
+        state['result'] = result.result
+    elif result.state == 'FAILURE':
+        state['error'] = str(result.result)
+    elif isinstance(result.info, dict):
+        state['meta'] = result.info
+    return state
@@ -0,0 +1,204 @@
+"""In-process operational metrics exposed in Prometheus text format
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Metrics live in the memory of the process, so every process (e.g. Flask
+API and Celery worker) has its own. Only the API exposes them, see
+text exposition format 0.0.4 of Prometheus.
+"""
+from functools import wraps
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5.,
+                    10., 30.)
+SIZE_BUCKETS = tuple(float(4 ** power) for power in range(5, 14))
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(str(value)))
+                             for name, value in zip(names, values))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str]=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.label_names):
+            raise ValueError('%s expects labels %s, got %s'
+                             % (self.name, self.label_names, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Suffixed names, formatted labels and values of all series"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Metric in text exposition format"""
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        lines.extend('%s%s %s' % (name, labels, _format_value(value))
+                     for name, labels, value in self.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str]=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}  # type: Dict[Labels, float]
+
+    def inc(self, amount: float=1., **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.) + amount
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _format_labels(self.label_names, key), value)
+                for key, value in values]
+
+
+class Gauge(Counter):
+    """Value going up and down"""
+    kind = 'gauge'
+
+    def dec(self, amount: float=1., **labels):
+        self.inc(-amount, **labels)
+
+
+class FunctionCounter(_Metric):
+    """Count maintained elsewhere and read on every collection"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._function = function
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, '', self._function())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str]=(),
+                 buckets: Sequence[float]=DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = {}  # type: Dict[Labels, List[int]]
+        self._sums = {}  # type: Dict[Labels, float]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.) + value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            series = sorted((key, list(counts), self._sums[key])
+                            for key, counts in self._counts.items())
+        names = self.label_names + ('le',)
+        samples = []
+        for key, counts, total in series:
+            for bound, count in zip(self.buckets, counts):
+                samples.append((self.name + '_bucket', _format_labels(
+                    names, key + (_format_value(bound),)), count))
+            labels = _format_labels(self.label_names, key)
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, counts[-1]))
+        return samples
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing duration of every call in seconds"""
+    def decorator(function):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return timed_function
+    return decorator
+
+
+class Registry:
+    """Metrics exposed together"""
+    def __init__(self):
+        self._metrics = []  # type: List[_Metric]
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All the metrics in text exposition format"""
+        return ''.join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'tsne_http_request_duration_seconds', 'Latency of HTTP requests.',
+    ('route', 'method', 'status')))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'tsne_http_requests_in_flight', 'HTTP requests being handled.'))
+ASPECT_PAYLOAD = REGISTRY.register(Histogram(
+    'tsne_aspect_payload_bytes', 'Size of aspect responses.', ('aspect',),
+    buckets=SIZE_BUCKETS))
+DISCOVERY_DURATION = REGISTRY.register(Histogram(
+    'tsne_discovery_duration_seconds', 'Time of analyses discovery.',
+    ('operation',)))
+ARTIFACT_LOADING_DURATION = REGISTRY.register(Histogram(
+    'tsne_artifact_load_duration_seconds',
+    'Time of loading artifacts of analyses.', ('artifact',)))
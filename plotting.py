@@ -15,18 +15,80 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from abc import ABCMeta, abstractmethod
+import base64
 import json
 from numbers import Number
+import struct
 from typing import Collection, Dict, List
 
 import numpy as np
 
 
+PLOT_JSON = 'application/json'
+PLOT_BASE64 = 'application/vnd.spectre.plot.b64+json'
+PLOT_BINARY = 'application/vnd.spectre.plot.binary'
+
+
+class TypedArray:
+    """Numeric array serialized in binary form instead of list of numbers
+
+    In JSON it is represented as {"dtype": ..., "bdata": <base64>}, which is
+    the typed array specification accepted by Plotly.
+    """
+    def __init__(self, values, dtype: str='f4'):
+        values = values.ravel() if isinstance(values, np.ndarray) else values
+        self.values = np.ascontiguousarray(values, dtype='<' + dtype)
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.values.size
+
+    def tobytes(self) -> bytes:
+        return self.values.tobytes()
+
+    def as_base64(self) -> Dict[str, str]:
+        return {
+            "dtype": self.dtype,
+            "bdata": base64.b64encode(self.tobytes()).decode('ascii'),
+        }
+
+
 def _by_dict(object_):
+    if isinstance(object_, TypedArray):
+        return object_.as_base64()
     return object_.__dict__
 
 
 _SERIALIZER_OPTIONS = {"default": _by_dict, "sort_keys": True}
+_ALIGNMENT = 4
+
+
+def to_binary(object_) -> bytes:
+    """Serialize object with typed arrays moved out of its JSON description
+
+    Layout: 4-byte little-endian length of JSON header, JSON header padded
+    with spaces to 4 bytes and concatenated buffers of typed arrays. In the
+    header each typed array is replaced by {"dtype", "offset", "length"},
+    where offset is counted in bytes from the beginning of the buffers.
+    """
+    buffers = []
+    offset = 0
+
+    def by_reference(member):
+        nonlocal offset
+        if not isinstance(member, TypedArray):
+            return member.__dict__
+        buffer = member.tobytes()
+        buffers.append(buffer)
+        reference = {"dtype": member.dtype, "offset": offset,
+                     "length": len(member)}
+        offset += len(buffer)
+        return reference
+
+    header = json.dumps(object_, default=by_reference, sort_keys=True)
+    header = header.encode('utf-8')
+    header += b' ' * (-len(header) % _ALIGNMENT)
+    return struct.pack('<I', len(header)) + header + b''.join(buffers)
 
 
 class Trace(metaclass=ABCMeta):
@@ -51,6 +113,9 @@ class Plot:
     def to_json(self):
         return json.dumps(self, **_SERIALIZER_OPTIONS)
 
+    def to_binary(self) -> bytes:
+        return to_binary(self)
+
     __str__ = to_json
     __repr__ = to_json
     __json__ = to_json
@@ -60,32 +125,45 @@ class Plot:
 ArrayLike = Collection[Number]
 
 
+def _column(values: ArrayLike, compact: bool):
+    if compact:
+        return TypedArray(values)
+    if isinstance(values, np.ndarray):
+        return values.ravel().tolist()
+    return list(values)
+
+
 class Scatter2d(Trace):
-    def __init__(self, x: ArrayLike, y: ArrayLike):
+    def __init__(self, x: ArrayLike, y: ArrayLike, compact: bool=False):
         if len(x) != len(y):
             raise ValueError("len(x) != len(y); %i != %i" % (len(x), len(y)))
-        self.x = list(x if not isinstance(x, np.ndarray) else x.ravel())
-        self.y = list(y if not isinstance(y, np.ndarray) else y.ravel())
+        self.x = _column(x, compact)
+        self.y = _column(y, compact)
         self.mode = 'markers'
         self.type = 'scatter'
         self.marker = {"size": 2}
 
 
 class Scatter3d(Trace):
-    def __init__(self, x: ArrayLike, y: ArrayLike, z: ArrayLike):
+    def __init__(self, x: ArrayLike, y: ArrayLike, z: ArrayLike,
+                 compact: bool=False):
         if len(x) != len(y):
             raise ValueError("len(x) != len(y); %i != %i" % (len(x), len(y)))
         if len(x) != len(z):
             raise ValueError("len(x) != len(z); %i != %i" % (len(x), len(z)))
-        self.x = list(x if not isinstance(x, np.ndarray) else x.ravel())
-        self.y = list(y if not isinstance(y, np.ndarray) else y.ravel())
-        self.z = list(z if not isinstance(z, np.ndarray) else z.ravel())
+        self.x = _column(x, compact)
+        self.y = _column(y, compact)
+        self.z = _column(z, compact)
         self.mode = 'markers'
         self.type = 'scatter3d'
         self.marker = {"size": 2}
 
 
-def as_scatter_plot(observations: np.ndarray) -> Plot:
+def as_scatter_plot(observations: np.ndarray, compact: bool=False) -> Plot:
+    """Plot observations as 2D or 3D scatter
+
+    If compact is set, coordinates are stored as float32 typed arrays.
+    """
     dimensions = observations.shape[1]
     if dimensions == 2:
         trace = Scatter2d
@@ -93,4 +171,4 @@ def as_scatter_plot(observations: np.ndarray) -> Plot:
         trace = Scatter3d
     else:
         raise ValueError("Supports only 2D and 3D data. Was: %i" % dimensions)
-    return Plot([trace(*observations.T)])
+    return Plot([trace(*observations.T, compact=compact)])
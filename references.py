@@ -0,0 +1,73 @@
+"""Reference embeddings new spectra are placed into
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+import artifacts
+from data_utils import load_dataset
+from discover import catalog
+from embedding import cache, reduction, transform
+from embedding.reduction import Projection
+
+
+Reference = NamedTuple('Reference', [
+    ('features', np.ndarray),
+    ('embedding', np.ndarray),
+    ('projection', Optional[Projection]),
+    ('metric', str),
+])
+
+
+def load_reference(root: str) -> Reference:
+    """Load embedding of t-SNE analysis with spectra it was computed for
+
+    Spectra reduced with principal components are stored along with the
+    embedding. Otherwise, spectra are read from the analyzed dataset, which
+    must not have changed since the analysis, if its fingerprint is known.
+    """
+    projection = artifacts.load_projection(root)
+    features = artifacts.load_features(root)
+    if features is None:
+        name = catalog.dataset_of(root)
+        features = load_dataset(name).spectra
+        expected = artifacts.load_fingerprint(root)
+        if expected is not None and expected != cache.fingerprint(features):
+            raise ValueError('Dataset %s changed since the analysis' % name)
+        if projection is not None:
+            features = reduction.transform(projection, features)
+    metric = catalog.stored_parameters(root).get('metric', 'euclidean')
+    return Reference(features=features,
+                     embedding=artifacts.load_embedding(root),
+                     projection=projection, metric=metric)
+
+
+def place(reference: Reference, spectra: np.ndarray, n_iter: int=0,
+          perplexity: float=transform.DEFAULT_PERPLEXITY) -> np.ndarray:
+    """Embed new spectra into the reference embedding"""
+    expected = reference.features.shape[1] if reference.projection is None \
+        else reference.projection.components.shape[1]
+    if spectra.shape[1] != expected:
+        raise ValueError('Spectra have %i features, reference has %i'
+                         % (spectra.shape[1], expected))
+    features = spectra
+    if reference.projection is not None:
+        features = reduction.transform(reference.projection, spectra)
+    embedding, _ = transform.place(
+        reference.features, reference.embedding, features, reference.metric,
+        perplexity, n_iter)
+    return embedding
@@ -17,17 +17,23 @@ limitations under the License.
 import json
 import os
 import pickle
+import resource
 import shutil
 import signal
 import sys
+import threading
+import time
 from contextlib import contextmanager
 from functools import partial
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 import celery
 from celery.utils.log import get_task_logger
 
 from spdata.common import _FILESYSTEM_ROOT as FILESYSTEM_ROOT, DATA_ROOT
 
+import artifacts
+
 STATUS_PATHS = {
     'all': FILESYSTEM_ROOT,
     'done': DATA_ROOT,
@@ -36,16 +42,28 @@ STATUS_PATHS = {
 }
 
 
+logger = get_task_logger(__name__)
+
+PROGRESS_INTERVAL = float(os.environ.get('TSNE_PROGRESS_INTERVAL', 5.))
+CHECKPOINT_INTERVAL = float(os.environ.get('TSNE_CHECKPOINT_INTERVAL', 300.))
+PROFILE = 'profile.json'
+
+
 _DEFAULT = signal.SIG_DFL
 _CELERY_REVOKE = signal.SIGTERM
 
 
 class signal_trap:
-    """Context manager to hijack Celery revoke signal handling"""
+    """Context manager to hijack Celery revoke signal handling
+
+    Signals are handled by the main thread only, so the trap does nothing
+    in other threads. The main thread should trap signals on their behalf.
+    """
     def __init__(self, handler, signal_=_CELERY_REVOKE):
         self._previous_handler = _DEFAULT
         self._handler = handler
         self._signal = signal_
+        self._enabled = threading.current_thread() is threading.main_thread()
 
     def _hijack(self, sig_num, stack_frame):
         self._handler(sig_num, stack_frame)
@@ -53,25 +71,60 @@ class signal_trap:
         os.kill(os.getpid(), sig_num)
 
     def __enter__(self):
+        if not self._enabled:
+            return self
         self._previous_handler = (signal.signal(self._signal, self._hijack) or _DEFAULT)
         return self
 
     def __exit__(self, *args):
+        if not self._enabled:
+            return
         signal.signal(self._signal, self._previous_handler)
 
 
-def cleanup(path: str, *_):
-    """Clean up analysis directory"""
-    if os.path.exists(path):
+def cleanup(path: str, *_, preserved: Tuple[str, ...]=()):
+    """Clean up analysis directory, except for preserved files"""
+    if not os.path.exists(path):
+        return
+    if not any(os.path.exists(os.path.join(path, name))
+               for name in preserved):
         shutil.rmtree(path, ignore_errors=True)
+        return
+    for name in os.listdir(path):
+        if name in preserved:
+            continue
+        entry = os.path.join(path, name)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            os.remove(entry)
 
 
 @contextmanager
-def open_analysis(dataset_name: str, algorithm_name: str, analysis_name: str):
+def open_analysis(dataset_name: str, algorithm_name: str, analysis_name: str,
+                  preserved: Tuple[str, ...]=(),
+                  checkpoint_key: Optional[str]=None):
+    """Working directory of analysis, moved to done or failed when left
+
+    Preserved files are kept in the processing directory when the task is
+    revoked, so a resubmitted analysis with the same name can use them.
+    The directory is marked with the checkpoint key, if given, and the
+    directory of an interrupted analysis is reused only if marked with
+    the same key, even if it was interrupted before any checkpoint. Any
+    other analysis with the same name is rejected with FileExistsError.
+    """
     path_components = dataset_name, algorithm_name, analysis_name
     analysis_root = os.path.join(STATUS_PATHS['processing'], *path_components)
-    os.makedirs(analysis_root)
-    cleanup_root = partial(cleanup, analysis_root)
+    try:
+        os.makedirs(analysis_root)
+    except FileExistsError:
+        if checkpoint_key is None \
+                or artifacts.checkpoint_key(analysis_root) != checkpoint_key:
+            raise
+    if checkpoint_key is not None:
+        artifacts.save_checkpoint_key(analysis_root, checkpoint_key)
+        preserved = preserved + (artifacts.CHECKPOINT_KEY,)
+    cleanup_root = partial(cleanup, analysis_root, preserved=preserved)
     dest_root = None
     try:
         with signal_trap(cleanup_root):
@@ -86,13 +139,168 @@ def open_analysis(dataset_name: str, algorithm_name: str, analysis_name: str):
             shutil.move(analysis_root, dest_root)
 
 
-def _notify(task, status):
-    task.update_state(state=status)
+def _notify(task, status, meta=None):
+    task.update_state(state=status, meta=meta)
     # Line below updates the status in Celery Flower.
     # It is disabled since Flower disables TERMINATE button for custom state.
     #task.send_event('task-' + status.lower().replace(' ', '_'))
 
 
+class ProgressReporter:
+    """Publish optimization progress as meta of the task state
+
+    Updates are sent at most once per interval, so the result backend is
+    not flooded, except for the update after the last iteration.
+    """
+    def __init__(self, task: celery.Task, status: str, n_iter: int,
+                 interval: float=PROGRESS_INTERVAL, clock=time.monotonic):
+        self._task = task
+        self._status = status
+        self._n_iter = n_iter
+        self._interval = interval
+        self._clock = clock
+        self._started = clock()
+        self._reported = -float('inf')
+
+    def __call__(self, progress, _=None):
+        now = self._clock()
+        last = progress.iteration >= self._n_iter
+        if now - self._reported < self._interval and not last:
+            return
+        self._reported = now
+        elapsed = now - self._started
+        remaining = max(self._n_iter - progress.iteration, 0)
+        self._task.update_state(state=self._status, meta={
+            'iteration': progress.iteration,
+            'n_iter': self._n_iter,
+            'error': progress.error,
+            'grad_norm': progress.grad_norm,
+            'elapsed': elapsed,
+            'eta': elapsed / max(progress.iteration, 1) * remaining,
+        })
+
+
+class PeriodicCheckpoint:
+    """Store state of optimization at most once per interval"""
+    def __init__(self, root: str, key: str,
+                 interval: float=CHECKPOINT_INTERVAL, clock=time.monotonic):
+        self._root = root
+        self._key = key
+        self._interval = interval
+        self._clock = clock
+        self._stored = clock()
+
+    def __call__(self, state):
+        now = self._clock()
+        if now - self._stored < self._interval:
+            return
+        artifacts.save_checkpoint(self._root, state, self._key)
+        self._stored = now
+
+
+Sample = NamedTuple('Sample', [
+    ('wall', float),
+    ('cpu', float),
+    ('read_bytes', Optional[int]),
+    ('written_bytes', Optional[int]),
+])
+
+
+def _proc_values(path: str) -> Dict[str, int]:
+    """Numeric fields of /proc status files, in bytes where applicable"""
+    values = {}
+    try:
+        with open(path) as file:
+            for line in file:
+                name, _, value = line.partition(':')
+                value = value.split()
+                if value and value[0].isdigit():
+                    scale = 1024 if value[1:] == ['kB'] else 1
+                    values[name] = int(value[0]) * scale
+    except OSError:
+        pass
+    return values
+
+
+def resource_sample() -> Sample:
+    """Wall clock, CPU time of all threads and storage I/O of the process"""
+    counters = _proc_values('/proc/self/io')
+    return Sample(time.perf_counter(), time.process_time(),
+                  counters.get('read_bytes'), counters.get('write_bytes'))
+
+
+def peak_rss() -> int:
+    """Peak resident set size of the process in bytes"""
+    peak = _proc_values('/proc/self/status').get('VmHWM')
+    if peak is None:  # kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def reset_peak_rss():
+    """Start measuring peak resident set size anew, if supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def _difference(end: Optional[int], start: Optional[int]) -> Optional[int]:
+    return None if end is None or start is None else end - start
+
+
+class StageProfile:
+    """Notifier recording resources used by each stage of a task
+
+    A stage lasts from its notification until the next one or the finish.
+    Peak RSS is measured per stage where the kernel allows resetting it,
+    otherwise it is the peak of the process so far. Finished stages are
+    published as meta of each status update.
+    """
+    def __init__(self, notify, sample=resource_sample, peak=peak_rss,
+                 reset_peak=reset_peak_rss):
+        self.stages = []  # type: List[Dict[str, Any]]
+        self._notify = notify
+        self._sample = sample
+        self._peak = peak
+        self._reset_peak = reset_peak
+        self._stage = None  # type: Optional[str]
+        self._started = None  # type: Optional[Sample]
+
+    def _close(self):
+        if self._stage is None:
+            return
+        end = self._sample()
+        self.stages.append({
+            'stage': self._stage,
+            'wall_seconds': end.wall - self._started.wall,
+            'cpu_seconds': end.cpu - self._started.cpu,
+            'peak_rss_bytes': self._peak(),
+            'read_bytes': _difference(end.read_bytes,
+                                      self._started.read_bytes),
+            'written_bytes': _difference(end.written_bytes,
+                                         self._started.written_bytes),
+        })
+        self._stage = None
+
+    def __call__(self, status: str):
+        self._close()
+        self._notify(status, meta={'profile': list(self.stages)})
+        self._reset_peak()
+        self._stage, self._started = status, self._sample()
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Close the last stage and return profiles of all of them"""
+        self._close()
+        return list(self.stages)
+
+    def save(self, root: str):
+        """Store profiles of finished stages in the analysis directory"""
+        with open(os.path.join(root, PROFILE), 'w') as file:
+            json.dump(self.stages, file, indent=2)
+
+
 @contextmanager
 def status_notifier(task: celery.Task):
     old_outs = sys.stdout, sys.stderr
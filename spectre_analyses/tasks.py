@@ -14,42 +14,298 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+from functools import partial
+import json
 import os
+import sqlite3
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
 
 import celery
 import numpy as np
-from sklearn.manifold.t_sne import TSNE
-from sklearn.externals import joblib
+import scipy.sparse as sp
+from sklearn.model_selection import ParameterGrid
 
-from spdata.reader import load_dataset
-
-import data_utils
+import artifacts
+from aspect import _export as export
+import decimation
+from data_utils import load_dataset
+import discover.analyses as da
+from discover import catalog
+from embedding import affinities, cache, create_engine, reduction
+from embedding.neighbors import DEFAULT_TREES
+from embedding.optimizer import Callback
+from embedding.transform import DEFAULT_PERPLEXITY
+import jobs
+import references
 from spectre_analyses.celery import app
-from spectre_analyses.helpers import open_analysis, status_notifier, dump_configuration
+from spectre_analyses.helpers import open_analysis, status_notifier, \
+    dump_configuration, PeriodicCheckpoint, ProgressReporter, \
+    StageProfile, STATUS_PATHS, logger
 
 
-@app.task(task_track_started=True, ignore_result=True, bind=True,
+AFFINITIES_REPORT = 'affinities.json'
+SWEEP_POINT_NAME = '%s-%i'
+RUNNING = 'RUNNING T-SNE'
+RESUMABLE = (artifacts.CHECKPOINT,)
+# options affecting resources used, not the result
+EXECUTION_OPTIONS = ('n_jobs', 'low_memory')
+
+Preparation = NamedTuple('Preparation', [
+    ('fingerprint', str),
+    ('features', np.ndarray),
+    ('projection', Optional[reduction.Projection]),
+    ('affinities', Optional[sp.csr_matrix]),
+    ('report', Optional[dict]),
+])
+
+
+def _affinity_parameters(manifold, neighbors: str, n_trees: int,
+                         pca_components: int) -> dict:
+    """Parameters input similarities depend on"""
+    parameters = {
+        'metric': manifold.metric,
+        'perplexity': manifold.perplexity,
+        'neighbors': neighbors,
+        'pca_components': pca_components,
+    }
+    if neighbors == affinities.APPROXIMATE:
+        parameters['n_trees'] = n_trees
+    if neighbors == affinities.APPROXIMATE or pca_components:
+        parameters['random_state'] = manifold.random_state
+    return parameters
+
+
+def _configure(kwargs: dict):
+    """Build t-SNE estimator, parameters of preprocessing and threads count"""
+    options = dict(kwargs)
+    neighbors = options.pop('neighbors', affinities.EXACT)
+    n_trees = options.pop('n_trees', DEFAULT_TREES)
+    pca_components = options.pop('pca_components', 0)
+    n_jobs = options.pop('n_jobs', None)
+    options.pop('low_memory', None)
+    manifold = create_engine(**options, n_jobs=n_jobs, verbose=True)
+    return manifold, _affinity_parameters(manifold, neighbors, n_trees,
+                                          pca_components), n_jobs
+
+
+def _preparation_key(manifold, parameters: dict) -> Tuple:
+    """Identity of preprocessing, as exact method computes no affinities"""
+    if manifold.method == 'exact':
+        parameters = {'pca_components': parameters['pca_components'],
+                      'random_state': parameters.get('random_state')}
+    return tuple(sorted(parameters.items()))
+
+
+def _prepare(notify, data, manifold, parameters: dict,
+             n_jobs: Optional[int]=None, low_memory: bool=False,
+             fingerprint: Optional[str]=None) -> Preparation:
+    """Reduce dimensionality and compute input similarities of spectra
+
+    In low memory mode exact neighbours are searched in bounded chunks.
+    """
+    if fingerprint is None:
+        fingerprint = cache.fingerprint(data.spectra)
+    features, projection = data.spectra, None
+    pca_components = parameters['pca_components']
+    if pca_components:
+        notify('REDUCING DIMENSIONALITY')
+        projection, features = reduction.randomized_pca(
+            data.spectra, pca_components, manifold.random_state)
+        logger.info('%i principal components explain %.3f of variance.',
+                    projection.components.shape[0],
+                    projection.explained_variance_ratio.sum())
+    notify('COMPUTING AFFINITIES')
+    if manifold.method == 'exact':
+        return Preparation(fingerprint, features, projection, None, None)
+    key = cache.affinity_key(fingerprint, **parameters)
+    P, report, reused = cache.cached(
+        cache.AFFINITIES, key, partial(
+            affinities.affinity_stage, features, manifold.perplexity,
+            manifold.metric, parameters['neighbors'],
+            parameters.get('n_trees', DEFAULT_TREES), manifold.random_state,
+            n_jobs, low_memory))
+    logger.info('Found %s neighbours with recall %.3f in %.1fs%s.',
+                report.neighbors, report.recall, report.seconds,
+                ' (cached)' if reused else '')
+    return Preparation(fingerprint, features, projection, P,
+                       dict(report._asdict(), cached=reused))
+
+
+def _checkpoint_key(fingerprint: str, options: dict) -> str:
+    """Identity of optimization, regardless of resources used"""
+    return cache.affinity_key(fingerprint, **{
+        name: value for name, value in options.items()
+        if name not in EXECUTION_OPTIONS})
+
+
+def _embed(notify, tmp_path: str, data, options: dict, manifold,
+           preparation: Preparation, progress: Optional[Callback]=None):
+    """Run t-SNE on prepared spectra and store results in analysis path
+
+    Optimization is checkpointed and resumed from a checkpoint left by
+    an interrupted run with the same options and data.
+    """
+    if preparation.projection is not None:
+        artifacts.save_projection(tmp_path, preparation.projection)
+        artifacts.save_features(tmp_path, preparation.features)
+    if preparation.report is not None:
+        with open(os.path.join(tmp_path, AFFINITIES_REPORT), 'w') as file:
+            json.dump(preparation.report, file)
+    notify(RUNNING)
+    key = _checkpoint_key(preparation.fingerprint, options)
+    state = artifacts.load_checkpoint(tmp_path, key)
+    if state is not None:
+        logger.info('Resuming optimization from iteration %i.',
+                    state.iteration)
+    result = manifold.fit_transform(
+        preparation.features, affinities=preparation.affinities,
+        callback=progress, checkpoint=PeriodicCheckpoint(tmp_path, key),
+        state=state)
+    notify('PRESERVING RESULTS')
+    artifacts.save_embedding(tmp_path, result)
+    artifacts.save_metadata(tmp_path, data.coordinates, data.labels,
+                            preparation.fingerprint)
+    decimation.save_index(tmp_path, decimation.build_index(result))
+    # results are complete, so there is nothing left to resume
+    artifacts.remove_checkpoint(tmp_path)
+    return result
+
+
+def _register(analysis_details, parameters: dict, rows: int,
+              started: float):
+    done_path = os.path.join(STATUS_PATHS['done'], *analysis_details)
+    try:
+        catalog.register(tSNE.__name__, done_path, parameters, rows=rows,
+                         runtime=time.time() - started)
+    except sqlite3.Error:
+        # catalog is synchronized with the data store on the next listing
+        logger.exception('Could not register %s in catalog.', done_path)
+
+
+@app.task(task_track_started=True, ignore_result=False, bind=True,
           name="modelling.tSNE")
 def tSNE(self, analysis_name: str, dataset_name: str, **kwargs):
+    """Run t-SNE on the dataset, profiling resources used by each stage
+
+    Profile is stored with the analysis and returned as the result.
+    """
     # preprocessing of our current strange format
     analysis_details = dataset_name, tSNE.__name__, analysis_name
-    manifold = TSNE(**kwargs, verbose=True)
+    manifold, parameters, n_jobs = _configure(kwargs)
+    low_memory = kwargs.get('low_memory', False)
+    started = time.time()
+
+    with status_notifier(self) as notify:
+        notify = profile = StageProfile(notify)
+        notify('LOADING DATA')
+        data = load_dataset(dataset_name, low_memory)
+        fingerprint = cache.fingerprint(data.spectra)
+        key = _checkpoint_key(fingerprint, kwargs)
+        with open_analysis(*analysis_details, preserved=RESUMABLE,
+                           checkpoint_key=key) as tmp_path:
+            notify('PRESERVING CONFIGURATION')
+            config_path = os.path.join(tmp_path, 'options')
+            dump_configuration(config_path, kwargs)
+            preparation = _prepare(notify, data, manifold, parameters,
+                                   n_jobs, low_memory, fingerprint)
+            progress = ProgressReporter(self, RUNNING, manifold.n_iter)
+            result = _embed(notify, tmp_path, data, kwargs, manifold,
+                            preparation, progress)
+            stages = profile.finish()
+            profile.save(tmp_path)
+
+    _register(analysis_details, kwargs, result.shape[0], started)
+    return {'profile': stages}
+
+
+@app.task(task_track_started=True, ignore_result=False, bind=True,
+          name="modelling.tSNE_sweep")
+def tSNE_sweep(self, analysis_name: str, dataset_name: str,
+               grid: Dict[str, list], n_parallel: int=None, **kwargs):
+    """Run t-SNE for every combination of parameters in the grid
+
+    Input similarities are computed and cached once per distinct
+    preprocessing. Each combination is then sent as a regular t-SNE task
+    named <analysis_name>-<index>, with kwargs used as parameters common to
+    all of them, so combinations run in worker processes and reuse cached
+    similarities. At most n_parallel of them run at once, the rest wait in
+    chains, which stop at a failed analysis.
+
+    Returns ids of the t-SNE tasks, as each of them is revoked separately.
+    """
+    points = [dict(kwargs, **point) for point in ParameterGrid(grid)]
+    names = [SWEEP_POINT_NAME % (analysis_name, index)
+             for index in range(len(points))]
+    n_parallel = min(n_parallel or len(points), len(points))
+    low_memory = kwargs.get('low_memory', False)
+
+    with status_notifier(self) as notify:
+        notify('LOADING DATA')
+        data = load_dataset(dataset_name, low_memory)
+        prepared = set()
+        for options in points:
+            manifold, parameters, n_jobs = _configure(options)
+            key = _preparation_key(manifold, parameters)
+            # exact method computes no affinities to share
+            if manifold.method != 'exact' and key not in prepared:
+                _prepare(notify, data, manifold, parameters, n_jobs,
+                         low_memory)
+                prepared.add(key)
+
+    runs = [tSNE.si(name, dataset_name, **options).set(
+        queue=jobs.QUEUE, task_id=celery.uuid())
+        for name, options in zip(names, points)]
+    celery.group(celery.chain(*runs[start::n_parallel])
+                 for start in range(n_parallel)).apply_async()
+    return [run.options['task_id'] for run in runs]
+
+
+@app.task(task_track_started=True, ignore_result=True, bind=True,
+          name="modelling.tSNE_transform")
+def tSNE_transform(self, analysis_name: str, dataset_name: str,
+                   reference_id: str, n_iter: int=0,
+                   perplexity: float=DEFAULT_PERPLEXITY):
+    """Place spectra of dataset into embedding of another t-SNE analysis
+
+    Result is stored as a regular t-SNE analysis of the dataset.
+    """
+    analysis_details = dataset_name, tSNE.__name__, analysis_name
+    options = {'reference_id': reference_id, 'n_iter': n_iter,
+               'perplexity': perplexity}
+    started = time.time()
 
     with status_notifier(self) as notify, \
             open_analysis(*analysis_details) as tmp_path:
         notify('PRESERVING CONFIGURATION')
-        config_path = os.path.join(tmp_path, 'options')
-        dump_configuration(config_path, kwargs)
+        dump_configuration(os.path.join(tmp_path, 'options'), options)
         notify('LOADING DATA')
+        reference_root = da.find_analysis_by_id(tSNE.__name__, reference_id)
+        reference = references.load_reference(reference_root)
         data = load_dataset(dataset_name)
-        notify('RUNNING T-SNE')
-        result = manifold.fit_transform(data.spectra)
+        notify(RUNNING)
+        result = references.place(reference, data.spectra, n_iter, perplexity)
         notify('PRESERVING RESULTS')
-        model_path = os.path.join(tmp_path, 'model')
-        joblib.dump(manifold, model_path + '.pkl')
-        result_path = os.path.join(tmp_path, 'result')
-        joblib.dump(result, result_path + '.pkl')
-        np.savetxt(result_path + '.csv', result)
-        normalized = data_utils.as_normalized(result, data.coordinates, data.labels)
-        dataset_path = os.path.join(tmp_path, 'data.txt')
-        data_utils.dumps_txt(dataset_path, normalized)
+        artifacts.save_embedding(tmp_path, result)
+        artifacts.save_metadata(tmp_path, data.coordinates, data.labels,
+                                cache.fingerprint(data.spectra))
+        decimation.save_index(tmp_path, decimation.build_index(result))
+
+    _register(analysis_details, options, result.shape[0], started)
+
+
+@app.task(task_track_started=True, acks_late=True, bind=True,
+          name=export.EXPORT_TASK)
+def tSNE_export(self, analysis_id: str, target_name: str,
+                dataset_format: str='txt'):
+    """Publish transformed dataset of t-SNE analysis in the data store
+
+    Task is acknowledged when finished, so it is redelivered if the worker
+    dies, and it is idempotent (see aspect._export.publish).
+    """
+    with status_notifier(self) as notify:
+        notify('EXPORTING')
+        analysis_root = da.find_analysis_by_id(tSNE.__name__, analysis_id)
+        export.publish(analysis_root, target_name, dataset_format,
+                       self.request.id)
+    return {'dataset': target_name, 'format': dataset_format}
@@ -1,9 +1,15 @@
 import unittest
 from unittest.mock import MagicMock, patch
+import json
 import os
+import shutil
+import tempfile
 
+import flask
+from flask_json import FlaskJSON, JsonError
 import numpy as np
 import numpy.testing as npt
+import spdata.common as cmn
 from spdata.common import DATA_ROOT
 import spdata.types as ty
 
@@ -35,6 +41,8 @@ def throws(exception):
 
 @patch.object(ex, ex.dataset_name.__name__, new=returns('data'))
 @patch.object(ex, ex.load_dataset.__name__, new=returns(DATASET))
+@patch.object(ex.artifacts, 'load_metadata', new=returns(None))
+@patch.object(ex.artifacts, 'save_metadata', new=MagicMock())
 class GetMetadataTest(unittest.TestCase):
     def test_loads_coordinates_and_labels_of_analysed_dataset(self):
         metadata = ex.get_metadata('blah')
@@ -43,21 +51,59 @@ class GetMetadataTest(unittest.TestCase):
         self.assertSequenceEqual(metadata.coordinates.y, COORDINATES.y)
         self.assertSequenceEqual(metadata.coordinates.z, COORDINATES.z)
 
+    def test_prefers_metadata_stored_with_analysis(self):
+        stored = ex.Metadata(COORDINATES, None)
+        with patch.object(ex.artifacts, 'load_metadata',
+                          new=returns(stored)), \
+                patch.object(ex, 'load_dataset') as mock_load:
+            metadata = ex.get_metadata('blah')
+        mock_load.assert_not_called()
+        self.assertIs(stored, metadata)
+
+    def test_stores_metadata_read_from_analysed_dataset(self):
+        with patch.object(ex.artifacts, 'save_metadata') as mock_save:
+            ex.get_metadata('blah')
+        mock_save.assert_called_once_with('blah', COORDINATES, LABELS)
+
 
 TRANSFORMED_DATASET = np.array([[1, 2]])
 METADATA = ex.Metadata(COORDINATES, LABELS)
 
 
 @patch('data_utils.dumps_txt')
-@patch.object(ex.joblib, ex.joblib.load.__name__, new=returns(TRANSFORMED_DATASET))
+@patch.object(ex.artifacts, 'load_embedding', new=returns(TRANSFORMED_DATASET))
 @patch.object(ex, ex.get_metadata.__name__, new=returns(METADATA))
 class RegenerateDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.path = os.path.join(self.root, 'data.txt')
+
     def test_exports_transformed_dataset(self, mock_dumps: MagicMock):
-        ex.regenerate_dataset('blah.txt', 'analysis-root')
+        mock_dumps.side_effect = lambda path, _: open(path, 'w').close()
+        ex.regenerate_dataset(self.path, 'analysis-root')
         mock_dumps.assert_called_once()
-        path, dataset = mock_dumps.call_args[0]
+        _, dataset = mock_dumps.call_args[0]
         npt.assert_equal(dataset.spectra, TRANSFORMED_DATASET)
-        self.assertEqual(path, 'blah.txt')
+        self.assertEqual(['data.txt'], os.listdir(self.root))
+
+    def test_regenerates_dataset_left_partial(self, mock_dumps: MagicMock):
+        def interrupted(path, _):
+            with open(path, 'w') as file:
+                file.write('partial')
+            raise RuntimeError('worker died')
+
+        def complete(path, _):
+            with open(path, 'w') as file:
+                file.write('complete')
+
+        mock_dumps.side_effect = interrupted
+        with self.assertRaises(RuntimeError):
+            ex.ensure_dataset(self.root)
+        self.assertEqual([], os.listdir(self.root))
+        mock_dumps.side_effect = complete
+        with open(ex.ensure_dataset(self.root)) as file:
+            self.assertEqual('complete', file.read())
 
 
 @patch.object(ex, ex.regenerate_dataset.__name__)
@@ -78,16 +124,121 @@ class EnsureDatasetTest(unittest.TestCase):
         self.assertIn('analysis-root', path)
 
 
-@patch.object(ex, 'find_root', new=returns('analysis-root'))
-@patch('common.require_post_variable', new=returns('new dataset name'))
+def with_default(path, default=None):
+    return default
+
+
 @patch.object(ex, ex.ensure_dataset.__name__, new=returns('data.txt'))
+@patch.object(ex, ex.ensure_binary.__name__, new=returns('result.npy'))
 @patch('data_utils.push_to_repo')
-class ExportTest(unittest.TestCase):
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patcher = patch.object(cmn, 'DATA_ROOT', new=self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_pushes_transformed_dataset_to_repo(self, mock_push: MagicMock):
-        ex.export('blah')
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
         mock_push.assert_called_once_with('data.txt', 'new dataset name')
 
-    def test_returns_empty_table_on_success(self, mock_push: MagicMock):
+    def test_pushes_binary_dataset_on_demand(self, mock_push: MagicMock):
+        ex.publish('analysis-root', 'new dataset name', 'npy', 'job')
+        mock_push.assert_called_once_with('result.npy', 'new dataset name')
+
+    def test_claims_dataset_name_for_job(self, _):
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        self.assertEqual('job', ex.claimant('new dataset name'))
+
+    def test_does_nothing_when_repeated_after_success(self, mock_push):
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        text_root = os.path.join(self.root, 'new dataset name', 'text_data')
+        os.makedirs(text_root)
+        open(os.path.join(text_root, 'data.txt'), 'w').close()
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        mock_push.assert_called_once()
+
+    def test_completes_interrupted_push(self, mock_push: MagicMock):
+        ex.publish('analysis-root', 'new dataset name', 'npy', 'job')
+        partial = os.path.join(self.root, 'new dataset name', 'binary_data')
+        os.makedirs(partial)
+        ex.publish('analysis-root', 'new dataset name', 'npy', 'job')
+        self.assertEqual(2, mock_push.call_count)
+        self.assertFalse(os.path.exists(partial))
+
+    def test_never_modifies_dataset_of_other_job(self, mock_push: MagicMock):
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        with self.assertRaises(ValueError):
+            ex.publish('analysis-root', 'new dataset name', 'txt', 'other')
+        mock_push.assert_called_once()
+
+    def test_never_modifies_existing_dataset(self, mock_push: MagicMock):
+        text_root = os.path.join(self.root, 'new dataset name', 'text_data')
+        os.makedirs(text_root)
+        with self.assertRaises(ValueError):
+            ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        mock_push.assert_not_called()
+        self.assertEqual(['text_data'], os.listdir(
+            os.path.join(self.root, 'new dataset name')))
+
+    def test_claims_empty_directory(self, mock_push: MagicMock):
+        os.makedirs(os.path.join(self.root, 'new dataset name'))
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        mock_push.assert_called_once()
+        self.assertEqual('job', ex.claimant('new dataset name'))
+
+    def test_leaves_no_partial_claim(self, _):
+        ex.publish('analysis-root', 'new dataset name', 'txt', 'job')
+        self.assertEqual(['new dataset name'], os.listdir(self.root))
+
+
+@patch.object(ex, 'find_root', new=returns('analysis-root'))
+@patch('common.require_post_variable', new=returns('new dataset name'))
+@patch('common.optional_post_variable', new=MagicMock(side_effect=with_default))
+@patch.object(ex, 'taken', new=returns(False))
+@patch.object(ex.jobs, 'submit')
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        app = flask.Flask(__name__)
+        FlaskJSON(app)
+        context = app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def test_submits_export_job(self, mock_submit: MagicMock):
+        ex.export('blah')
+        mock_submit.assert_called_once_with(
+            ex.EXPORT_TASK, analysis_id='blah',
+            target_name='new dataset name', dataset_format='txt')
+
+    def test_exports_binary_dataset_on_demand(self, mock_submit: MagicMock):
+        with patch('common.optional_post_variable', new=returns('npy')):
+            ex.export('blah')
+        self.assertEqual('npy', mock_submit.call_args[1]['dataset_format'])
+
+    def test_throws_for_unknown_format(self, mock_submit: MagicMock):
+        with patch('common.optional_post_variable', new=returns('xls')), \
+                self.assertRaises(JsonError):
+            ex.export('blah')
+        mock_submit.assert_not_called()
+
+    def test_accepts_request_with_job_location(self, _):
         response = ex.export('blah')
-        self.assertIn('columns', response)
-        self.assertIn('data', response)
+        self.assertEqual(202, response.status_code)
+        table = json.loads(response.get_data(as_text=True))
+        self.assertEqual(['job_id', 'status'], table['columns'])
+        [[job, status]] = table['data']
+        self.assertEqual('/jobs/%s/' % job, status)
+        self.assertEqual(status, response.headers['Location'])
+
+    def test_refers_repeated_request_to_the_same_job(self, _):
+        first = json.loads(ex.export('blah').get_data(as_text=True))
+        second = json.loads(ex.export('blah').get_data(as_text=True))
+        self.assertEqual(first['data'], second['data'])
+
+    def test_rejects_existing_dataset_of_other_export(self, mock_submit):
+        with patch.object(ex, 'taken', new=returns(True)), \
+                self.assertRaises(JsonError):
+            ex.export('blah')
+        mock_submit.assert_not_called()
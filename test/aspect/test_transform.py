@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import json
+import os
+
+import flask
+from flask_json import JsonError
+import numpy as np
+
+import aspect._transform as tr
+import plotting
+from plotting import Plot
+from references import Reference
+
+
+def mock(return_value) -> MagicMock:
+    return MagicMock(return_value=return_value)
+
+
+APP = flask.Flask(__name__)
+REFERENCE = Reference(features=np.eye(3), embedding=np.eye(3, 2),
+                      projection=None, metric='euclidean')
+
+
+@patch.object(tr, 'find_root', new=mock(os.path.join(os.sep, 'data')))
+@patch.object(tr, 'cached_datasets', new=mock([{'name': 'other',
+                                                'value': 'other'}]))
+@patch.object(tr.references, 'load_reference', new=mock(REFERENCE))
+@patch.object(tr.references, 'place', new=mock(np.array([[.5, .5]])))
+class TransformTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(tr, 'load_dataset')
+        self.load_dataset = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_plots_reference_and_placed_spectra(self):
+        with APP.test_request_context(json={'dataset_name': 'other'}):
+            plot = tr.transform('some_id')
+        self.assertIsInstance(plot, Plot)
+        self.load_dataset.assert_called_once_with('other')
+        self.assertEqual(['reference', 'other'],
+                         [trace.name for trace in plot.data])
+        self.assertEqual([.5], plot.data[1].x)
+
+    def test_returns_base64_typed_arrays_on_demand(self):
+        headers = {'Accept': plotting.PLOT_BASE64}
+        with APP.test_request_context(json={'dataset_name': 'other'},
+                                      headers=headers):
+            response = tr.transform('some_id')
+        trace = json.loads(response.get_data(as_text=True))['data'][1]
+        self.assertEqual('f4', trace['x']['dtype'])
+
+    def test_requires_dataset_name(self):
+        with APP.test_request_context(json={}), \
+                self.assertRaises(JsonError):
+            tr.transform('some_id')
+
+    def test_rejects_incompatible_spectra(self):
+        with APP.test_request_context(json={'dataset_name': 'other'}), \
+                patch.object(tr.references, 'place',
+                             new=MagicMock(side_effect=ValueError('x'))), \
+                self.assertRaises(JsonError):
+            tr.transform('some_id')
+
+    def test_rejects_reference_of_changed_dataset(self):
+        with APP.test_request_context(json={'dataset_name': 'other'}), \
+                patch.object(tr.references, 'load_reference',
+                             new=MagicMock(side_effect=ValueError('x'))), \
+                self.assertRaises(JsonError) as raised:
+            tr.transform('some_id')
+        self.assertEqual(400, raised.exception.status)
+
+    def test_rejects_unknown_dataset(self):
+        with APP.test_request_context(json={'dataset_name': 'unknown'}), \
+                self.assertRaises(JsonError) as raised:
+            tr.transform('some_id')
+        self.assertEqual(404, raised.exception.status)
+        self.load_dataset.assert_not_called()
+
+    def test_rejects_path_as_dataset_name(self):
+        for name in ('..', os.path.join('..', 'other'), os.sep + 'other'):
+            with APP.test_request_context(json={'dataset_name': name}), \
+                    self.assertRaises(JsonError) as raised:
+                tr.transform('some_id')
+            self.assertEqual(400, raised.exception.status)
+        self.load_dataset.assert_not_called()
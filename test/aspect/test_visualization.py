@@ -1,11 +1,15 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
+import json
 import os
 
+import flask
+from flask_json import JsonError
 import numpy as np
 
 import aspect._visualization as vis
+import plotting
 from plotting import Plot
 
 
@@ -17,9 +21,45 @@ def fail(exception) -> MagicMock:
     return MagicMock(side_effect=exception)
 
 
+APP = flask.Flask(__name__)
+
+
+@patch.object(vis, 'find_root', new=mock(os.path.join(os.sep, 'data')))
+@patch.object(vis.artifacts, 'load_embedding', new=mock(np.array([[1, 2]])))
 class VisualizationTest(unittest.TestCase):
-    @patch.object(vis, 'find_root', new=mock(os.path.join(os.sep, 'data')))
-    @patch.object(vis.joblib, 'load', new=mock(np.array([[1, 2]])))
     def test_returns_valid_response_for_known_id(self):
-        visualization = vis.visualization('some_id')
+        with APP.test_request_context():
+            visualization = vis.visualization('some_id')
         self.assertIsInstance(visualization, Plot)
+
+    def test_returns_base64_typed_arrays_on_demand(self):
+        headers = {'Accept': plotting.PLOT_BASE64}
+        with APP.test_request_context(headers=headers):
+            response = vis.visualization('some_id')
+        self.assertEqual(plotting.PLOT_BASE64, response.mimetype)
+        trace = json.loads(response.get_data(as_text=True))['data'][0]
+        self.assertEqual('f4', trace['x']['dtype'])
+        self.assertIn('bdata', trace['x'])
+
+    def test_plots_sample_of_points_on_demand(self):
+        content = {'point_budget': 1, 'viewport': {'x': [0, 5]}}
+        with APP.test_request_context(json=content), \
+                patch.object(vis.decimation, 'ensure_index') as ensure_index:
+            ensure_index.return_value.query.return_value = np.array([0]), 1
+            visualization = vis.visualization('some_id')
+        ensure_index.return_value.query.assert_called_once()
+        _, budget, viewport = ensure_index.return_value.query.call_args[0]
+        self.assertEqual(1, budget)
+        self.assertEqual([(0, 5), (-float('inf'), float('inf'))], viewport)
+        self.assertEqual(1, visualization.layout['meta']['points_shown'])
+
+    def test_rejects_malformed_viewport(self):
+        with APP.test_request_context(json={'viewport': {'x': [0]}}), \
+                self.assertRaises(JsonError):
+            vis.visualization('some_id')
+
+    def test_returns_raw_buffers_on_demand(self):
+        headers = {'Accept': plotting.PLOT_BINARY}
+        with APP.test_request_context(headers=headers):
+            response = vis.visualization('some_id')
+        self.assertEqual(plotting.PLOT_BINARY, response.mimetype)
@@ -111,7 +111,7 @@ class TestAnalysisId(unittest.TestCase):
 @patch.object(an, 'only_existing', new=mock_only_existing)
 @patch.object(an, 'only_folders', new=mock_only_folders)
 @patch.object(os, 'listdir', new=mock_listdir)
-@patch.object(an, 'get_datasets', new=MagicMock(return_value=[
+@patch.object(an, 'cached_datasets', new=MagicMock(return_value=[
     {'value': 'peptides-1'}, {'value': 'peptides-2'}]))
 class TestFindAllAnalysesPaths(unittest.TestCase):
     def test_finds_paths(self):
@@ -119,14 +119,64 @@ class TestFindAllAnalysesPaths(unittest.TestCase):
         self.assertEqual(5, len(results))
 
 
-@patch.object(an, 'find_all_analyses_paths', new=MagicMock(return_value=[
+ANALYSES_PATHS = [
     os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'blah'),
     os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'wololo'),
     os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'blaah'),
     os.path.join(ROOT, 'data', 'peptides-2', 'tSNE', 'sample analysis'),
     os.path.join(ROOT, 'data', 'peptides-2', 'tSNE', 'this is boring')
-]))
+]
+DATASETS = [{'value': 'peptides-1'}, {'value': 'peptides-2'}]
+
+
+@patch.object(an, 'cached_datasets', new=MagicMock(return_value=DATASETS))
+@patch.object(an, 'modification_time', new=MagicMock(return_value=1))
+class TestAnalysisIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = an.AnalysisIndex('tSNE')
+
+    def test_scans_data_store_only_once(self):
+        with patch.object(an, 'find_all_analyses_paths',
+                          return_value=ANALYSES_PATHS) as scan:
+            self.index.items()
+            self.index.items()
+        scan.assert_called_once_with('tSNE')
+
+    def test_rescans_data_store_after_modification(self):
+        with patch.object(an, 'find_all_analyses_paths',
+                          return_value=ANALYSES_PATHS) as scan:
+            self.index.items()
+            with patch.object(an, 'modification_time', return_value=2):
+                self.index.items()
+        self.assertEqual(2, scan.call_count)
+        self.assertEqual(2, self.index.version)
+
+    @patch.object(an.time, 'time', new=MagicMock(return_value=0))
+    def test_rescans_recently_modified_data_store_for_unknown_id(self):
+        with patch.object(an, 'find_all_analyses_paths',
+                          return_value=ANALYSES_PATHS) as scan:
+            self.index.items()
+            with self.assertRaises(KeyError):
+                self.index['nonexistent']
+        self.assertEqual(2, scan.call_count)
+
+    def test_does_not_rescan_unmodified_data_store_for_unknown_id(self):
+        with patch.object(an, 'find_all_analyses_paths',
+                          return_value=ANALYSES_PATHS) as scan:
+            self.index.items()
+            for _ in range(3):
+                with self.assertRaises(KeyError):
+                    self.index['nonexistent']
+        scan.assert_called_once_with('tSNE')
+
+
+@patch.object(an, 'find_all_analyses_paths', new=MagicMock(
+    return_value=ANALYSES_PATHS))
+@patch.object(an, 'cached_datasets', new=MagicMock(return_value=DATASETS))
 class TestFindAnalysisResults(unittest.TestCase):
+    def setUp(self):
+        an.invalidate_indices()
+
     def test_finds_results(self):
         results = an.find_analysis_results('tSNE')
         self.assertEqual(5, len(results))
@@ -134,14 +184,13 @@ class TestFindAnalysisResults(unittest.TestCase):
             self.assertIsInstance(result, an.AnalysisResult)
 
 
-@patch.object(an, 'find_all_analyses_paths', new=MagicMock(return_value=[
-    os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'blah'),
-    os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'wololo'),
-    os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'blaah'),
-    os.path.join(ROOT, 'data', 'peptides-2', 'tSNE', 'sample analysis'),
-    os.path.join(ROOT, 'data', 'peptides-2', 'tSNE', 'this is boring')
-]))
+@patch.object(an, 'find_all_analyses_paths', new=MagicMock(
+    return_value=ANALYSES_PATHS))
+@patch.object(an, 'cached_datasets', new=MagicMock(return_value=DATASETS))
 class TestFindAnalysisById(unittest.TestCase):
+    def setUp(self):
+        an.invalidate_indices()
+
     def test_resolves_analysis_path_by_its_id(self):
         sample_path = os.path.join(ROOT, 'data', 'peptides-1', 'tSNE', 'blah')
         sample_id = an.analysis_id(sample_path)
@@ -151,3 +200,15 @@ class TestFindAnalysisById(unittest.TestCase):
     def test_throws_for_unknown_id(self):
         with self.assertRaises(JsonError):
             an.find_analysis_by_id('tSNE', 'nonexistent')
+
+    def test_throws_for_unknown_analysis_type(self):
+        with self.assertRaises(JsonError):
+            an.find_analysis_by_id('nonexistent', 'some-id')
+        self.assertRaises(KeyError, an.analysis_index, 'nonexistent')
+
+
+@patch.object(an, 'find_all_analyses_paths')
+class TestUnknownAnalysisType(unittest.TestCase):
+    def test_finds_no_results(self, scan: MagicMock):
+        self.assertEqual([], an.find_analysis_results('nonexistent'))
+        scan.assert_not_called()
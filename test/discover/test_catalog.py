@@ -0,0 +1,132 @@
+"""Tests of results catalog
+
+Copyright 2018 Spectre Team
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import discover.catalog as cat
+
+
+def make_analysis(root, dataset, name, parameters=None):
+    path = os.path.join(root, dataset, 'tSNE', name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'result.npy'), 'wb') as result:
+        result.write(b'0' * 10)
+    if parameters is not None:
+        with open(os.path.join(path, 'options.json'), 'w') as options:
+            json.dump(parameters, options)
+    return path
+
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.catalog_path = os.path.join(self.root, 'catalog.sqlite')
+        self.first = make_analysis(self.root, 'peptides-1', 'first')
+        self.second = make_analysis(self.root, 'peptides-2', 'second')
+        cat.register('tSNE', self.first, {'perplexity': 30, 'metric': 'cosine'},
+                     rows=3, runtime=2., catalog_path=self.catalog_path)
+        cat.register('tSNE', self.second, {'perplexity': 50.0}, rows=5,
+                     runtime=1., catalog_path=self.catalog_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def query(self, **arguments):
+        query = cat.parse_query(arguments)
+        return cat.query_results('tSNE', query, self.catalog_path)
+
+
+class TestRegister(CatalogTestCase):
+    def test_records_details_of_analysis(self):
+        _, entries = self.query(dataset='peptides-1')
+        entry, = entries
+        self.assertEqual(3, entry.rows)
+        self.assertEqual(2., entry.runtime)
+        self.assertEqual({'result.npy': 10}, entry.artifacts)
+        self.assertEqual(10, entry.size)
+        self.assertEqual({'perplexity': 30, 'metric': 'cosine'},
+                         entry.parameters)
+
+    def test_replaces_previous_record(self):
+        cat.register('tSNE', self.first, {'perplexity': 5}, rows=3,
+                     catalog_path=self.catalog_path)
+        total, entries = self.query()
+        self.assertEqual(2, total)
+        self.assertEqual({'perplexity': 5}, entries[0].parameters)
+
+
+class TestQueryResults(CatalogTestCase):
+    def test_filters_by_dataset(self):
+        total, entries = self.query(dataset='peptides-2')
+        self.assertEqual(1, total)
+        self.assertEqual(self.second.split(os.sep)[-1],
+                         entries[0].name.split(': ')[-1])
+
+    def test_filters_by_parameter_regardless_of_number_type(self):
+        total, entries = self.query(**{'param.perplexity': '50'})
+        self.assertEqual(1, total)
+        self.assertEqual('peptides-2', entries[0].dataset)
+
+    def test_sorts_by_requested_column(self):
+        _, entries = self.query(sort='runtime')
+        self.assertEqual(['peptides-2', 'peptides-1'],
+                         [entry.dataset for entry in entries])
+        _, entries = self.query(sort='param.perplexity', order='desc')
+        self.assertEqual(['peptides-2', 'peptides-1'],
+                         [entry.dataset for entry in entries])
+
+    def test_paginates_results(self):
+        total, entries = self.query(page='2', per_page='1')
+        self.assertEqual(2, total)
+        self.assertEqual(1, len(entries))
+        self.assertEqual('peptides-2', entries[0].dataset)
+
+
+class TestParseQuery(unittest.TestCase):
+    def test_throws_for_unknown_sort_column(self):
+        with self.assertRaises(ValueError):
+            cat.parse_query({'sort': 'DROP TABLE analyses'})
+
+    def test_throws_for_invalid_page(self):
+        with self.assertRaises(ValueError):
+            cat.parse_query({'page': '0'})
+        with self.assertRaises(ValueError):
+            cat.parse_query({'per_page': 'all'})
+
+    def test_recognizes_query_arguments(self):
+        self.assertTrue(cat.is_query({'param.metric': 'cosine'}))
+        self.assertFalse(cat.is_query({}))
+
+
+class TestSynchronize(CatalogTestCase):
+    def test_adds_missing_and_removes_gone_analyses(self):
+        third = make_analysis(self.root, 'peptides-2', 'third',
+                              parameters={'perplexity': 7})
+        index = MagicMock(analysis_type='tSNE', version=1)
+        index.items.return_value = [
+            (cat.analysis_id(self.first), self.first),
+            (cat.analysis_id(third), third),
+        ]
+        cat.synchronize(index, self.catalog_path)
+        total, entries = self.query(sort='param.perplexity')
+        self.assertEqual(2, total)
+        self.assertEqual({'perplexity': 7}, entries[0].parameters)
+        self.assertIsNone(entries[0].rows)
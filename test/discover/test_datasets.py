@@ -112,3 +112,66 @@ class TestFileFromDisk(unittest.TestCase):
         factory = lambda: partial(discover.datasets.substitute_tags, {"blah": "wololo"})
         content = discover.datasets.file_from_disk(factory, "some_path")
         self.assertEqual(content, "wololo")
+
+
+class TestWithDatasetsSubstitution(unittest.TestCase):
+    def setUp(self):
+        discover.datasets.DATASETS.invalidate()
+        self.template = discover.datasets.as_document('["$DATASETS", "%s"]' % id(self))
+
+    @patch.object(discover.datasets, 'get_datasets', new=MagicMock(return_value=[]))
+    def test_substitutes_datasets_once_per_listing(self):
+        with patch.object(discover.datasets, 'substitute_tags',
+                          wraps=discover.datasets.substitute_tags) as substitute:
+            first = discover.datasets.with_datasets_substitution(self.template)
+            second = discover.datasets.with_datasets_substitution(self.template)
+        substitute.assert_called_once()
+        self.assertEqual(first, second)
+        self.assertEqual([], json.loads(first.content)[0])
+
+    def test_changes_etag_when_datasets_change(self):
+        with patch.object(discover.datasets, 'get_datasets', return_value=[]):
+            first = discover.datasets.with_datasets_substitution(self.template)
+        discover.datasets.DATASETS.invalidate()
+        with patch.object(discover.datasets, 'get_datasets', return_value=[1]):
+            second = discover.datasets.with_datasets_substitution(self.template)
+        self.assertNotEqual(first.etag, second.etag)
+
+
+class TestDatasetsCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.
+        self.cache = discover.datasets.DatasetsCache(
+            ttl=10, clock=lambda: self.now)
+
+    @patch.object(discover.datasets, 'modification_time', new=MagicMock(return_value=1))
+    def test_lists_datasets_once_within_ttl(self):
+        with patch.object(discover.datasets, 'get_datasets',
+                          return_value=[]) as listing:
+            self.cache.get()
+            self.now = 5.
+            self.cache.get()
+        listing.assert_called_once()
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    @patch.object(discover.datasets, 'modification_time', new=MagicMock(return_value=1))
+    def test_lists_datasets_again_after_ttl(self):
+        with patch.object(discover.datasets, 'get_datasets',
+                          return_value=[]) as listing:
+            self.cache.get()
+            self.now = 11.
+            self.cache.get()
+        self.assertEqual(2, listing.call_count)
+
+    def test_lists_datasets_again_after_data_store_change(self):
+        with patch.object(discover.datasets, 'get_datasets',
+                          return_value=[]) as listing:
+            with patch.object(discover.datasets, 'modification_time',
+                              return_value=1):
+                self.cache.get()
+            with patch.object(discover.datasets, 'modification_time',
+                              return_value=2):
+                self.cache.get()
+        self.assertEqual(2, listing.call_count)
+        self.assertEqual(2, self.cache.misses)
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import numpy.testing as npt
+
+from embedding import affinities as af
+
+
+DATA = np.random.RandomState(0).randn(300, 5)
+
+
+def perplexity_of(probabilities):
+    positive = probabilities[probabilities > 0]
+    return np.exp(-np.sum(positive * np.log(positive)))
+
+
+class NNeighborsTest(unittest.TestCase):
+    def test_uses_three_times_perplexity(self):
+        self.assertEqual(91, af.n_neighbors(1000, 30))
+
+    def test_is_limited_by_number_of_samples(self):
+        self.assertEqual(9, af.n_neighbors(10, 30))
+
+
+class ConditionalProbabilitiesTest(unittest.TestCase):
+    def test_calibrates_rows_to_perplexity(self):
+        distances, _ = af.nearest_neighbors(DATA, 90)
+        probabilities = af.conditional_probabilities(distances, 30.)
+        npt.assert_allclose(probabilities.sum(axis=1), 1.)
+        perplexities = [perplexity_of(row) for row in probabilities]
+        npt.assert_allclose(perplexities, 30., rtol=1e-3)
+
+
+class JointProbabilitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.P = af.affinities(DATA, 10.)
+
+    def test_is_symmetric(self):
+        self.assertEqual(0, abs(self.P - self.P.T).max())
+
+    def test_sums_up_to_one(self):
+        self.assertAlmostEqual(1., self.P.sum())
+
+    def test_has_no_self_similarities(self):
+        npt.assert_equal(self.P.diagonal(), 0.)
+
+    def test_supports_other_metrics(self):
+        P = af.affinities(DATA, 10., metric='cosine')
+        self.assertAlmostEqual(1., P.sum())
+
+
+class AffinityStageTest(unittest.TestCase):
+    def test_uses_exact_neighbours_by_default(self):
+        P, report = af.affinity_stage(DATA, 10.)
+        self.assertEqual(0, abs(P - af.affinities(DATA, 10.)).max())
+        self.assertEqual(af.EXACT, report.neighbors)
+        self.assertEqual(1., report.recall)
+
+    def test_reports_recall_of_approximate_neighbours(self):
+        P, report = af.affinity_stage(DATA, 10., neighbors=af.APPROXIMATE,
+                                      n_trees=3, random_state=0)
+        self.assertAlmostEqual(1., P.sum())
+        self.assertEqual(af.APPROXIMATE, report.neighbors)
+        self.assertEqual(3, report.n_trees)
+        self.assertGreater(report.recall, 0.)
+        self.assertLessEqual(report.recall, 1.)
+
+    def test_falls_back_to_exact_search_for_unsupported_metric(self):
+        _, report = af.affinity_stage(DATA > 0, 10., metric='jaccard',
+                                      neighbors=af.APPROXIMATE)
+        self.assertEqual(af.EXACT, report.neighbors)
+
+    def test_searches_exact_neighbours_in_chunks_in_low_memory_mode(self):
+        with patch.object(af.ann, 'chunked_nearest_neighbors',
+                          wraps=af.ann.chunked_nearest_neighbors) as search:
+            P, _ = af.affinity_stage(DATA, 10., low_memory=True)
+        search.assert_called_once()
+        npt.assert_allclose(af.affinities(DATA, 10.).toarray(), P.toarray(),
+                            atol=1e-6)
+
+    def test_rejects_unknown_search(self):
+        with self.assertRaises(ValueError):
+            af.affinity_stage(DATA, 10., neighbors='unknown')
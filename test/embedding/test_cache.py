@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+import scipy.sparse as sp
+
+from embedding import cache
+from embedding.affinities import AffinityReport
+
+
+P = sp.random(50, 50, density=.1, format='csr', random_state=0)
+REPORT = AffinityReport(neighbors='exact', n_trees=0, recall=1., seconds=2.)
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_is_stable(self):
+        data = np.arange(20.).reshape(4, 5)
+        self.assertEqual(cache.fingerprint(data),
+                         cache.fingerprint(data.copy()))
+
+    def test_depends_on_content_and_shape(self):
+        data = np.arange(20.).reshape(4, 5)
+        changed = data.copy()
+        changed[3, 4] = -1
+        fingerprints = {cache.fingerprint(array) for array in (
+            data, changed, data.reshape(5, 4))}
+        self.assertEqual(3, len(fingerprints))
+
+    def test_is_the_same_for_float32_copy(self):
+        data = np.linspace(0., 1., 20).reshape(4, 5) / 3
+        self.assertEqual(cache.fingerprint(data),
+                         cache.fingerprint(data.astype(np.float32)))
+
+    def test_supports_noncontiguous_arrays(self):
+        data = np.arange(20.).reshape(4, 5)
+        self.assertEqual(cache.fingerprint(data[:, ::2].copy()),
+                         cache.fingerprint(data[:, ::2]))
+
+
+class AffinityKeyTest(unittest.TestCase):
+    def test_does_not_depend_on_parameters_order(self):
+        self.assertEqual(cache.affinity_key('abc', metric='cosine',
+                                            perplexity=30),
+                         cache.affinity_key('abc', perplexity=30,
+                                            metric='cosine'))
+
+    def test_depends_on_data_and_parameters(self):
+        keys = {cache.affinity_key('abc', perplexity=30),
+                cache.affinity_key('abd', perplexity=30),
+                cache.affinity_key('abc', perplexity=31)}
+        self.assertEqual(3, len(keys))
+
+
+class AffinityCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = cache.AffinityCache(self.root, budget=2 ** 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_returns_none_for_missing_entry(self):
+        self.assertIsNone(self.cache.get('abc'))
+
+    def test_returns_stored_entry(self):
+        self.cache.put('abc', P, REPORT)
+        found, report = self.cache.get('abc')
+        self.assertEqual(0, abs(found - P).max())
+        self.assertEqual(REPORT, report)
+
+    def test_evicts_least_recently_used_entries(self):
+        for key in ('a1', 'b2', 'c3'):
+            self.cache.put(key, P, REPORT)
+        for age, key in enumerate(('b2', 'a1', 'c3')):
+            path = os.path.join(self.root, key[:2], key + '.npz')
+            os.utime(path, (1000 + age, 1000 + age))
+        self.cache.get('b2')
+        entry_size = self.cache.size() // 3
+        self.cache.budget = 2 * entry_size
+        self.cache.evict()
+        self.assertIsNone(self.cache.get('a1'))
+        self.assertIsNotNone(self.cache.get('b2'))
+        self.assertIsNotNone(self.cache.get('c3'))
+
+    def test_keeps_total_size_within_budget(self):
+        self.cache.put('a1', P, REPORT)
+        self.cache.budget = self.cache.size() * 2
+        for key in ('b2', 'c3', 'd4'):
+            self.cache.put(key, P, REPORT)
+        self.assertLessEqual(self.cache.size(), self.cache.budget)
+
+
+class CachedTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = cache.AffinityCache(self.root, budget=2 ** 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_computes_missing_entry_once(self):
+        compute = MagicMock(return_value=(P, REPORT))
+        _, _, first_reused = cache.cached(self.cache, 'abc', compute)
+        found, report, second_reused = cache.cached(self.cache, 'abc',
+                                                    compute)
+        compute.assert_called_once_with()
+        self.assertFalse(first_reused)
+        self.assertTrue(second_reused)
+        self.assertEqual(0, abs(found - P).max())
+
+    def test_tolerates_unwritable_cache(self):
+        self.cache.put = MagicMock(side_effect=OSError)
+        found, _, reused = cache.cached(self.cache, 'abc',
+                                        MagicMock(return_value=(P, REPORT)))
+        self.assertIs(P, found)
+        self.assertFalse(reused)
@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import io
+
+import numpy as np
+from sklearn.manifold.t_sne import TSNE
+
+from embedding import affinities, engines, optimizer, parallel
+
+
+DATA = np.vstack([
+    np.random.RandomState(0).randn(100, 10),
+    np.random.RandomState(1).randn(100, 10) + 20.,
+])
+
+
+class CreateEngineTest(unittest.TestCase):
+    def test_uses_sklearn_for_barnes_hut(self):
+        engine = engines.create_engine('barnes_hut', perplexity=10)
+        self.assertIsInstance(engine, TSNE)
+        self.assertEqual('barnes_hut', engine.method)
+
+    def test_uses_interpolation_for_fft(self):
+        engine = engines.create_engine('fft', perplexity=10)
+        self.assertIsInstance(engine, engines.InterpolationTSNE)
+        self.assertEqual(10, engine.perplexity)
+
+    def test_uses_interpolation_by_default(self):
+        engine = engines.create_engine(perplexity=10)
+        self.assertIsInstance(engine, engines.InterpolationTSNE)
+
+    def test_rejects_unknown_method(self):
+        with self.assertRaises(ValueError):
+            engines.create_engine('unknown')
+
+    def test_sets_number_of_threads(self):
+        engine = engines.create_engine('fft', n_jobs=2)
+        self.assertEqual(2, engine.n_jobs)
+
+
+def interpolation_tsne(n_iter=300, **kwargs):
+    return engines.InterpolationTSNE(perplexity=10, n_iter=n_iter,
+                                     learning_rate=20., random_state=0,
+                                     **kwargs)
+
+
+class InterpolationTSNETest(unittest.TestCase):
+    def test_embeds_into_two_dimensions(self):
+        embedding = interpolation_tsne(n_iter=50).fit_transform(DATA)
+        self.assertEqual((200, 2), embedding.shape)
+        self.assertTrue(np.all(np.isfinite(embedding)))
+
+    def test_rejects_three_dimensions(self):
+        with self.assertRaises(ValueError):
+            interpolation_tsne(n_components=3).fit_transform(DATA)
+
+    def test_separates_clusters(self):
+        embedding = interpolation_tsne(init='pca').fit_transform(DATA)
+        distances = ((embedding[:, None] - embedding[None]) ** 2).sum(axis=-1)
+        np.fill_diagonal(distances, np.inf)
+        nearest = distances.argmin(axis=1)
+        same_cluster = (nearest < 100) == (np.arange(200) < 100)
+        self.assertTrue(np.all(same_cluster))
+
+    def test_does_not_depend_on_number_of_threads(self):
+        P = affinities.affinities(DATA, 10.)
+        with patch.object(parallel, 'available_cpus', new=lambda: 4):
+            serial, threaded = [
+                interpolation_tsne(n_iter=100, n_jobs=n_jobs).fit_transform(
+                    DATA, affinities=P) for n_jobs in (1, 4)]
+        np.testing.assert_allclose(serial, threaded)
+
+    def test_is_reproducible(self):
+        first, second = [interpolation_tsne().fit_transform(DATA)
+                         for _ in range(2)]
+        np.testing.assert_equal(first, second)
+
+
+class SklearnTSNETest(unittest.TestCase):
+    def test_optimizes_given_affinities_with_barnes_hut(self):
+        P = affinities.affinities(DATA, 10.)
+        engine = engines.SklearnTSNE(method='barnes_hut', n_iter=300,
+                                     random_state=0)
+        with patch.object(engines.TSNE, 'fit_transform') as fit_transform:
+            embedding = engine.fit_transform(DATA, affinities=P)
+        fit_transform.assert_not_called()
+        self.assertEqual((200, 2), embedding.shape)
+        first, second = embedding[:100].mean(axis=0), \
+            embedding[100:].mean(axis=0)
+        spread = embedding[:100].std(axis=0).max()
+        self.assertGreater(np.linalg.norm(first - second), 3 * spread)
+
+    def test_resumes_barnes_hut_from_checkpoint(self):
+        P = affinities.affinities(DATA, 10.)
+
+        def engine():
+            return engines.SklearnTSNE(method='barnes_hut', n_iter=300,
+                                       random_state=0)
+
+        states = []
+        expected = engine().fit_transform(
+            DATA, affinities=P, checkpoint=lambda state: states.append(
+                optimizer.State(*[np.copy(field) for field in state])))
+        self.assertEqual(150, states[2].iteration)
+        resumed = engine().fit_transform(DATA, affinities=P,
+                                         state=states[2])
+        np.testing.assert_allclose(expected, resumed)
+
+    def test_reports_barnes_hut_progress_with_embedding(self):
+        callback = MagicMock()
+        engines.SklearnTSNE(method='barnes_hut', n_iter=100).fit_transform(
+            DATA, affinities=affinities.affinities(DATA, 10.),
+            callback=callback)
+        self.assertEqual([50, 100], [call[0][0].iteration
+                                     for call in callback.call_args_list])
+        self.assertEqual((200, 2), callback.call_args[0][1].shape)
+
+    def test_computes_own_affinities_for_exact_method(self):
+        engine = engines.SklearnTSNE(method='exact')
+        with patch.object(engines.TSNE, 'fit_transform',
+                          return_value='embedding') as fit_transform:
+            result = engine.fit_transform(DATA, affinities='ignored')
+        fit_transform.assert_called_once_with(DATA)
+        self.assertEqual('embedding', result)
+
+    def test_reports_progress_parsed_from_verbose_output(self):
+        engine = engines.SklearnTSNE(method='exact')
+
+        def fit_transform(*args, **kwargs):
+            self.assertEqual(2, engine.verbose)
+            print("[t-SNE] Iteration 50: error = 2.5000000, gradient norm "
+                  "= 0.0100000 (50 iterations in 0.100s)")
+            return np.zeros((200, 2))
+
+        callback = MagicMock()
+        with patch.object(engines.TSNE, 'fit_transform', new=fit_transform), \
+                patch('sys.stdout', new=io.StringIO()):
+            engine.fit_transform(DATA, callback=callback)
+        callback.assert_called_once_with(
+            optimizer.Progress(50, 2.5, .01), None)
+        self.assertEqual(0, engine.verbose)
+
+class InterpolationTSNEAffinitiesTest(unittest.TestCase):
+    def test_uses_given_affinities(self):
+        P = affinities.affinities(DATA, 10.)
+        with patch.object(engines, 'input_similarities') as compute:
+            interpolation_tsne(n_iter=50).fit_transform(DATA, affinities=P)
+        compute.assert_not_called()
+
+    def test_reports_progress_with_embedding(self):
+        callback = MagicMock()
+        interpolation_tsne(n_iter=100).fit_transform(
+            DATA, affinities=affinities.affinities(DATA, 10.),
+            callback=callback)
+        self.assertEqual([50, 100], [call[0][0].iteration
+                                     for call in callback.call_args_list])
+        self.assertEqual((200, 2), callback.call_args[0][1].shape)
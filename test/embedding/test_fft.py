@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import numpy.testing as npt
+
+from embedding import fft
+
+
+def exact_repulsion(Y):
+    difference = Y[:, None, :] - Y[None, :, :]
+    kernel = 1. / (1. + (difference ** 2).sum(axis=-1))
+    np.fill_diagonal(kernel, 0.)
+    forces = ((kernel ** 2)[:, :, None] * difference).sum(axis=1)
+    return forces, kernel.sum()
+
+
+def clusters(n_samples, dimensions, span):
+    random_state = np.random.RandomState(0)
+    centers = random_state.uniform(0, span, (20, dimensions))
+    return centers[random_state.randint(20, size=n_samples)] \
+        + random_state.randn(n_samples, dimensions) * 1.5
+
+
+def relative_error(approximation, exact):
+    return np.linalg.norm(approximation - exact) / np.linalg.norm(exact)
+
+
+class RepulsiveForcesTest(unittest.TestCase):
+    def check(self, Y, tolerance):
+        forces, normalization = fft.repulsive_forces(Y)
+        expected_forces, expected_normalization = exact_repulsion(Y)
+        self.assertLess(relative_error(forces, expected_forces), tolerance)
+        self.assertAlmostEqual(1., normalization / expected_normalization,
+                               places=2)
+
+    def test_approximates_exact_forces_in_2d(self):
+        self.check(np.random.RandomState(0).randn(2000, 2) * 5, .05)
+
+    def test_approximates_exact_forces_at_realistic_span(self):
+        Y = clusters(2000, 2, span=80.)
+        self.assertTrue(fft.interpolated(Y))
+        self.check(Y, .05)
+
+    def test_is_exact_in_3d_at_realistic_span(self):
+        Y = clusters(2000, 3, span=80.)
+        self.assertFalse(fft.interpolated(Y))
+        self.check(Y, 1e-9)
+
+    def test_is_exact_for_few_points(self):
+        Y = np.random.RandomState(0).randn(fft.EXACT_N_SAMPLES, 2) * 50
+        forces, normalization = fft.repulsive_forces(Y)
+        expected_forces, expected_normalization = exact_repulsion(Y)
+        npt.assert_allclose(forces, expected_forces, atol=1e-12)
+        self.assertAlmostEqual(1., normalization / expected_normalization)
+
+    def test_is_exact_for_tiny_spread(self):
+        Y = np.random.RandomState(0).randn(2000, 2) * 1e-4
+        forces, normalization = fft.repulsive_forces(Y)
+        expected_forces, expected_normalization = exact_repulsion(Y)
+        npt.assert_allclose(forces, expected_forces, atol=1e-8)
+        self.assertAlmostEqual(1., normalization / expected_normalization,
+                               places=6)
+
+
+class InterpolationTest(unittest.TestCase):
+    def test_reuses_kernel_while_span_changes_slightly(self):
+        Y = np.random.RandomState(0).randn(2000, 2) * 5
+        first, second = fft.Interpolation(Y), fft.Interpolation(Y * 1.01)
+        self.assertEqual(first.n_nodes, second.n_nodes)
+        self.assertEqual(first.spacing, second.spacing)
+
+    def test_limits_nodes_per_point_of_small_span(self):
+        Y = np.random.RandomState(0).randn(2000, 2) * .1
+        with patch.object(fft, 'MAX_NODES_PER_POINT', 2):
+            coarse = fft.Interpolation(Y)
+        self.assertLess(coarse.n_nodes, fft.Interpolation(Y).n_nodes)
+
+
+class RepulsiveForcesBetweenTest(unittest.TestCase):
+    def test_approximates_exact_forces_on_targets(self):
+        random_state = np.random.RandomState(0)
+        sources = random_state.randn(1000, 2) * 5
+        targets = random_state.randn(50, 2) * 5
+        difference = targets[:, None, :] - sources[None, :, :]
+        kernel = 1. / (1. + (difference ** 2).sum(axis=-1))
+        expected = ((kernel ** 2)[:, :, None] * difference).sum(axis=1)
+        forces, normalization = fft.repulsive_forces_between(sources, targets)
+        self.assertLess(relative_error(forces, expected), .05)
+        npt.assert_allclose(normalization, kernel.sum(axis=1), rtol=.01)
+
+
+class FastSizeTest(unittest.TestCase):
+    def test_keeps_smooth_sizes(self):
+        self.assertEqual(60, fft._fast_size(60))
+
+    def test_rounds_up_to_smooth_size(self):
+        self.assertEqual(64, fft._fast_size(61))
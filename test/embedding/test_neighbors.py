@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch
+
+import os
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+from scipy.spatial.distance import cdist
+
+from embedding import affinities as af
+from embedding import neighbors as nb
+
+
+RANDOM = np.random.RandomState(0)
+DATA = np.tanh(RANDOM.randn(1000, 3).dot(RANDOM.randn(3, 40))) \
+    + .01 * RANDOM.randn(1000, 40)
+K = 15
+
+
+def recall(approximate, exact):
+    return np.mean([np.intersect1d(first, second).size / approximate.shape[1]
+                    for first, second in zip(approximate, exact)])
+
+
+class ApproximateNearestNeighborsTest(unittest.TestCase):
+    def test_finds_most_of_true_neighbours(self):
+        for metric in nb.SUPPORTED_METRICS:
+            _, exact = af.nearest_neighbors(DATA, K, metric)
+            _, found = nb.approximate_nearest_neighbors(
+                DATA, K, metric, n_trees=10, random_state=0)
+            self.assertGreater(recall(found, exact), .9, metric)
+
+    def test_more_trees_improve_recall(self):
+        _, exact = af.nearest_neighbors(DATA, K)
+        recalls = [
+            recall(nb.approximate_nearest_neighbors(
+                DATA, K, n_trees=n_trees, random_state=0)[1], exact)
+            for n_trees in (1, 10)
+        ]
+        self.assertLess(recalls[0], recalls[1])
+
+    def test_returns_sorted_distances_in_metric(self):
+        scipy_metrics = {'euclidean': 'sqeuclidean', 'cosine': 'cosine',
+                         'correlation': 'correlation'}
+        for metric, scipy_metric in scipy_metrics.items():
+            distances, found = nb.approximate_nearest_neighbors(
+                DATA, K, metric, random_state=0)
+            npt.assert_array_equal(np.sort(distances, axis=1), distances)
+            expected = [cdist(DATA[row:row + 1], DATA[found[row]],
+                              scipy_metric)[0] for row in range(10)]
+            npt.assert_allclose(expected, distances[:10], atol=1e-9)
+
+    def test_never_returns_observation_itself(self):
+        _, found = nb.approximate_nearest_neighbors(DATA, K, random_state=0)
+        self.assertFalse(np.any(found == np.arange(DATA.shape[0])[:, None]))
+
+    def test_rejects_unsupported_metric(self):
+        with self.assertRaises(ValueError):
+            nb.approximate_nearest_neighbors(DATA > 0, K, 'jaccard')
+
+
+class SampledRecallTest(unittest.TestCase):
+    def test_is_one_for_exact_neighbours(self):
+        _, exact = af.nearest_neighbors(DATA, K)
+        self.assertAlmostEqual(1., nb.sampled_recall(DATA, exact,
+                                                     sample_size=100,
+                                                     random_state=0))
+
+    def test_estimates_recall(self):
+        _, exact = af.nearest_neighbors(DATA, K)
+        _, found = nb.approximate_nearest_neighbors(DATA, K, n_trees=2,
+                                                    random_state=0)
+        estimate = nb.sampled_recall(DATA, found, sample_size=500,
+                                     random_state=0)
+        self.assertAlmostEqual(recall(found, exact), estimate, delta=.05)
+
+
+class ExactNeighborsOfTest(unittest.TestCase):
+    def test_finds_exact_neighbours_in_chunks(self):
+        _, exact = af.nearest_neighbors(DATA, K)
+        rows = np.arange(0, 1000, 7)
+        with patch.object(nb, '_CHUNK_ELEMENTS', new=10 * DATA.shape[0]):
+            found = nb.exact_neighbors_of(DATA, rows, K)
+        self.assertAlmostEqual(1., recall(found, exact[rows]))
+
+
+class ChunkedNearestNeighborsTest(unittest.TestCase):
+    def test_finds_exact_neighbours(self):
+        distances, indices = nb.chunked_nearest_neighbors(
+            DATA, 10, chunk_rows=64)
+        expected_distances, expected_indices = af.nearest_neighbors(
+            DATA, 10)
+        npt.assert_equal(expected_indices, indices)
+        npt.assert_allclose(expected_distances, distances, atol=1e-4)
+
+    def test_supports_cosine_metric(self):
+        _, indices = nb.chunked_nearest_neighbors(
+            DATA, 5, metric='cosine', chunk_rows=100)
+        _, expected = af.nearest_neighbors(DATA, 5, 'cosine')
+        npt.assert_equal(expected, indices)
+
+    def test_reads_float32_memory_map(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'spectra.npy')
+            np.save(path, DATA.astype(np.float32))
+            data = np.load(path, mmap_mode='r')
+            _, indices = nb.chunked_nearest_neighbors(
+                data, 10, chunk_rows=128)
+            del data
+        _, expected = af.nearest_neighbors(DATA, 10)
+        npt.assert_equal(expected, indices)
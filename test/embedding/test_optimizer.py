@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import numpy.testing as npt
+
+from embedding import affinities, optimizer
+from test.embedding.test_fft import exact_repulsion
+
+
+DATA = np.random.RandomState(0).randn(60, 4)
+
+
+def exact_gradient(P, Y):
+    difference = Y[:, None, :] - Y[None, :, :]
+    kernel = 1. / (1. + (difference ** 2).sum(axis=-1))
+    np.fill_diagonal(kernel, 0.)
+    Q = kernel / kernel.sum()
+    weights = (P.toarray() - Q) * kernel
+    return 4. * (weights[:, :, None] * difference).sum(axis=1)
+
+
+class GradientTest(unittest.TestCase):
+    def test_matches_exact_gradient(self):
+        P = affinities.affinities(DATA, 5.)
+        Y = np.random.RandomState(1).randn(60, 2)
+        grad, _ = optimizer.gradient(P, Y, repulsion=exact_repulsion)
+        npt.assert_allclose(grad, exact_gradient(P, Y), atol=1e-12)
+
+    def test_computes_kl_divergence(self):
+        P = affinities.affinities(DATA, 5.)
+        Y = np.random.RandomState(1).randn(60, 2)
+        _, error = optimizer.gradient(P, Y, repulsion=exact_repulsion)
+        difference = Y[:, None, :] - Y[None, :, :]
+        kernel = 1. / (1. + (difference ** 2).sum(axis=-1))
+        np.fill_diagonal(kernel, 0.)
+        Q = kernel / kernel.sum()
+        p = P.toarray()
+        nonzero = p > 0
+        expected = np.sum(p[nonzero] * np.log(p[nonzero] / Q[nonzero]))
+        self.assertAlmostEqual(expected, error)
+
+
+class ParallelAttractionTest(unittest.TestCase):
+    def test_matches_serial_computation(self):
+        P = affinities.affinities(DATA, 5.)
+        Y = np.random.RandomState(1).randn(60, 2)
+        expected_forces, expected_kernel = optimizer.attractive_forces(P, Y)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            attraction = optimizer.parallel_attraction(P, executor, 3)
+            forces, kernel = attraction(Y)
+        npt.assert_allclose(expected_forces, forces)
+        npt.assert_allclose(expected_kernel, kernel)
+
+
+class GradientDescentTest(unittest.TestCase):
+    def test_reports_progress_periodically(self):
+        P = affinities.affinities(DATA, 5.)
+        Y = np.random.RandomState(1).randn(60, 2) * 1e-4
+        callback = MagicMock()
+        _, _, n_iter = optimizer.gradient_descent(
+            P, Y, n_iter=120, n_iter_without_progress=1000,
+            min_grad_norm=0., repulsion=exact_repulsion, callback=callback)
+        self.assertEqual(120, n_iter)
+        iterations = [call[0][0].iteration for call in callback.call_args_list]
+        self.assertEqual([50, 100, 120], iterations)
+
+    def test_resumes_from_checkpoint(self):
+        P = affinities.affinities(DATA, 5.)
+        Y = np.random.RandomState(1).randn(60, 2) * 1e-4
+        options = {'n_iter': 300, 'n_iter_without_progress': 1000,
+                   'min_grad_norm': 0., 'repulsion': exact_repulsion}
+        expected, _, _ = optimizer.gradient_descent(P, Y.copy(), **options)
+        states = []
+        optimizer.gradient_descent(
+            P, Y.copy(), checkpoint=lambda state: states.append(
+                optimizer.State(*[np.copy(field) for field in state])),
+            **options)
+        self.assertEqual([50, 100, 150, 200, 250],
+                         [state.iteration for state in states])
+        resumed, _, n_iter = optimizer.gradient_descent(
+            P, None, state=states[2], **options)
+        self.assertEqual(300, n_iter)
+        npt.assert_allclose(expected, resumed)
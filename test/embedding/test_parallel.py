@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+from embedding import parallel
+
+
+def contents(files):
+    def read(path):
+        return files.get(path)
+    return read
+
+
+class CpuQuotaTest(unittest.TestCase):
+    def test_reads_cgroup_v2_limit(self):
+        files = {parallel._CGROUP_V2: '250000 100000'}
+        with patch.object(parallel, '_read', new=contents(files)):
+            self.assertEqual(2.5, parallel.cpu_quota())
+
+    def test_unlimited_cgroup_v2(self):
+        with patch.object(parallel, '_read',
+                          new=contents({parallel._CGROUP_V2: 'max 100000'})):
+            self.assertIsNone(parallel.cpu_quota())
+
+    def test_reads_cgroup_v1_limit(self):
+        files = {parallel._CGROUP_V1_QUOTA: '400000',
+                 parallel._CGROUP_V1_PERIOD: '100000'}
+        with patch.object(parallel, '_read', new=contents(files)):
+            self.assertEqual(4., parallel.cpu_quota())
+
+    def test_unlimited_cgroup_v1(self):
+        files = {parallel._CGROUP_V1_QUOTA: '-1',
+                 parallel._CGROUP_V1_PERIOD: '100000'}
+        with patch.object(parallel, '_read', new=contents(files)):
+            self.assertIsNone(parallel.cpu_quota())
+
+
+@patch.object(parallel, 'available_cpus', new=lambda: 4)
+class EffectiveNJobsTest(unittest.TestCase):
+    def test_defaults_to_single_thread(self):
+        self.assertEqual(1, parallel.effective_n_jobs())
+
+    def test_limits_threads_to_available_cpus(self):
+        self.assertEqual(4, parallel.effective_n_jobs(16))
+
+    def test_counts_negative_values_from_available_cpus(self):
+        self.assertEqual(4, parallel.effective_n_jobs(-1))
+        self.assertEqual(3, parallel.effective_n_jobs(-2))
+
+    def test_rejects_zero(self):
+        with self.assertRaises(ValueError):
+            parallel.effective_n_jobs(0)
+
+
+class AvailableCpusTest(unittest.TestCase):
+    def test_respects_quota(self):
+        with patch.object(parallel, 'cpu_quota', new=lambda: .5):
+            self.assertEqual(1, parallel.available_cpus())
+
+
+class RowBlocksTest(unittest.TestCase):
+    def test_covers_all_rows(self):
+        blocks = parallel.row_blocks(10, 3)
+        self.assertEqual([slice(0, 3), slice(3, 6), slice(6, 10)], blocks)
+
+    def test_skips_empty_blocks(self):
+        self.assertEqual(2, len(parallel.row_blocks(2, 4)))
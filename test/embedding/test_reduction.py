@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+from sklearn.decomposition import PCA
+
+from embedding import reduction
+
+
+RANDOM = np.random.RandomState(0)
+DATA = RANDOM.randn(500, 5).dot(RANDOM.randn(5, 60)) * [10] \
+    + RANDOM.randn(500, 60) + 50.
+
+
+class RandomizedPCATest(unittest.TestCase):
+    def setUp(self):
+        self.projection, self.transformed = reduction.randomized_pca(
+            DATA, 5, random_state=0, chunk_rows=128)
+        self.expected = PCA(n_components=5, svd_solver='full').fit(DATA)
+
+    def test_finds_principal_components(self):
+        alignment = np.abs((self.projection.components
+                            * self.expected.components_).sum(axis=1))
+        npt.assert_allclose(alignment, 1., atol=1e-4)
+
+    def test_computes_explained_variance(self):
+        npt.assert_allclose(self.projection.explained_variance,
+                            self.expected.explained_variance_, rtol=1e-3)
+        npt.assert_allclose(self.projection.explained_variance_ratio,
+                            self.expected.explained_variance_ratio_,
+                            rtol=1e-3)
+
+    def test_projects_in_single_precision(self):
+        self.assertEqual(np.float32, self.transformed.dtype)
+        self.assertEqual((500, 5), self.transformed.shape)
+
+    def test_projection_reproduces_transformed_data(self):
+        npt.assert_allclose(reduction.transform(self.projection, DATA),
+                            self.transformed, rtol=1e-5, atol=1e-3)
+
+    def test_matches_pca_up_to_sign(self):
+        expected = self.expected.transform(DATA)
+        signs = np.sign((expected * self.transformed).sum(axis=0))
+        npt.assert_allclose(self.transformed * signs, expected, atol=1e-2,
+                            rtol=1e-3)
+
+    def test_limits_components_to_data_shape(self):
+        projection, transformed = reduction.randomized_pca(DATA[:4], 10)
+        self.assertEqual((4, 4), transformed.shape)
+        self.assertEqual((4, 60), projection.components.shape)
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from embedding import transform
+
+
+RANDOM_STATE = np.random.RandomState(0)
+LABELS = np.repeat([0, 1, 2], 40)
+CENTERS = np.array([[0., 0., 0.], [20., 0., 0.], [0., 20., 0.]])
+REFERENCE = CENTERS[LABELS] + RANDOM_STATE.randn(120, 3)
+REFERENCE_EMBEDDING = CENTERS[LABELS][:, :2] + RANDOM_STATE.randn(120, 2)
+DATA = CENTERS + RANDOM_STATE.randn(3, 3) * .1
+
+
+class ReferenceAffinitiesTest(unittest.TestCase):
+    def test_rows_are_distributions_over_reference(self):
+        P = transform.reference_affinities(REFERENCE, DATA, perplexity=5.)
+        self.assertEqual((3, 120), P.shape)
+        npt.assert_allclose(np.asarray(P.sum(axis=1)).ravel(), 1.)
+        self.assertEqual(16, P.getnnz(axis=1)[0])
+
+    def test_links_only_similar_reference_observations(self):
+        P = transform.reference_affinities(REFERENCE, DATA, perplexity=5.)
+        for row, label in enumerate(range(3)):
+            neighbors = P[row].indices
+            npt.assert_equal(label, LABELS[neighbors])
+
+
+class PlaceTest(unittest.TestCase):
+    def test_interpolates_position_within_cluster(self):
+        embedding, _ = transform.place(REFERENCE, REFERENCE_EMBEDDING, DATA)
+        distances = np.linalg.norm(embedding - CENTERS[:, :2], axis=1)
+        self.assertTrue(np.all(distances < 2.))
+
+    def test_optimization_keeps_points_within_cluster(self):
+        embedding, _ = transform.place(REFERENCE, REFERENCE_EMBEDDING, DATA,
+                                       n_iter=50)
+        self.assertTrue(np.all(np.isfinite(embedding)))
+        distances = np.linalg.norm(embedding - CENTERS[:, :2], axis=1)
+        self.assertTrue(np.all(distances < 3.))
+
+    def test_supports_other_metrics(self):
+        embedding, _ = transform.place(REFERENCE + 1., REFERENCE_EMBEDDING,
+                                       DATA + 1., metric='cosine')
+        self.assertEqual((3, 2), embedding.shape)
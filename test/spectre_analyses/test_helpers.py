@@ -0,0 +1,180 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import json
+import os
+import shutil
+import tempfile
+
+from embedding.optimizer import Progress
+from spectre_analyses import helpers
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class ProgressReporterTest(unittest.TestCase):
+    def setUp(self):
+        self.task = MagicMock()
+        self.clock = Clock()
+        self.report = helpers.ProgressReporter(
+            self.task, 'RUNNING', n_iter=1000, interval=5., clock=self.clock)
+
+    def test_publishes_progress_as_meta(self):
+        self.clock.now = 10.
+        self.report(Progress(250, 2.5, .01))
+        self.task.update_state.assert_called_once_with(state='RUNNING', meta={
+            'iteration': 250, 'n_iter': 1000, 'error': 2.5,
+            'grad_norm': .01, 'elapsed': 10., 'eta': 30.})
+
+    def test_limits_rate_of_updates(self):
+        self.report(Progress(50, 3., .1))
+        self.clock.now = 4.
+        self.report(Progress(100, 3., .1))
+        self.assertEqual(1, self.task.update_state.call_count)
+        self.clock.now = 5.
+        self.report(Progress(150, 3., .1))
+        self.assertEqual(2, self.task.update_state.call_count)
+
+    def test_always_publishes_last_iteration(self):
+        self.report(Progress(950, 3., .1))
+        self.report(Progress(1000, 3., .1))
+        self.assertEqual(2, self.task.update_state.call_count)
+        meta = self.task.update_state.call_args[1]['meta']
+        self.assertEqual(0., meta['eta'])
+
+
+class CleanupTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for name in ('result.npy', 'checkpoint.npz'):
+            open(os.path.join(self.root, name), 'w').close()
+
+    def test_removes_analysis_directory(self):
+        helpers.cleanup(self.root)
+        self.assertFalse(os.path.exists(self.root))
+
+    def test_keeps_preserved_files(self):
+        helpers.cleanup(self.root, preserved=('checkpoint.npz',))
+        self.assertEqual(['checkpoint.npz'], os.listdir(self.root))
+
+
+class OpenAnalysisTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        paths = {status: os.path.join(self.root, status)
+                 for status in ('processing', 'done', 'failed')}
+        patcher = patch.dict(helpers.STATUS_PATHS, paths)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.interrupted = os.path.join(paths['processing'], 'ds', 'tSNE',
+                                        'name')
+        os.makedirs(self.interrupted)
+
+    def open(self, key=None):
+        with helpers.open_analysis('ds', 'tSNE', 'name',
+                                   preserved=('checkpoint.npz',),
+                                   checkpoint_key=key) as path:
+            return path
+
+    def test_rejects_analysis_with_the_same_name(self):
+        with self.assertRaises(FileExistsError):
+            self.open('key')
+
+    def test_reuses_directory_with_checkpoint_of_the_same_analysis(self):
+        with patch.object(helpers.artifacts, 'checkpoint_key',
+                          return_value='key'):
+            self.assertEqual(self.interrupted, self.open('key'))
+
+    def test_rejects_directory_with_checkpoint_of_other_analysis(self):
+        with patch.object(helpers.artifacts, 'checkpoint_key',
+                          return_value='other'), \
+                self.assertRaises(FileExistsError):
+            self.open('key')
+
+    def test_marks_directory_with_checkpoint_key(self):
+        with helpers.open_analysis('ds', 'tSNE', 'other',
+                                   checkpoint_key='key') as path:
+            self.assertEqual('key', helpers.artifacts.checkpoint_key(path))
+
+    def test_reuses_directory_interrupted_before_any_checkpoint(self):
+        helpers.artifacts.save_checkpoint_key(self.interrupted, 'key')
+        self.assertEqual(self.interrupted, self.open('key'))
+
+
+class PeriodicCheckpointTest(unittest.TestCase):
+    def test_stores_state_once_per_interval(self):
+        clock = Clock()
+        checkpoint = helpers.PeriodicCheckpoint('/root', 'key', interval=60.,
+                                                clock=clock)
+        with patch.object(helpers.artifacts, 'save_checkpoint') as save:
+            checkpoint('first')
+            clock.now = 60.
+            checkpoint('second')
+            clock.now = 90.
+            checkpoint('third')
+        save.assert_called_once_with('/root', 'second', 'key')
+
+
+class StageProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.notify = MagicMock()
+        self.samples = [helpers.Sample(0., 0., 0, 0),
+                        helpers.Sample(2., 1.5, 100, 10),
+                        helpers.Sample(2., 1.5, 100, 10),
+                        helpers.Sample(5., 4.5, 100, 30)]
+        self.reset_peak = MagicMock()
+        self.profile = helpers.StageProfile(
+            self.notify, sample=MagicMock(side_effect=self.samples),
+            peak=MagicMock(side_effect=[1024, 2048]),
+            reset_peak=self.reset_peak)
+
+    def test_records_resources_used_by_each_stage(self):
+        self.profile('LOADING DATA')
+        self.profile('RUNNING T-SNE')
+        stages = self.profile.finish()
+        self.assertEqual([{
+            'stage': 'LOADING DATA', 'wall_seconds': 2., 'cpu_seconds': 1.5,
+            'peak_rss_bytes': 1024, 'read_bytes': 100, 'written_bytes': 10,
+        }, {
+            'stage': 'RUNNING T-SNE', 'wall_seconds': 3., 'cpu_seconds': 3.,
+            'peak_rss_bytes': 2048, 'read_bytes': 0, 'written_bytes': 20,
+        }], stages)
+        self.assertEqual(2, self.reset_peak.call_count)
+
+    def test_publishes_finished_stages_with_status(self):
+        self.profile('LOADING DATA')
+        self.notify.assert_called_once_with('LOADING DATA',
+                                            meta={'profile': []})
+        self.profile('RUNNING T-SNE')
+        meta = self.notify.call_args[1]['meta']
+        self.assertEqual(['LOADING DATA'],
+                         [stage['stage'] for stage in meta['profile']])
+
+    def test_leaves_unknown_io_counters_out(self):
+        profile = helpers.StageProfile(
+            self.notify, peak=MagicMock(return_value=0),
+            reset_peak=self.reset_peak, sample=MagicMock(side_effect=[
+                helpers.Sample(0., 0., None, None),
+                helpers.Sample(1., 1., None, None)]))
+        profile('LOADING DATA')
+        stage, = profile.finish()
+        self.assertIsNone(stage['read_bytes'])
+        self.assertIsNone(stage['written_bytes'])
+
+    def test_stores_profile_in_analysis_directory(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.profile('LOADING DATA')
+        self.profile.finish()
+        self.profile.save(root)
+        with open(os.path.join(root, helpers.PROFILE)) as file:
+            stored = json.load(file)
+        self.assertEqual(self.profile.stages, stored)
@@ -22,6 +22,7 @@ import os
 from spdata.common import DATA_ROOT
 
 import api
+import discover.datasets
 
 
 DUMMY_DATASETS = [
@@ -45,15 +46,31 @@ dummy_dataset_recognition = MagicMock(side_effect=lambda name: name in DUMMY_DAT
 
 
 class TestSchema(unittest.TestCase):
-    @patch.object(api, 'unchanged_file')
-    def test_passes_json_without_replacements(self, reader):
-        schema, _ = api.schema("inputs", "tSNE")
-        self.assertIs(schema, reader.return_value)
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    def test_passes_json_without_replacements(self):
+        response = self.client.get('/schema/inputs/tSNE/')
+        document = api.SCHEMAS[os.path.join('.', 'schema', 'inputs', 'tSNE.json')]
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(document.content, response.get_data(as_text=True))
+
+    def test_returns_not_modified_for_known_etag(self):
+        etag = self.client.get('/schema/inputs/tSNE/').headers['ETag']
+        response = self.client.get('/schema/inputs/tSNE/',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.get_data())
+
+    def test_returns_not_found_for_unknown_task(self):
+        response = self.client.get('/schema/inputs/unknown/')
+        self.assertEqual(404, response.status_code)
 
 
 class TestSchemaIntegration(unittest.TestCase):
     def test_return_readable_json(self):
-        schema, _ = api.schema("inputs", "tSNE")
+        schema = api.app.test_client().get('/schema/inputs/tSNE/')
+        schema = schema.get_data(as_text=True)
         try:
             json.loads(schema)
         except ValueError as ex:
@@ -61,17 +78,38 @@ class TestSchemaIntegration(unittest.TestCase):
 
 
 class TestLayout(unittest.TestCase):
-    @patch.object(api, 'file_with_datasets_substitution')
-    def test_enumerates_available_datasets(self, reader):
-        layout, _ = api.layout("inputs", "tSNE")
-        self.assertIs(layout, reader.return_value)
+    def setUp(self):
+        self.client = api.app.test_client()
+        discover.datasets.DATASETS.invalidate()
+
+    @patch.object(api, 'with_datasets_substitution')
+    def test_enumerates_available_datasets(self, substitution):
+        substitution.return_value = api.Document('[]', 'some-etag')
+        response = self.client.get('/layout/inputs/tSNE/')
+        self.assertEqual('[]', response.get_data(as_text=True))
+        self.assertIn('some-etag', response.headers['ETag'])
+
+    @patch('discover.datasets.get_datasets')
+    def test_changes_etag_with_datasets(self, get_datasets):
+        get_datasets.return_value = [{"name": "a", "value": "a"}]
+        first = self.client.get('/layout/inputs/tSNE/').headers['ETag']
+        get_datasets.return_value = [{"name": "b", "value": "b"}]
+        discover.datasets.DATASETS.invalidate()
+        response = self.client.get('/layout/inputs/tSNE/',
+                                   headers={'If-None-Match': first})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(first, response.headers['ETag'])
 
 
 @patch('os.path.isdir', new=dummy_dataset_recognition)
 @patch('os.listdir', new=dummy_store_listing)
 class TestLayoutIntegration(unittest.TestCase):
+    def setUp(self):
+        discover.datasets.DATASETS.invalidate()
+
     def test_returns_readable_json_with_datasets(self):
-        layout, _ = api.layout("inputs", "tSNE")
+        layout = api.app.test_client().get('/layout/inputs/tSNE/')
+        layout = layout.get_data(as_text=True)
         try:
             structured = json.loads(layout)
         except ValueError as ex:
@@ -84,3 +122,49 @@ class TestLayoutIntegration(unittest.TestCase):
                 break
         else:
             self.fail("DatasetName unspecified in layout")
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    def test_exposes_latency_of_requests_by_route(self):
+        self.client.get('/schema/inputs/tSNE/')
+        response = self.client.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('text/plain', response.headers['Content-Type'])
+        self.assertIn('tsne_http_request_duration_seconds_count{'
+                      'route="/schema/<string:endpoint>/<string:task_name>/",'
+                      'method="GET",status="200"}',
+                      response.get_data(as_text=True))
+
+    def test_counts_request_out_of_flight_when_finished(self):
+        self.client.get('/schema/inputs/tSNE/')
+        exposed = self.client.get('/metrics').get_data(as_text=True)
+        # the request exposing metrics is the only one in flight
+        self.assertIn('\ntsne_http_requests_in_flight 1.0\n', exposed)
+
+    def test_exposes_datasets_cache_counters(self):
+        exposed = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('tsne_datasets_cache_hits_total', exposed)
+        self.assertIn('tsne_datasets_cache_misses_total', exposed)
+
+    @patch('aspect.export', new=MagicMock(return_value={'columns': []}))
+    def test_records_size_of_aspect_payloads(self):
+        self.client.post('/results/tSNE/some-id/export/')
+        exposed = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('tsne_aspect_payload_bytes_count{aspect="export"}',
+                      exposed)
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    @patch('jobs.status', new=MagicMock(return_value={
+        'id': 'some-id', 'state': 'SUCCESS', 'result': {'dataset': 'x'}}))
+    def test_reports_status_of_job(self):
+        response = self.client.get('/jobs/some-id/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('SUCCESS', json.loads(
+            response.get_data(as_text=True))['state'])
@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+import spdata.types as ty
+
+import artifacts
+from embedding.optimizer import State
+from embedding.reduction import Projection
+
+
+COORDINATES = ty.Coordinates(x=[1, 2], y=[3, 4], z=[0, 0])
+EMBEDDING = np.array([[.5, 1.5], [2.5, 3.5]])
+
+
+class ArtifactsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class EmbeddingTest(ArtifactsTestCase):
+    def test_loads_saved_embedding_memory_mapped(self):
+        artifacts.save_embedding(self.root, EMBEDDING)
+        loaded = artifacts.load_embedding(self.root)
+        self.assertIsInstance(loaded, np.memmap)
+        npt.assert_equal(loaded, EMBEDDING)
+
+    def test_leaves_no_partial_embedding(self):
+        def interrupted(path, _):
+            with open(path, 'wb') as file:
+                file.write(b'\x93NUMPY')
+            raise RuntimeError('worker died')
+
+        with patch.object(artifacts.np, 'save', side_effect=interrupted), \
+                self.assertRaises(RuntimeError):
+            artifacts.save_embedding(self.root, EMBEDDING)
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_falls_back_to_pickled_embedding(self):
+        legacy_path = os.path.join(self.root, artifacts.LEGACY_EMBEDDING)
+        artifacts.joblib.dump(EMBEDDING, legacy_path)
+        npt.assert_equal(artifacts.load_embedding(self.root), EMBEDDING)
+
+
+class MetadataTest(ArtifactsTestCase):
+    def test_returns_none_when_not_stored(self):
+        self.assertIsNone(artifacts.load_metadata(self.root))
+
+    def test_preserves_coordinates_and_labels(self):
+        artifacts.save_metadata(self.root, COORDINATES, [7, 8])
+        metadata = artifacts.load_metadata(self.root)
+        npt.assert_equal(metadata.coordinates.x, COORDINATES.x)
+        npt.assert_equal(metadata.coordinates.y, COORDINATES.y)
+        npt.assert_equal(metadata.coordinates.z, COORDINATES.z)
+        npt.assert_equal(metadata.labels, [7, 8])
+
+    def test_preserves_missing_labels(self):
+        artifacts.save_metadata(self.root, COORDINATES, None)
+        self.assertIsNone(artifacts.load_metadata(self.root).labels)
+
+    def test_preserves_fingerprint_of_spectra(self):
+        artifacts.save_metadata(self.root, COORDINATES, None, 'abc')
+        self.assertEqual('abc', artifacts.load_fingerprint(self.root))
+
+    def test_returns_no_fingerprint_when_not_stored(self):
+        self.assertIsNone(artifacts.load_fingerprint(self.root))
+        artifacts.save_metadata(self.root, COORDINATES)
+        self.assertIsNone(artifacts.load_fingerprint(self.root))
+
+
+PROJECTION = Projection(mean=np.array([1., 2., 3.]),
+                        components=np.array([[1., 0., 0.], [0., 1., 0.]]),
+                        explained_variance=np.array([2., 1.]),
+                        explained_variance_ratio=np.array([.5, .25]))
+
+
+class ProjectionTest(ArtifactsTestCase):
+    def test_loads_saved_projection(self):
+        artifacts.save_projection(self.root, PROJECTION)
+        loaded = artifacts.load_projection(self.root)
+        for expected, actual in zip(PROJECTION, loaded):
+            npt.assert_equal(expected, actual)
+
+    def test_returns_none_without_projection(self):
+        self.assertIsNone(artifacts.load_projection(self.root))
+
+
+class FeaturesTest(ArtifactsTestCase):
+    def test_loads_saved_features(self):
+        artifacts.save_features(self.root, EMBEDDING)
+        npt.assert_equal(EMBEDDING, artifacts.load_features(self.root))
+
+    def test_returns_none_without_features(self):
+        self.assertIsNone(artifacts.load_features(self.root))
+
+
+CHECKPOINT = State(embedding=EMBEDDING, update=EMBEDDING / 2,
+                   gains=np.ones((2, 2)), iteration=50, best_error=1.5,
+                   best_iteration=49)
+
+
+class CheckpointTest(ArtifactsTestCase):
+    def test_loads_saved_checkpoint(self):
+        artifacts.save_checkpoint(self.root, CHECKPOINT, 'key')
+        loaded = artifacts.load_checkpoint(self.root, 'key')
+        for expected, actual in zip(CHECKPOINT, loaded):
+            npt.assert_equal(expected, actual)
+
+    def test_ignores_checkpoint_of_other_optimization(self):
+        artifacts.save_checkpoint(self.root, CHECKPOINT, 'key')
+        self.assertIsNone(artifacts.load_checkpoint(self.root, 'other'))
+
+    def test_ignores_damaged_checkpoint(self):
+        with open(os.path.join(self.root, artifacts.CHECKPOINT), 'wb') as f:
+            f.write(b'PK')
+        self.assertIsNone(artifacts.load_checkpoint(self.root, 'key'))
+
+    def test_reads_key_of_checkpoint(self):
+        self.assertIsNone(artifacts.checkpoint_key(self.root))
+        artifacts.save_checkpoint(self.root, CHECKPOINT, 'key')
+        self.assertEqual('key', artifacts.checkpoint_key(self.root))
+
+    def test_reads_key_marked_before_any_checkpoint(self):
+        artifacts.save_checkpoint_key(self.root, 'key')
+        self.assertEqual('key', artifacts.checkpoint_key(self.root))
+
+    def test_removes_checkpoint(self):
+        artifacts.save_checkpoint_key(self.root, 'key')
+        artifacts.save_checkpoint(self.root, CHECKPOINT, 'key')
+        artifacts.remove_checkpoint(self.root)
+        artifacts.remove_checkpoint(self.root)
+        self.assertIsNone(artifacts.load_checkpoint(self.root, 'key'))
+        self.assertIsNone(artifacts.checkpoint_key(self.root))
@@ -1,7 +1,11 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, mock_open, patch
 
 from io import StringIO
+import os
+import shutil
+import tempfile
 
 import numpy as np
 import numpy.testing as npt
@@ -10,6 +14,7 @@ import spdata.reader as rd
 import spdata.common as cmn
 
 import data_utils
+from embedding import cache
 
 
 COORDINATES = ty.Coordinates(x=[1], y=[2], z=[3])
@@ -58,19 +63,222 @@ class DumpTxtTest(unittest.TestCase):
         self.assertSequenceEqual(dataset.coordinates.z, DATASET.coordinates.z)
         self.assertEqual(dataset.labels, DATASET.labels)
 
+    def test_writes_the_same_content_regardless_of_chunk_size(self):
+        spectra = np.array([[.1, 1e16], [1e-5, 2.], [3., -4.5]])
+        coordinates = ty.Coordinates(x=[1, 2, 3], y=[4, 5, 6], z=[0, 0, 0])
+        dataset = ty.Dataset(spectra, coordinates, [6, 7], None)
+        whole, chunked = StringIO(), StringIO()
+        data_utils.dump_txt(whole, dataset)
+        data_utils.dump_txt(chunked, dataset, chunk_rows=2)
+        self.assertEqual(whole.getvalue(), chunked.getvalue())
+        self.assertEqual(whole.getvalue(), "\n6 7\n1 4 0 0\n0.1 1e+16\n"
+                                           "2 5 0 0\n1e-05 2.0\n"
+                                           "3 6 0 0\n3.0 -4.5\n")
+
+    def test_limits_precision_on_demand(self):
+        spectra = np.array([[1 / 3, 2 / 3]])
+        dataset = ty.Dataset(spectra, COORDINATES, [6, 7], [8])
+        sink = StringIO()
+        data_utils.dump_txt(sink, dataset, precision=3)
+        self.assertIn("0.333 0.667\n", sink.getvalue())
+
 
 @patch('os.makedirs', new=MagicMock())
-@patch('shutil.copy')
+@patch.object(data_utils, 'publish_file')
 class PushToRepoTest(unittest.TestCase):
-    def test_throws_on_unsupported_format(self, copy_mock):
+    def test_throws_on_unsupported_format(self, publish_mock):
         with self.assertRaises(NotImplementedError):
             data_utils.push_to_repo('blah.imzml', 'whatever')
 
-    def test_copies_the_data_to_location_in_store(self, copy_mock: MagicMock):
+    def test_copies_the_data_to_location_in_store(self, publish_mock: MagicMock):
         data_utils.push_to_repo('blah.txt', 'whatever')
-        src, dst = copy_mock.call_args[0]
+        src, dst, _ = publish_mock.call_args[0]
         self.assertEqual(src, 'blah.txt')
         self.assertIn(cmn.DATA_ROOT, dst)
         self.assertIn('whatever', dst)
         self.assertIn('data.txt', dst)
         self.assertIn('_data', dst)
+
+    def test_publishes_spectra_with_their_metadata(self, publish_mock: MagicMock):
+        with patch('os.path.exists', return_value=True):
+            data_utils.push_to_repo(os.path.join('root', 'result.npy'), 'whatever')
+        published = [call[0][:2] for call in publish_mock.call_args_list]
+        self.assertEqual(2, len(published))
+        (metadata_src, metadata_dst), (spectra_src, spectra_dst) = published
+        self.assertEqual(os.path.join('root', 'metadata.npz'), metadata_src)
+        self.assertTrue(metadata_dst.endswith('metadata.npz'))
+        self.assertEqual(os.path.join('root', 'result.npy'), spectra_src)
+        self.assertTrue(spectra_dst.endswith('spectra.npy'))
+        self.assertIn('binary_data', spectra_dst)
+
+
+class PublishFileTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src.txt')
+        self.dst = os.path.join(self.root, 'dst.txt')
+        with open(self.src, 'w') as src:
+            src.write('content')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read(self, path):
+        with open(path) as file:
+            return file.read()
+
+    def test_links_file_on_the_same_filesystem(self):
+        data_utils.publish_file(self.src, self.dst)
+        self.assertTrue(os.path.samefile(self.src, self.dst))
+
+    def test_copies_file_if_linking_fails(self):
+        with patch('os.link', side_effect=OSError), \
+                patch.object(data_utils, '_reflink', side_effect=OSError):
+            data_utils.publish_file(self.src, self.dst)
+        self.assertFalse(os.path.samefile(self.src, self.dst))
+        self.assertEqual('content', self.read(self.dst))
+        self.assertFalse(os.path.exists(self.dst + '.tmp'))
+
+    def test_moves_file_on_demand(self):
+        data_utils.publish_file(self.src, self.dst, move=True)
+        self.assertFalse(os.path.exists(self.src))
+        self.assertEqual('content', self.read(self.dst))
+
+
+class LoadDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = os.path.join(self.root, 'cache')
+        patcher = patch.object(data_utils, 'DATASET_CACHE', new=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_loads_binary_dataset_if_present(self):
+        binary_root = os.path.join(self.root, 'dataset', 'binary_data')
+        os.makedirs(binary_root)
+        np.save(os.path.join(binary_root, 'spectra.npy'), SPECTRA)
+        np.savez(os.path.join(binary_root, 'metadata.npz'),
+                 x=[1], y=[2], z=[3])
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            dataset = data_utils.load_dataset('dataset')
+        npt.assert_equal(dataset.spectra, SPECTRA)
+        npt.assert_equal(dataset.coordinates.x, [1])
+        npt.assert_equal(dataset.mz, [0, 1])
+        self.assertIsNone(dataset.labels)
+
+    def test_falls_back_to_text_dataset(self):
+        with patch.object(cmn, 'DATA_ROOT', new=self.root), \
+                patch.object(rd, 'load_dataset') as load_text:
+            dataset = data_utils.load_dataset('dataset')
+        self.assertIs(load_text.return_value, dataset)
+
+    def write_text(self, dataset):
+        text_root = os.path.join(self.root, 'dataset', 'text_data')
+        os.makedirs(text_root, exist_ok=True)
+        path = os.path.join(text_root, 'data.txt')
+        with open(path, 'w') as file:
+            data_utils.dump_txt(file, dataset)
+        return path
+
+    def test_converts_text_dataset_to_float32_in_low_memory_mode(self):
+        spectra = np.arange(12, dtype=float).reshape(3, 4) / 4
+        coordinates = ty.Coordinates(x=[1, 2, 3], y=[4, 5, 6], z=[0, 0, 0])
+        self.write_text(ty.Dataset(spectra, coordinates, [1, 2, 3, 4],
+                                   [7, 8, 9]))
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            dataset = data_utils.load_dataset('dataset', low_memory=True)
+        self.assertEqual(np.float32, dataset.spectra.dtype)
+        self.assertFalse(dataset.spectra.flags.owndata)
+        npt.assert_equal(spectra, dataset.spectra)
+        npt.assert_equal([1, 2, 3], dataset.coordinates.x)
+        npt.assert_equal([7, 8, 9], dataset.labels)
+        npt.assert_equal([1, 2, 3, 4], dataset.mz)
+
+    def test_float32_copy_shares_fingerprint_with_dataset(self):
+        spectra = np.random.RandomState(0).rand(3, 4) / 3
+        coordinates = ty.Coordinates(x=[1, 2, 3], y=[4, 5, 6], z=[0, 0, 0])
+        self.write_text(ty.Dataset(spectra, coordinates, [1, 2, 3, 4],
+                                   [7, 8, 9]))
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            low_memory = data_utils.load_dataset('dataset', low_memory=True)
+            dataset = data_utils.load_dataset('dataset')
+        # keys of cached similarities and checkpoints derive from it
+        self.assertEqual(cache.fingerprint(dataset.spectra),
+                         cache.fingerprint(low_memory.spectra))
+
+    def test_converts_text_dataset_once(self):
+        self.write_text(DATASET)
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            data_utils.load_dataset('dataset', low_memory=True)
+            with patch.object(data_utils, 'convert_text') as convert:
+                data_utils.load_dataset('dataset', low_memory=True)
+        convert.assert_not_called()
+
+    def test_reconverts_modified_text_dataset(self):
+        path = self.write_text(DATASET)
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            data_utils.load_dataset('dataset', low_memory=True)
+            future = os.path.getmtime(path) + 10
+            os.utime(path, (future, future))
+            with patch.object(data_utils, 'convert_text') as convert:
+                data_utils.load_dataset('dataset', low_memory=True)
+        convert.assert_called_once()
+
+    def test_parses_text_dataset_once_into_shared_cache(self):
+        spectra = np.array([[.1, 1e16], [1e-5, 2.], [3., -4.5]])
+        coordinates = ty.Coordinates(x=[1, 2, 3], y=[4, 5, 6], z=[0, 0, 0])
+        self.write_text(ty.Dataset(spectra, coordinates, [6, 7], [1, 1, 2]))
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            data_utils.load_dataset('dataset')
+            with patch.object(data_utils, 'convert_text') as convert:
+                dataset = data_utils.load_dataset('dataset')
+        convert.assert_not_called()
+        self.assertFalse(dataset.spectra.flags.owndata)
+        npt.assert_equal(spectra, dataset.spectra)
+        npt.assert_equal([4, 5, 6], dataset.coordinates.y)
+        npt.assert_equal([1, 1, 2], dataset.labels)
+        npt.assert_equal([6, 7], dataset.mz)
+
+    def test_replaces_cached_dataset_modified_since(self):
+        path = self.write_text(DATASET)
+        with patch.object(cmn, 'DATA_ROOT', new=self.root):
+            data_utils.load_dataset('dataset')
+            self.write_text(ty.Dataset([[1, 2]], COORDINATES, [6, 7], [8]))
+            future = os.path.getmtime(path) + 10
+            os.utime(path, (future, future))
+            dataset = data_utils.load_dataset('dataset')
+        npt.assert_equal([[1, 2]], dataset.spectra)
+        entries = os.listdir(self.cache)
+        self.assertEqual(1, len(entries))
+        self.assertEqual(1, len(os.listdir(
+            os.path.join(self.cache, entries[0]))))
+
+    def test_parses_text_concurrently_in_threads(self):
+        spectra = np.random.RandomState(0).rand(200, 30)
+        coordinates = ty.Coordinates(x=list(range(200)), y=[0] * 200,
+                                     z=[0] * 200)
+        path = self.write_text(ty.Dataset(spectra, coordinates,
+                                          list(range(30)), [0] * 200))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            directories = list(executor.map(
+                lambda _: data_utils.parsed_text(path), range(8)))
+        self.assertEqual(1, len(set(directories)))
+        npt.assert_equal(spectra, data_utils.load_binary(
+            directories[0]).spectra)
+        entry_root = os.path.dirname(directories[0])
+        self.assertEqual([os.path.basename(directories[0])],
+                         os.listdir(entry_root))
+        self.assertEqual(['metadata.npz', 'spectra.npy'],
+                         sorted(os.listdir(directories[0])))
+
+    def test_parses_text_directly_if_cache_is_not_writable(self):
+        self.write_text(DATASET)
+        with patch.object(cmn, 'DATA_ROOT', new=self.root), \
+                patch.object(data_utils, 'parsed_text',
+                             side_effect=PermissionError), \
+                patch.object(rd, 'load_dataset') as load_text:
+            dataset = data_utils.load_dataset('dataset')
+        self.assertIs(load_text.return_value, dataset)
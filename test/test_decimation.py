@@ -0,0 +1,69 @@
+import unittest
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+
+import decimation
+
+
+EMBEDDING = np.random.RandomState(0).randn(2000, 2)
+VIEWPORT = [(-1., 0.), (0., 2.)]
+
+
+def inside(points, viewport):
+    bounds = np.array(viewport)
+    return np.all((points >= bounds[:, 0]) & (points <= bounds[:, 1]), axis=1)
+
+
+class GridIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = decimation.build_index(EMBEDDING)
+
+    def test_returns_everything_without_limits(self):
+        selected, total = self.index.query(EMBEDDING)
+        npt.assert_equal(selected, np.arange(EMBEDDING.shape[0]))
+        self.assertEqual(EMBEDDING.shape[0], total)
+
+    def test_respects_point_budget(self):
+        selected, _ = self.index.query(EMBEDDING, budget=100)
+        self.assertEqual(100, selected.size)
+        self.assertEqual(100, np.unique(selected).size)
+
+    def test_returns_only_points_in_viewport(self):
+        selected, total = self.index.query(EMBEDDING, viewport=VIEWPORT)
+        npt.assert_equal(selected, np.flatnonzero(inside(EMBEDDING, VIEWPORT)))
+        self.assertGreaterEqual(total, selected.size)
+
+    def test_sample_in_viewport_is_prefix_of_priority_order(self):
+        sample, _ = self.index.query(EMBEDDING, budget=20, viewport=VIEWPORT)
+        larger, _ = self.index.query(EMBEDDING, budget=40, viewport=VIEWPORT)
+        self.assertTrue(set(sample) <= set(larger))
+        self.assertTrue(np.all(inside(EMBEDDING[larger], VIEWPORT)))
+
+    def test_handles_unbounded_and_empty_viewport(self):
+        unbounded = [(-np.inf, 0.), (-np.inf, np.inf)]
+        selected, _ = self.index.query(EMBEDDING, viewport=unbounded)
+        npt.assert_equal(selected, np.flatnonzero(EMBEDDING[:, 0] <= 0))
+        selected, _ = self.index.query(EMBEDDING, budget=5,
+                                       viewport=[(10., 11.), (10., 11.)])
+        self.assertEqual(0, selected.size)
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_returns_none_if_not_stored(self):
+        self.assertIsNone(decimation.load_index(self.root))
+
+    def test_loads_the_same_index(self):
+        built = decimation.ensure_index(self.root, EMBEDDING)
+        loaded = decimation.ensure_index(self.root, EMBEDDING)
+        npt.assert_equal(built.order, loaded.order)
+        npt.assert_equal(built.keys, loaded.keys)
+        npt.assert_equal(built.lower, loaded.lower)
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import jobs
+
+
+def celery_with(state: str, info=None) -> MagicMock:
+    app = MagicMock()
+    app.AsyncResult.return_value.state = state
+    app.AsyncResult.return_value.result = info
+    app.AsyncResult.return_value.info = info
+    return app
+
+
+class JobIdTest(unittest.TestCase):
+    def test_is_the_same_for_the_same_arguments(self):
+        self.assertEqual(jobs.job_id('task', first=1, second='a'),
+                         jobs.job_id('task', second='a', first=1))
+
+    def test_differs_between_arguments(self):
+        self.assertNotEqual(jobs.job_id('task', first=1),
+                            jobs.job_id('task', first=2))
+
+    def test_differs_between_tasks(self):
+        self.assertNotEqual(jobs.job_id('task', first=1),
+                            jobs.job_id('other', first=1))
+
+
+class SubmitTest(unittest.TestCase):
+    def submitted(self, state: str) -> MagicMock:
+        app = celery_with(state)
+        with patch.object(jobs, '_celery', new=MagicMock(return_value=app)):
+            some_id = jobs.submit('task', first=1)
+        self.assertEqual(jobs.job_id('task', first=1), some_id)
+        return app.send_task
+
+    def test_sends_unknown_job_with_its_id(self):
+        send_task = self.submitted('PENDING')
+        send_task.assert_called_once_with(
+            'task', kwargs={'first': 1}, task_id=jobs.job_id('task', first=1),
+            queue=jobs.QUEUE)
+
+    def test_resubmits_failed_job(self):
+        self.submitted('FAILURE').assert_called_once()
+
+    def test_does_not_resubmit_running_job(self):
+        self.submitted('STARTED').assert_not_called()
+
+    def test_does_not_resubmit_finished_job(self):
+        self.submitted('SUCCESS').assert_not_called()
+
+
+class StatusTest(unittest.TestCase):
+    def status(self, state: str, info=None) -> dict:
+        app = celery_with(state, info)
+        with patch.object(jobs, '_celery', new=MagicMock(return_value=app)):
+            return jobs.status('some-id')
+
+    def test_reports_result_of_finished_job(self):
+        self.assertEqual({'id': 'some-id', 'state': 'SUCCESS',
+                          'result': {'dataset': 'x'}},
+                         self.status('SUCCESS', {'dataset': 'x'}))
+
+    def test_reports_error_of_failed_job(self):
+        state = self.status('FAILURE', ValueError('blah'))
+        self.assertEqual('blah', state['error'])
+
+    def test_reports_progress_of_running_job(self):
+        state = self.status('EXPORTING', {'profile': {}})
+        self.assertEqual({'profile': {}}, state['meta'])
+
+    def test_reports_state_of_pending_job_only(self):
+        self.assertEqual({'id': 'some-id', 'state': 'PENDING'},
+                         self.status('PENDING'))
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import MagicMock
+
+import metrics
+
+
+class CounterTest(unittest.TestCase):
+    def test_renders_counts_of_each_label_set(self):
+        counter = metrics.Counter('requests_total', 'Requests.', ('method',))
+        counter.inc(method='GET')
+        counter.inc(2, method='POST')
+        counter.inc(method='GET')
+        self.assertEqual('# HELP requests_total Requests.\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{method="GET"} 2.0\n'
+                         'requests_total{method="POST"} 2.0\n',
+                         counter.render())
+
+    def test_rejects_unexpected_labels(self):
+        counter = metrics.Counter('requests_total', 'Requests.', ('method',))
+        with self.assertRaises(ValueError):
+            counter.inc(route='/')
+
+    def test_escapes_label_values(self):
+        counter = metrics.Counter('requests_total', 'Requests.', ('route',))
+        counter.inc(route='a"b\\c\nd')
+        self.assertIn(r'{route="a\"b\\c\nd"}', counter.render())
+
+
+class GaugeTest(unittest.TestCase):
+    def test_goes_up_and_down(self):
+        gauge = metrics.Gauge('in_flight', 'Requests in flight.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertIn('\nin_flight 1.0\n', gauge.render())
+
+
+class FunctionCounterTest(unittest.TestCase):
+    def test_reads_value_on_collection(self):
+        source = MagicMock(return_value=3)
+        counter = metrics.FunctionCounter('hits_total', 'Hits.', source)
+        self.assertIn('\nhits_total 3.0\n', counter.render())
+        source.return_value = 5
+        self.assertIn('\nhits_total 5.0\n', counter.render())
+
+
+class HistogramTest(unittest.TestCase):
+    def test_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('latency_seconds', 'Latency.',
+                                      ('route',), buckets=(.1, 1.))
+        histogram.observe(.05, route='/')
+        histogram.observe(.5, route='/')
+        histogram.observe(5., route='/')
+        lines = histogram.render().splitlines()
+        self.assertEqual([
+            'latency_seconds_bucket{route="/",le="0.1"} 1.0',
+            'latency_seconds_bucket{route="/",le="1.0"} 2.0',
+            'latency_seconds_bucket{route="/",le="+Inf"} 3.0',
+            'latency_seconds_sum{route="/"} 5.55',
+            'latency_seconds_count{route="/"} 3.0',
+        ], lines[2:])
+        self.assertEqual('# TYPE latency_seconds histogram', lines[1])
+
+    def test_times_decorated_calls(self):
+        histogram = metrics.Histogram('duration_seconds', 'Duration.',
+                                      ('operation',))
+
+        @metrics.timed(histogram, operation='lookup')
+        def lookup(value):
+            return value
+
+        self.assertEqual(7, lookup(7))
+        self.assertIn('duration_seconds_count{operation="lookup"} 1.0',
+                      histogram.render())
+
+
+class RegistryTest(unittest.TestCase):
+    def test_renders_all_registered_metrics(self):
+        registry = metrics.Registry()
+        registry.register(metrics.Gauge('first', 'First.'))
+        registry.register(metrics.Gauge('second', 'Second.'))
+        rendered = registry.render()
+        self.assertIn('# TYPE first gauge', rendered)
+        self.assertIn('# TYPE second gauge', rendered)
@@ -1,5 +1,7 @@
 import unittest
+import base64
 import json
+import struct
 
 import numpy as np
 
@@ -90,3 +92,25 @@ class AsScatterPlotTest(unittest.TestCase):
     def test_selects_scatter3d_for_3d_data(self):
         plot = plt.as_scatter_plot(np.array([[1, 2, 3], [4, 5, 6]]))
         self.assertIsInstance(plot.data[0], plt.Scatter3d)
+
+
+class TypedArrayTest(unittest.TestCase):
+    def test_serializes_as_base64_float32(self):
+        plot = plt.as_scatter_plot(np.array([[1, 2], [3, 4]]), compact=True)
+        parsed = json.loads(plot.to_json())
+        x = parsed['data'][0]['x']
+        self.assertEqual('f4', x['dtype'])
+        decoded = np.frombuffer(base64.b64decode(x['bdata']), dtype='<f4')
+        np.testing.assert_equal(decoded, [1, 3])
+
+    def test_binary_form_references_aligned_buffers(self):
+        plot = plt.as_scatter_plot(np.array([[1, 2], [3, 4]]), compact=True)
+        serialized = plot.to_binary()
+        header_length, = struct.unpack('<I', serialized[:4])
+        self.assertEqual(0, header_length % 4)
+        header = json.loads(serialized[4:4 + header_length].decode())
+        buffers = serialized[4 + header_length:]
+        y = header['data'][0]['y']
+        decoded = np.frombuffer(buffers, dtype='<f4', count=y['length'],
+                                offset=y['offset'])
+        np.testing.assert_equal(decoded, [2, 4])
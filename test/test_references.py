@@ -0,0 +1,124 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+import spdata.common as cmn
+import spdata.types as ty
+
+import artifacts
+import data_utils
+from embedding.reduction import Projection
+import references
+
+
+def mock(return_value) -> MagicMock:
+    return MagicMock(return_value=return_value)
+
+
+SPECTRA = np.arange(12, dtype=float).reshape(4, 3)
+EMBEDDING = np.arange(8, dtype=float).reshape(4, 2)
+PROJECTION = Projection(mean=np.zeros(3), components=np.eye(2, 3),
+                        explained_variance=np.ones(2),
+                        explained_variance_ratio=np.ones(2) / 2)
+ROOT = '/data/done/dataset/tSNE/analysis'
+
+
+@patch.object(references.artifacts, 'load_embedding', new=mock(EMBEDDING))
+@patch.object(references.catalog, 'stored_parameters',
+              new=mock({'metric': 'cosine'}))
+class LoadReferenceTest(unittest.TestCase):
+    @patch.object(references.artifacts, 'load_projection', new=mock(None))
+    @patch.object(references.artifacts, 'load_features', new=mock(None))
+    def test_reads_spectra_of_analyzed_dataset(self):
+        with patch.object(references, 'load_dataset') as load_dataset:
+            load_dataset.return_value.spectra = SPECTRA
+            reference = references.load_reference(ROOT)
+        load_dataset.assert_called_once_with('dataset')
+        npt.assert_equal(SPECTRA, reference.features)
+        self.assertEqual('cosine', reference.metric)
+
+    @patch.object(references.artifacts, 'load_projection', new=mock(None))
+    @patch.object(references.artifacts, 'load_features', new=mock(None))
+    @patch.object(references.artifacts, 'load_fingerprint',
+                  new=mock('fingerprint of other spectra'))
+    def test_rejects_dataset_changed_since_analysis(self):
+        with patch.object(references, 'load_dataset') as load_dataset:
+            load_dataset.return_value.spectra = SPECTRA
+            with self.assertRaises(ValueError):
+                references.load_reference(ROOT)
+
+    @patch.object(references.artifacts, 'load_projection', new=mock(None))
+    @patch.object(references.artifacts, 'load_features', new=mock(None))
+    def test_accepts_dataset_analyzed_in_low_memory_mode(self):
+        spectra = SPECTRA / 3
+        stored = references.cache.fingerprint(spectra.astype(np.float32))
+        with patch.object(references, 'load_dataset') as load_dataset, \
+                patch.object(references.artifacts, 'load_fingerprint',
+                             new=mock(stored)):
+            load_dataset.return_value.spectra = spectra
+            reference = references.load_reference(ROOT)
+        npt.assert_equal(spectra, reference.features)
+
+    @patch.object(references.artifacts, 'load_projection',
+                  new=mock(PROJECTION))
+    @patch.object(references.artifacts, 'load_features',
+                  new=mock(SPECTRA[:, :2]))
+    def test_prefers_stored_reduced_spectra(self):
+        with patch.object(references, 'load_dataset') as load_dataset:
+            reference = references.load_reference(ROOT)
+        load_dataset.assert_not_called()
+        npt.assert_equal(SPECTRA[:, :2], reference.features)
+
+
+class PlaceTest(unittest.TestCase):
+    def test_projects_spectra_onto_stored_components(self):
+        reference = references.Reference(SPECTRA[:, :2], EMBEDDING,
+                                         PROJECTION, 'euclidean')
+        with patch.object(references.transform, 'place') as place:
+            place.return_value = EMBEDDING[:1], None
+            references.place(reference, SPECTRA[:1])
+        npt.assert_allclose(SPECTRA[:1, :2], place.call_args[0][2])
+
+    def test_rejects_spectra_of_different_length(self):
+        reference = references.Reference(SPECTRA, EMBEDDING, None,
+                                         'euclidean')
+        with self.assertRaises(ValueError):
+            references.place(reference, SPECTRA[:, :2])
+
+
+class LowMemoryReferenceTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for patcher in (
+                patch.object(cmn, 'DATA_ROOT', new=self.root),
+                patch.object(data_utils, 'DATASET_CACHE',
+                             new=os.path.join(self.root, 'cache'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        text_root = os.path.join(self.root, 'dataset', 'text_data')
+        os.makedirs(text_root)
+        spectra = np.random.RandomState(0).rand(20, 5) / 3
+        coordinates = ty.Coordinates(x=list(range(20)), y=[0] * 20,
+                                     z=[0] * 20)
+        with open(os.path.join(text_root, 'data.txt'), 'w') as file:
+            data_utils.dump_txt(file, ty.Dataset(
+                spectra, coordinates, list(range(5)), list(range(20))))
+
+    def test_transforms_against_reference_computed_in_low_memory_mode(self):
+        analysis_root = os.path.join(self.root, 'dataset', 'tSNE', 'name')
+        os.makedirs(analysis_root)
+        data = data_utils.load_dataset('dataset', low_memory=True)
+        artifacts.save_embedding(analysis_root,
+                                 np.random.RandomState(0).randn(20, 2))
+        artifacts.save_metadata(analysis_root, data.coordinates,
+                                fingerprint=references.cache.fingerprint(
+                                    data.spectra))
+        reference = references.load_reference(analysis_root)
+        placed = references.place(reference, np.asarray(data.spectra[:3]),
+                                  perplexity=3.)
+        self.assertEqual((3, 2), placed.shape)